@@ -1,6 +1,8 @@
 import streamlit as st
-import hashlib
 from database import get_user_by_email, add_password_user, update_user_password
+from auth import authenticate, hash_password, restore_session, start_session, write_session_cookie
+from passwords import HashingBusy
+from emotion_models import start_warmup
 from styles import get_dark_mode_css  # Your custom dark theme
 
 # --- Page Config & Global Styling ---
@@ -8,6 +10,9 @@ st.set_page_config(page_title="Login - Mental Health Companion", layout="centere
 st.markdown("""<style>[data-testid="stSidebar"] {display: none;}</style>""", unsafe_allow_html=True)
 st.markdown(get_dark_mode_css(), unsafe_allow_html=True)
 
+# Load the emotion models in the background while the user logs in (once per server process).
+start_warmup()
+
 # --- Hero Banner with Custom Title ---
 st.markdown("""
 <style>
@@ -35,13 +40,6 @@ st.markdown("""
 
 
 
-# --- Helper Functions ---
-def hash_password(password):
-    return hashlib.sha256(str.encode(password)).hexdigest()
-
-def verify_password(stored_hash, provided_password):
-    return stored_hash == hash_password(provided_password)
-
 # --- Session State ---
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
@@ -50,9 +48,10 @@ if "page" not in st.session_state:
 if "reset_email" not in st.session_state:
     st.session_state.reset_email = ""
 
-# --- Redirect if Already Logged In ---
-if st.session_state.logged_in:
+# --- Redirect if Already Logged In (here or through the session cookie) ---
+if restore_session(write_cookie=False):
     st.switch_page("pages/1_🏠_Homepage.py")
+write_session_cookie()  # clears a logged-out or expired session cookie
 
 # --- LOGIN PAGE ---
 if st.session_state.page == "login":
@@ -70,10 +69,13 @@ if st.session_state.page == "login":
             login_submit = st.form_submit_button("🔓 Login")
 
             if login_submit:
-                user_data = get_user_by_email(email)
-                if user_data and verify_password(user_data['hashed_password'], password):
-                    st.session_state.logged_in = True
-                    st.session_state.user_data = user_data
+                try:
+                    user_data = authenticate(email, password)
+                except HashingBusy:
+                    st.error("⏳ Too many people are logging in right now. Please try again in a moment.")
+                    st.stop()
+                if user_data:
+                    start_session(user_data)
                     st.success(f"✅ Welcome back, {user_data['username']}!")
                     st.session_state.page = "homepage"
                     st.rerun()
@@ -99,13 +101,13 @@ if st.session_state.page == "login":
                     st.error("⚠️ Please fill in all required fields.")
                 elif new_password != confirm_password:
                     st.error("⚠️ Passwords do not match.")
-                elif get_user_by_email(email):
-                    st.error("❌ An account with this email already exists.")
                 else:
                     hashed_pass = hash_password(new_password)
-                    success = add_password_user(email, username, hashed_pass)
-                    if success:
+                    new_user_id = add_password_user(email, username, hashed_pass)
+                    if new_user_id:
                         st.success("✅ Account created successfully! You can now log in.")
+                    elif new_user_id is None:
+                        st.error("❌ An account with this email already exists.")
                     else:
                         st.error("❌ Failed to create account. Try again.")
 
@@ -0,0 +1,145 @@
+"""
+Login sessions for the Streamlit pages.
+
+A successful login starts a server-side session (database.create_session) and
+stores its token in a browser cookie. Every page guard calls restore_session(),
+so a refresh or a new tab logs the user back in from the cookie; validated
+tokens are cached per process, so that usually costs no database query.
+
+Passwords are hashed and checked by passwords.HashingPool, configured by the
+optional [auth] table in st.secrets: password_scheme ("scrypt" or "argon2"),
+scrypt_n, scrypt_r, scrypt_p, argon2_time_cost, argon2_memory_cost,
+argon2_parallelism, hash_workers (default 2), hash_pool ("process" or
+"thread"), hash_max_pending and hash_timeout (seconds).
+
+Streamlit can read cookies (st.context.cookies) but not set them, so cookie
+changes are queued in session_state and written by a zero-height component on
+the next page that renders.
+
+Because the cookie is set from JavaScript it cannot be HttpOnly: a script
+injected into the page could read the token. To narrow that window sessions
+expire after session_max_age (7 days by default) and the token is rotated
+when a browser session restored from the cookie had to be checked against the
+database (see database.rotate_session), so a stolen token stops working soon
+after its owner returns. Serving the app behind a proxy that sets the cookie itself
+would remove the limitation.
+"""
+import json
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from database import (
+    create_session, resume_session, rotate_session, end_session, get_user_by_email, rehash_user_password,
+    _session_settings,
+)
+from passwords import DEFAULT_PARAMS, HashingPool
+
+SESSION_COOKIE = "companion_session"
+
+
+@st.cache_resource
+def get_password_hasher():
+    """The process-wide pool that hashes and verifies passwords."""
+    cfg = st.secrets.get("auth", {})
+    params = {key: type(default)(cfg.get(key, default)) for key, default in DEFAULT_PARAMS.items()}
+    params["scheme"] = cfg.get("password_scheme", DEFAULT_PARAMS["scheme"])
+    workers = int(cfg.get("hash_workers", 2))
+    return HashingPool(
+        params, workers=workers, kind=cfg.get("hash_pool", "process"),
+        max_pending=int(cfg.get("hash_max_pending", workers * 4)), timeout=float(cfg.get("hash_timeout", 10)),
+    )
+
+
+def hash_password(password):
+    return get_password_hasher().hash(password)
+
+
+def authenticate(email, password):
+    """
+    Returns the user record if `password` is right for `email`, else None.
+    A legacy or outdated hash is replaced with one at the current cost.
+    Raises passwords.HashingBusy when too many logins are already queued.
+    """
+    hasher = get_password_hasher()
+    user = get_user_by_email(email)
+    stored = user['hashed_password'] if user else hasher.dummy_hash
+    matches, new_hash = hasher.verify(stored, password)
+    if not (user and matches):
+        return None
+    if new_hash is not None:
+        rehash_user_password(user['id'], stored, new_hash)
+    return user
+
+
+def _cookie_token():
+    try:
+        return st.context.cookies.get(SESSION_COOKIE)
+    except AttributeError:  # Streamlit < 1.37 has no st.context.cookies
+        return None
+
+
+def _queue_cookie(value, max_age):
+    st.session_state["_session_cookie"] = (value, int(max_age))
+
+
+def write_session_cookie():
+    """Sends a queued cookie change to the browser. Call it on a page that keeps rendering, not right before switch_page."""
+    pending = st.session_state.pop("_session_cookie", None)
+    if pending is None:
+        return
+    value, max_age = pending
+    cookie = json.dumps(f"{SESSION_COOKIE}={value}; Path=/; Max-Age={max_age}; SameSite=Strict")
+    components.html(
+        f"<script>window.parent.document.cookie = {cookie}"
+        " + (window.parent.location.protocol === 'https:' ? '; Secure' : '');</script>",
+        height=0,
+    )
+
+
+def start_session(user_data):
+    """Logs `user_data` in for this browser session and, if the session could be stored, for later visits too."""
+    token, user = create_session(user_data['id'])
+    st.session_state.logged_in = True
+    st.session_state.user_data = user or {k: v for k, v in user_data.items() if k != 'hashed_password'}
+    if token:
+        st.session_state.session_token = token
+        _queue_cookie(token, _session_settings()["max_age"])
+
+
+def restore_session(write_cookie=True):
+    """
+    Page guard: True if the user is logged in, restoring the login from the
+    session cookie when this browser session hasn't logged in yet.
+    """
+    if not st.session_state.get("logged_in"):
+        token = _cookie_token()
+        # A token that was just logged out (or failed) stays in st.context.cookies
+        # until the next page load; don't look it up on every rerun.
+        if token and token != st.session_state.get("_ended_session"):
+            user = resume_session(token)
+            if user:
+                new_token = rotate_session(token) if _session_settings()["rotate"] else None
+                if new_token:
+                    token = new_token
+                    _queue_cookie(token, _session_settings()["max_age"])
+                st.session_state.logged_in = True
+                st.session_state.user_data = user
+                st.session_state.session_token = token
+            else:
+                st.session_state["_ended_session"] = token
+                _queue_cookie("", 0)
+    if write_cookie and st.session_state.get("logged_in"):
+        write_session_cookie()
+    return bool(st.session_state.get("logged_in"))
+
+
+def logout():
+    """Ends the session here and in the database, clears the cookie and returns to the login page."""
+    token = st.session_state.get("session_token") or _cookie_token()
+    if token:
+        end_session(token)
+    for key in list(st.session_state.keys()): del st.session_state[key]
+    st.session_state["_ended_session"] = token
+    _queue_cookie("", 0)
+    st.switch_page("app.py")
@@ -0,0 +1,193 @@
+"""
+Streaming emotion analysis of exported game-chat logs (Discord / Steam text dumps).
+
+parse_chat_log() turns lines into (timestamp, speaker, text) records one at a
+time, analyze_chat_log() feeds them through the emotion pipeline in fixed-size
+chunks and folds every result into a ChatLogSummary, so memory use depends on
+the number of speakers, hours and days in the log, not on its size.
+
+Recognised line shapes:
+
+    [2023-12-03 21:15:02] Name: message      Steam, most copy/paste dumps
+    [21:15] Name: message                    time only: date carried from earlier lines
+    2023-12-03 21:15 Name: message
+    [12/03/2023 9:15 PM] Name#1234           DiscordChatExporter: header line,
+    message lines...                         then the message until the next header
+
+A prefix only starts a record if it has a clock time and is followed by a
+speaker or text; other lines, such as "[Monday] raid night", continue the
+previous message.
+"""
+import hashlib
+import io
+import re
+from collections import Counter, namedtuple
+from datetime import datetime, time
+from itertools import islice
+
+from dateutil import parser as date_parser
+
+from emotion_inference import top_emotion
+
+ChatRecord = namedtuple("ChatRecord", ["timestamp", "speaker", "text"])
+
+CHUNK_SIZE = 256
+MAX_TEXT_CHARS = 4000   # the model only reads the first 512 tokens anyway
+
+_BRACKETED = re.compile(r"^\[(?P<ts>[^\]]{4,40})\]\s*(?P<rest>.*)$")
+_PLAIN = re.compile(r"^(?P<ts>\d{4}-\d{2}-\d{2}[ T]\d{1,2}:\d{2}(?::\d{2})?)\s+(?P<rest>.*)$")
+_SPEAKER = re.compile(r"^(?P<speaker>[^:]{1,64}?):\s+(?P<text>.*)$")
+_CLOCK = re.compile(r"\d{1,2}:\d{2}")
+_SECTION = re.compile(r"^\{(Attachments|Reactions|Embed|Stickers)\}$")
+
+
+def _parse_timestamp(text, last):
+    default = datetime.combine(last.date(), time.min) if last else datetime.combine(datetime.now().date(), time.min)
+    try:
+        return date_parser.parse(text, default=default).replace(tzinfo=None)
+    except (ValueError, OverflowError):
+        return None
+
+
+def parse_chat_log(lines):
+    """Yields a ChatRecord per message found in an iterable of text lines."""
+    current = None          # [timestamp, speaker, [text parts], chars]
+    last_timestamp = None
+    skipping = False        # inside a DiscordChatExporter {Attachments}-style section
+
+    def finish():
+        text = "\n".join(current[2]).strip()
+        return ChatRecord(current[0], current[1], text) if text else None
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+        match = _BRACKETED.match(line) or _PLAIN.match(line)
+        if match and not (_CLOCK.search(match.group("ts")) and match.group("rest").strip()):
+            match = None
+        timestamp = _parse_timestamp(match.group("ts"), last_timestamp) if match else None
+        if timestamp is not None:
+            if current is not None:
+                record = finish()
+                if record:
+                    yield record
+            last_timestamp = timestamp
+            skipping = False
+            rest = match.group("rest").strip()
+            said = _SPEAKER.match(rest)
+            if said:
+                current = [timestamp, said.group("speaker").strip(), [said.group("text")], len(said.group("text"))]
+            else:
+                current = [timestamp, rest, [], 0]
+            continue
+        if current is None:
+            continue                # preamble before the first message
+        if _SECTION.match(line.strip()):
+            skipping = True
+        elif not line.strip():
+            skipping = False
+        elif not skipping and current[3] < MAX_TEXT_CHARS:
+            current[2].append(line)
+            current[3] += len(line)
+    if current is not None:
+        record = finish()
+        if record:
+            yield record
+
+
+def _empty_bucket():
+    return {"messages": 0, "emotions": Counter(), "vader_n": 0, "vader_sum": 0.0, "vader_sumsq": 0.0}
+
+
+def _add_to_bucket(bucket, emotion, compound):
+    bucket["messages"] += 1
+    bucket["emotions"][emotion] += 1
+    bucket["vader_n"] += 1
+    bucket["vader_sum"] += compound
+    bucket["vader_sumsq"] += compound * compound
+
+
+class ChatLogSummary:
+    """Running per-speaker, per-hour and per-speaker-day aggregates of analysed messages."""
+
+    def __init__(self, digest=None):
+        self.digest = digest    # SHA-256 of the log file, identifying it when its days are saved
+        self.messages = 0
+        self.speakers = {}
+        self.hours = {}
+        self.days = {}          # (speaker, date) -> bucket plus the day's last analysis
+
+    def add(self, records, analyses):
+        for record, analysis in zip(records, analyses):
+            emotion, probability = top_emotion(analysis["emotions"])
+            compound = analysis["vader"]["compound"]
+            self.messages += 1
+            _add_to_bucket(self.speakers.setdefault(record.speaker, _empty_bucket()), emotion, compound)
+            hour = record.timestamp.replace(minute=0, second=0, microsecond=0)
+            _add_to_bucket(self.hours.setdefault(hour, _empty_bucket()), emotion, compound)
+            day = self.days.setdefault((record.speaker, record.timestamp.date()), _empty_bucket())
+            _add_to_bucket(day, emotion, compound)
+            if day.get("last") is None or record.timestamp >= day["last"][0]:
+                day["last"] = (record.timestamp, emotion, probability, compound)
+
+    def speaker_rows(self):
+        """One dict per speaker, most active first: messages, mean VADER compound and emotion counts."""
+        rows = [
+            {"speaker": speaker, "messages": b["messages"], "vader_mean": b["vader_sum"] / b["vader_n"], **b["emotions"]}
+            for speaker, b in self.speakers.items()
+        ]
+        return sorted(rows, key=lambda row: -row["messages"])
+
+    def hourly_rows(self):
+        """One dict per hour with messages, mean VADER compound and emotion counts, oldest first."""
+        return [
+            {"hour": hour, "messages": b["messages"], "vader_mean": b["vader_sum"] / b["vader_n"], **b["emotions"]}
+            for hour, b in sorted(self.hours.items())
+        ]
+
+    def emotion_days(self, speaker):
+        """
+        The speaker's days in the shape database.save_emotion_days expects: the
+        day's last analysis (as save_emotion_log would have left it) plus the
+        totals of every analysis that day.
+        """
+        return [
+            {
+                "date": day, "emotion": b["last"][1], "probability": b["last"][2], "vader_compound": b["last"][3],
+                "emotion_counts": dict(b["emotions"]), "vader_n": b["vader_n"],
+                "vader_sum": b["vader_sum"], "vader_sumsq": b["vader_sumsq"],
+            }
+            for (who, day), b in sorted(self.days.items(), key=lambda item: item[0][1]) if who == speaker
+        ]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def analyze_chat_log(file, analyze, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Streams a binary file-like chat log through `analyze(texts)` (e.g. a partial
+    of emotion_inference.analyze_many) `chunk_size` messages at a time and
+    returns the ChatLogSummary. `progress(fraction_read, messages)` is called
+    after every chunk.
+    """
+    size = getattr(file, "size", None)
+    if size is None:
+        size = file.seek(0, io.SEEK_END)
+    file.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(1 << 20), b""):
+        digest.update(block)
+    file.seek(0)
+    lines = io.TextIOWrapper(file, encoding="utf-8", errors="replace", newline="")
+    summary = ChatLogSummary(digest.hexdigest())
+    try:
+        for chunk in chunked(parse_chat_log(lines), chunk_size):
+            summary.add(chunk, analyze([record.text for record in chunk]))
+            if progress is not None:
+                progress(min(file.tell() / size, 1.0) if size else 1.0, summary.messages)
+    finally:
+        lines.detach()      # leave the caller's file open
+    return summary
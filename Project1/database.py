@@ -1,153 +1,696 @@
 import streamlit as st
 import psycopg2
 import psycopg2.extras
-from contextlib import closing
+import os
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+import csv
+import hashlib
+import io
+import secrets
+import tempfile
+from contextlib import contextmanager
 import pandas as pd
-from datetime import datetime, timedelta
-import textwrap
+from datetime import datetime, timedelta, timezone, date, time
+from db_pool import ConnectionPool, PoolTimeout, ReplicaRouter, current_route, reads, writes
+from db_cache import QueryCache, SessionCache, read_through
+from db_export import write_user_export
+from db_instrument import InstrumentedCursor, QueryStats, install as install_query_stats
+from db_sqlite import SQLiteBackend
+from db_queue import WriteQueue
+
 # --- DATABASE CONNECTION ---
-def connect_db():
-    """Connects to the PostgreSQL database using credentials from st.secrets."""
-    try:
-        conn = psycopg2.connect(
-            host=st.secrets.database.host,
-            port=st.secrets.database.port,
-            dbname=st.secrets.database.dbname,
-            user=st.secrets.database.user,
-            password=st.secrets.database.password
-        )
-        return conn
-    except psycopg2.OperationalError as e:
-        st.error(f"Database connection failed: {e}")
+@st.cache_resource
+def get_pool():
+    """
+    Builds the process-wide connection pool from st.secrets. Cached with
+    st.cache_resource so every Streamlit session shares the same pool.
+    Optional keys in [database]: pool_min, pool_max, connect_timeout,
+    checkout_timeout, health_check_interval, instrument (default true).
+
+    With backend = "sqlite", an embedded database at sqlite_path (default
+    companion.db) is used instead and the connection keys are ignored.
+    """
+    cfg = st.secrets.database
+    if cfg.get("backend", "postgres") == "sqlite":
+        return SQLiteBackend(cfg.get("sqlite_path", "companion.db"), max_idle=int(cfg.get("pool_max", 10)))
+    return _build_pool(cfg, {
+        "host": cfg.host,
+        "port": cfg.port,
+        "dbname": cfg.dbname,
+        "user": cfg.user,
+        "password": cfg.password,
+    }, maxconn=int(cfg.get("pool_max", 10)))
+
+def _build_pool(cfg, dsn_kwargs, maxconn):
+    if cfg.get("instrument", True):
+        install_query_stats(get_query_stats())
+        dsn_kwargs = dict(dsn_kwargs, cursor_factory=InstrumentedCursor)
+    return ConnectionPool(
+        dsn_kwargs=dsn_kwargs,
+        minconn=int(cfg.get("pool_min", 1)),
+        maxconn=maxconn,
+        connect_timeout=int(cfg.get("connect_timeout", 5)),
+        checkout_timeout=float(cfg.get("checkout_timeout", 10)),
+        health_check_interval=float(cfg.get("health_check_interval", 30)),
+    )
+
+@st.cache_resource
+def get_replica_router():
+    """
+    Builds one pool per read replica, or returns None when none are configured.
+    [database] replicas is a list of DSN strings or of tables overriding the
+    primary's host/port/dbname/user/password. Optional keys: replica_pool_max,
+    replica_retry_after (seconds a failed replica is skipped, default 30) and
+    read_your_writes (seconds a session reads from the primary after it
+    writes, default 5).
+    """
+    cfg = st.secrets.database
+    replicas = cfg.get("replicas", [])
+    if not replicas or cfg.get("backend", "postgres") != "postgres":
         return None
+    primary = {"host": cfg.host, "port": cfg.port, "dbname": cfg.dbname, "user": cfg.user, "password": cfg.password}
+    maxconn = int(cfg.get("replica_pool_max", cfg.get("pool_max", 10)))
+    pools = [
+        _build_pool(cfg, dict(primary, **replica) if isinstance(replica, Mapping) else {"dsn": replica}, maxconn)
+        for replica in replicas
+    ]
+    return ReplicaRouter(
+        pools,
+        retry_after=float(cfg.get("replica_retry_after", 30)),
+        read_your_writes=float(cfg.get("read_your_writes", 5)),
+    )
 
-# --- USER MANAGEMENT FUNCTIONS ---
-def add_password_user(email, username, hashed_password):
-    sql = "INSERT INTO users (email, username, full_name, hashed_password) VALUES (%s, %s, %s, %s)"
-    conn = None
+@st.cache_resource
+def get_query_stats():
+    """
+    Per-process query statistics and slow-query log (see db_instrument). Optional
+    key in [database]: slow_query_ms (default 200).
+    """
+    cfg = st.secrets.database
+    return QueryStats(slow_threshold_ms=float(cfg.get("slow_query_ms", 200)))
+
+# CLI tools and load tests run outside `streamlit run`, where st.secrets may not
+# describe the database they target; they install their own pool and cache here.
+_standalone = {}
+
+def use_standalone_resources(pool, cache=None, router=None, write_queue=None, async_runtime=None):
+    """
+    Makes every function below use `pool`, `cache` (default: a fresh QueryCache),
+    `router` for replica reads, `write_queue` for write-behind and
+    `async_runtime` for database_async (default: none, so its reads run here
+    one after another).
+    """
+    _standalone["pool"] = pool
+    _standalone["cache"] = cache if cache is not None else QueryCache()
+    _standalone["router"] = router
+    _standalone["write_queue"] = write_queue
+    _standalone["async_runtime"] = async_runtime
+    _standalone.pop("session_cache", None)
+
+def _current_pool():
+    return _standalone.get("pool") or get_pool()
+
+def backend_dialect():
+    """"postgres" or "sqlite", depending on the configured storage backend."""
+    return getattr(_current_pool(), "dialect", "postgres")
+
+def _dialect(conn):
+    return getattr(conn, "dialect", "postgres")
+
+def _current_router():
+    return _standalone["router"] if "pool" in _standalone else get_replica_router()
+
+# --- READ-YOUR-WRITES ---
+# A session that has just written reads from the primary for the router's
+# read_your_writes window, so it never sees a replica that hasn't caught up yet.
+def _note_write():
     try:
-        conn = connect_db()
-        if not conn: return False
-        with conn.cursor() as cursor:
-            cursor.execute(sql, (email, username, username, hashed_password))
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error creating password user: {e}")
-        if conn: conn.rollback()
+        st.session_state["_db_last_write"] = datetime.now()
+    except Exception:
+        pass  # no Streamlit session (CLI tools, background threads)
+
+def _note_pending_write(entry_id):
+    try:
+        st.session_state["_db_pending_write"] = entry_id
+    except Exception:
+        pass
+
+def _await_own_writes():
+    """
+    Waits (up to the queue's read_wait) until this session's last journaled write
+    has been applied, so write-behind doesn't break read-your-writes. Gives up
+    after one timeout, e.g. while the database is down, rather than stalling
+    every read.
+    """
+    try:
+        entry_id = st.session_state.pop("_db_pending_write", None)
+    except Exception:
+        return
+    queue = _current_write_queue() if entry_id is not None else None
+    if queue is not None and not queue.wait_for(entry_id):
+        print(f"[write-behind] entry {entry_id} not applied within {queue.read_wait:.1f}s; reading without it")
+
+def _wrote_recently(router):
+    try:
+        last_write = st.session_state.get("_db_last_write")
+    except Exception:
         return False
+    return last_write is not None and datetime.now() - last_write < timedelta(seconds=router.read_your_writes)
+
+@contextmanager
+def db_connection():
+    """
+    Borrows a connection from the shared pool for the duration of a `with` block.
+    Inside a function tagged @reads, the connection comes from a read replica
+    when one is configured and healthy. Yields None if the database is
+    unreachable, so callers keep their `if db is None: return ...` guards.
+    """
+    route = current_route()
+    if route == "read":
+        _await_own_writes()
+    pool, conn = None, None
+    router = _current_router() if route == "read" else None
+    if router is not None and not _wrote_recently(router):
+        pool, conn = router.acquire()
+    if conn is None:
+        pool = _current_pool()
+        try:
+            conn = pool.acquire()
+        except (psycopg2.OperationalError, PoolTimeout, sqlite3.OperationalError) as e:
+            _connection_state.failures = _connection_failures() + 1
+            st.error(f"Database connection failed: {e}")
+            yield None
+            return
+    discard = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError, sqlite3.OperationalError):
+        discard = True
+        if router is not None and router.owns(pool):
+            router.mark_down(pool)
+        raise
     finally:
-        if conn: conn.close()
+        pool.release(conn, discard=discard)
+    if route == "write":
+        _note_write()
+
+def get_pool_stats():
+    """Returns occupancy and lifetime counters of the shared connection pool (and replicas, if any)."""
+    stats = _current_pool().stats()
+    router = _current_router()
+    if router is not None:
+        stats["replication"] = router.stats()
+    return stats
+
+# --- READ-THROUGH CACHE ---
+_connection_state = threading.local()
+
+def _connection_failures():
+    return getattr(_connection_state, "failures", 0)
+
+@st.cache_resource
+def get_query_cache():
+    """
+    Per-process cache for the per-user readers below. Optional keys in
+    [database]: cache_max_entries, cache_ttl (seconds).
+    """
+    cfg = st.secrets.database
+    return QueryCache(
+        maxsize=int(cfg.get("cache_max_entries", 2048)),
+        ttl=float(cfg.get("cache_ttl", 60)),
+    )
+
+def _current_cache():
+    return _standalone.get("cache") or get_query_cache()
+
+def _cache_for_read():
+    # A cached value may predate this session's journaled write: wait for it first.
+    _await_own_writes()
+    return _current_cache()
+
+# Readers decorated with this are served from the cache; writers call
+# _invalidate() with the reader names their change affects.
+cached_reader = read_through(_cache_for_read, failure_marker=_connection_failures)
+
+SNAPSHOT_READER = "_fetch_user_snapshot"
+ROLLUP_READER = "get_daily_metrics"
+SYMPTOM_READERS = ("get_symptom_matrix", "get_question_trends", "get_self_harm_frequency")
+PHQ9_READERS = ("get_latest_phq9", "get_score_trend", "get_scores_over_time", SNAPSHOT_READER, ROLLUP_READER) + SYMPTOM_READERS
+BEHAVIOR_READERS = ("get_behavior_logs", SNAPSHOT_READER, ROLLUP_READER)
+EMOTION_READERS = ("get_latest_emotion", SNAPSHOT_READER, ROLLUP_READER)
+CALENDAR_READERS = ("get_calendar_events", SNAPSHOT_READER)
+
+def _invalidate(user_id, readers):
+    if user_id is not None:
+        _current_cache().invalidate(user_id, *readers)
+
+def get_cache_stats():
+    """Returns hit/miss counters of the read-through cache."""
+    return _current_cache().stats()
 
-# --- READ-ONLY FUNCTIONS (can use the simpler 'with closing') ---
+# --- USER MANAGEMENT ---
+@writes
+def add_password_user(email, username, hashed_password):
+    """Creates the account. Returns its id, None if the email is already registered, or False if the database is down."""
+    sql = """
+        INSERT INTO users (email, username, full_name, hashed_password) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (email) DO NOTHING RETURNING id
+    """
+    with db_connection() as db:
+        if db is None: return False
+        with db.cursor() as cursor:
+            cursor.execute(sql, (email, username, username, hashed_password))
+            row = cursor.fetchone()
+            db.commit()
+    return row[0] if row else None
+
+USER_BY_EMAIL_SQL = "SELECT id, email, username, full_name, hashed_password FROM users WHERE email = %s"
+
+# Authentication reads stay on the primary so a password change applies at once.
 def get_user_by_email(email):
-    sql = "SELECT id, email, username, full_name, hashed_password FROM users WHERE email = %s"
     try:
-        with closing(connect_db()) as db, closing(db.cursor()) as cursor:
+        with db_connection() as db:
             if db is None: return None
-            cursor.execute(sql, (email,))
-            user_data = cursor.fetchone()
-            if user_data:
-                columns = ['id', 'email', 'username', 'full_name', 'hashed_password']
-                return dict(zip(columns, user_data))
-            return None
+            with db.cursor() as cursor:
+                cursor.execute(USER_BY_EMAIL_SQL, (email,))
+                user_data = cursor.fetchone()
+                if user_data:
+                    columns = ['id', 'email', 'username', 'full_name', 'hashed_password']
+                    return dict(zip(columns, user_data))
+                return None
     except Exception as e:
         print(f"Error getting user by email: {e}")
         return None
 
+@writes
 def update_user_password(email, new_hashed_password):
-    sql = "UPDATE users SET hashed_password = %s WHERE email = %s"
+    """Sets a new password hash and signs the account out everywhere."""
+    sql = "UPDATE users SET hashed_password = %s WHERE email = %s RETURNING id"
     try:
-        with closing(connect_db()) as db, closing(db.cursor()) as cursor:
-            cursor.execute(sql, (new_hashed_password, email))
+        with db_connection() as db:
+            if db is None: return False
+            with db.cursor() as cursor:
+                cursor.execute(sql, (new_hashed_password, email))
+                row = cursor.fetchone()
+                if row:
+                    cursor.execute("DELETE FROM sessions WHERE user_id = %s", (row[0],))
             db.commit()
-            return True
+        if row:
+            _current_session_cache().discard_user(row[0])
+        return True
     except Exception as e:
         print(f"[DB Error] Failed to update password for {email}: {e}")
         return False
 
+@writes
+def rehash_user_password(user_id, old_hashed_password, new_hashed_password):
+    """
+    Replaces a password hash with a stronger one for the same password, unless
+    it changed in the meantime. Sessions are left alone.
+    """
+    sql = "UPDATE users SET hashed_password = %s WHERE id = %s AND hashed_password = %s"
+    try:
+        with db_connection() as db:
+            if db is None: return False
+            with db.cursor() as cursor:
+                cursor.execute(sql, (new_hashed_password, user_id, old_hashed_password))
+                updated = cursor.rowcount == 1
+            db.commit()
+        return updated
+    except Exception as e:
+        print(f"[DB Error] Failed to rehash password for user {user_id}: {e}")
+        return False
+
+# --- LOGIN SESSIONS ---
+# A login hands the browser a random token; only its SHA-256 is stored in
+# `sessions`. Validated tokens are kept in a per-process SessionCache, so a
+# refresh or new tab is restored without a query; the database is consulted
+# on a cache miss and every session_revalidate seconds, which also moves
+# last_seen forward. A token restored from the cookie after such a database
+# check is swapped for a new one (rotate_session), so a copied cookie stops
+# working once its owner comes back, while restores the cache answers stay
+# free of queries.
+# Optional keys in [database]: session_idle_timeout (seconds, default 12
+# hours), session_max_age (default 7 days, counted from the login, not the
+# last rotation), session_revalidate (300), session_rotate (default true),
+# session_rotate_grace (seconds the replaced token keeps working, default 60)
+# and session_cache_max_entries (10000).
+SESSION_USER_COLUMNS = ['id', 'email', 'username', 'full_name']
+SESSION_DEFAULTS = {
+    "idle_timeout": 12 * 3600, "max_age": 7 * 86400, "revalidate_after": 300, "maxsize": 10000,
+    "rotate": True, "rotate_grace": 60,
+}
+
+def _session_settings():
+    if "pool" in _standalone:
+        return SESSION_DEFAULTS
+    cfg = st.secrets.database
+    return {
+        "idle_timeout": float(cfg.get("session_idle_timeout", SESSION_DEFAULTS["idle_timeout"])),
+        "max_age": float(cfg.get("session_max_age", SESSION_DEFAULTS["max_age"])),
+        "revalidate_after": float(cfg.get("session_revalidate", SESSION_DEFAULTS["revalidate_after"])),
+        "maxsize": int(cfg.get("session_cache_max_entries", SESSION_DEFAULTS["maxsize"])),
+        "rotate": bool(cfg.get("session_rotate", SESSION_DEFAULTS["rotate"])),
+        "rotate_grace": float(cfg.get("session_rotate_grace", SESSION_DEFAULTS["rotate_grace"])),
+    }
 
-# --- CONVERSATION & MESSAGE FUNCTIONS ---
+def _session_cutoffs(now):
+    """(last_seen, created_at) lower bounds of a live session."""
+    settings = _session_settings()
+    return now - timedelta(seconds=settings["idle_timeout"]), now - timedelta(seconds=settings["max_age"])
+
+@st.cache_resource
+def get_session_cache():
+    """The process-wide cache of validated session tokens."""
+    settings = _session_settings()
+    return SessionCache(settings["maxsize"], settings["idle_timeout"], settings["revalidate_after"])
+
+def _current_session_cache():
+    if "pool" not in _standalone:
+        return get_session_cache()
+    return _standalone.setdefault("session_cache", SessionCache(
+        SESSION_DEFAULTS["maxsize"], SESSION_DEFAULTS["idle_timeout"], SESSION_DEFAULTS["revalidate_after"]))
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+SWEEP_SESSIONS_SQL = "DELETE FROM sessions WHERE user_id = %s AND (last_seen < %s OR created_at < %s)"
+
+@writes
+def create_session(user_id):
+    """Starts a login session. Returns (token, user) or (None, None) if it could not be stored."""
+    cache = _current_session_cache()
+    token = secrets.token_urlsafe(32)
+    now = datetime.now()
+    try:
+        with db_connection() as db:
+            if db is None: return (None, None)
+            with db.cursor() as cursor:
+                # Sessions that have expired are swept whenever their user logs in again.
+                cursor.execute(SWEEP_SESSIONS_SQL, (user_id, *_session_cutoffs(now)))
+                cursor.execute(
+                    "INSERT INTO sessions (token_hash, user_id, created_at, last_seen) VALUES (%s, %s, %s, %s)",
+                    (_token_hash(token), user_id, now, now),
+                )
+                cursor.execute(f"SELECT {', '.join(SESSION_USER_COLUMNS)} FROM users WHERE id = %s", (user_id,))
+                user = dict(zip(SESSION_USER_COLUMNS, cursor.fetchone()))
+            db.commit()
+    except Exception as e:
+        print(f"Error creating session for user {user_id}: {e}")
+        return (None, None)
+    cache.put(_token_hash(token), user)
+    return token, user
+
+RESUME_SESSION_SQL = """
+    UPDATE sessions SET last_seen = %s
+    WHERE token_hash = %s AND last_seen >= %s AND created_at >= %s
+    RETURNING user_id
+"""
+
+@writes
+def resume_session(token):
+    """
+    Returns the user a session token belongs to, or None if it is unknown,
+    idle for too long, or older than session_max_age.
+    """
+    cache = _current_session_cache()
+    token_hash = _token_hash(token)
+    user, stale = cache.get(token_hash)
+    if not stale:
+        return user
+    now = datetime.now()
+    try:
+        with db_connection() as db:
+            if db is None: return user
+            with db.cursor() as cursor:
+                cursor.execute(RESUME_SESSION_SQL, (now, token_hash, *_session_cutoffs(now)))
+                row = cursor.fetchone()
+                if row:
+                    cursor.execute(f"SELECT {', '.join(SESSION_USER_COLUMNS)} FROM users WHERE id = %s", (row[0],))
+                    row = cursor.fetchone()
+            db.commit()
+    except Exception as e:
+        print(f"Error resuming session: {e}")
+        return user
+    if row is None:
+        cache.discard(token_hash)
+        return None
+    user = dict(zip(SESSION_USER_COLUMNS, row))
+    cache.put(token_hash, user, rotation_due=True)
+    return user
+
+@writes
+def rotate_session(token):
+    """
+    Replaces a live session token with a new one for the same login. The old
+    token keeps working for session_rotate_grace seconds, so tabs opened with
+    it just before the swap aren't logged out, and the new one expires when
+    the old one would have (session_max_age after the login). Returns the new
+    token, or None if `token` isn't live, has already been replaced, or the
+    swap couldn't be stored.
+
+    Only a token whose last resume_session in this process went to the
+    database (a cache miss or revalidation) is rotated; for any other, e.g. a
+    refresh the session cache answered, this returns None without a query.
+    """
+    settings = _session_settings()
+    cache = _current_session_cache()
+    token_hash, new_token = _token_hash(token), secrets.token_urlsafe(32)
+    if not cache.take_rotation(token_hash):
+        return None
+    now = datetime.now()
+    last_seen_cutoff, created_cutoff = _session_cutoffs(now)
+    # Backdating created_at makes the old row reach session_max_age after the grace period.
+    retire_at = created_cutoff + timedelta(seconds=settings["rotate_grace"])
+    try:
+        with db_connection() as db:
+            if db is None: return None
+            with db.cursor() as cursor:
+                cursor.execute(
+                    "SELECT user_id, created_at FROM sessions WHERE token_hash = %s AND last_seen >= %s AND created_at >= %s",
+                    (token_hash, last_seen_cutoff, created_cutoff),
+                )
+                row = cursor.fetchone()
+                # A row within the grace period of its max age has already been
+                # rotated (or is about to expire); the UPDATE's guard also stops a
+                # concurrent rotation of the same token from retiring it twice.
+                if row is not None and row[1] > retire_at:
+                    cursor.execute(
+                        "UPDATE sessions SET created_at = %s WHERE token_hash = %s AND created_at > %s",
+                        (retire_at, token_hash, retire_at),
+                    )
+                if row is None or row[1] <= retire_at or cursor.rowcount == 0:
+                    db.rollback()
+                    return None
+                user_id, created_at = row
+                # Rotation leaves a retired row behind, so expired ones are swept here as well as at login.
+                cursor.execute(SWEEP_SESSIONS_SQL, (user_id, last_seen_cutoff, created_cutoff))
+                cursor.execute(
+                    "INSERT INTO sessions (token_hash, user_id, created_at, last_seen) VALUES (%s, %s, %s, %s)",
+                    (_token_hash(new_token), user_id, created_at, now),
+                )
+            db.commit()
+    except Exception as e:
+        print(f"Error rotating session: {e}")
+        return None
+    user, _ = cache.get(token_hash)
+    cache.discard(token_hash)
+    if user is not None:
+        cache.put(_token_hash(new_token), user)
+    return new_token
+
+@writes
+def end_session(token):
+    """Logs a session out, here and (after at most session_revalidate seconds) in every other process."""
+    token_hash = _token_hash(token)
+    _current_session_cache().discard(token_hash)
+    try:
+        with db_connection() as db:
+            if db is None: return False
+            with db.cursor() as cursor:
+                cursor.execute("DELETE FROM sessions WHERE token_hash = %s", (token_hash,))
+            db.commit()
+        return True
+    except Exception as e:
+        print(f"Error ending session: {e}")
+        return False
+
+def get_session_cache_stats():
+    """Hit/miss counters of the session cache."""
+    return _current_session_cache().stats()
+
+# --- CONVERSATION & ASSESSMENT ---
+@writes
 def create_conversation(user_id, title="New Chat"):
     sql = "INSERT INTO conversations (user_id, title) VALUES (%s, %s) RETURNING id"
-    with closing(connect_db()) as db:
+    with db_connection() as db:
         if db is None: return None
-        with closing(db.cursor()) as cursor:
+        with db.cursor() as cursor:
             cursor.execute(sql, (user_id, title))
             new_id = cursor.fetchone()[0]
-        db.commit()
-        return new_id
+            db.commit()
+    return new_id
 
-# def get_user_conversations(user_id):
-#     sql = "SELECT id, title FROM conversations WHERE user_id = %s ORDER BY start_time DESC"
-#     with closing(connect_db()) as db:
-#         if db is None: return []
-#         with closing(db.cursor()) as cursor:
-#             cursor.execute(sql, (user_id,))
-#             conversations = [{"id": row[0], "title": row[1]} for row in cursor.fetchall()]
-#             return conversations
+USER_CONVERSATIONS_SQL = "SELECT id, title, completion_score, video_url FROM conversations WHERE user_id = %s ORDER BY start_time DESC"
 
+@reads
 def get_user_conversations(user_id):
-    """Fetches all conversations for a user, including score and video_url."""
-    sql = "SELECT id, title, completion_score, video_url FROM conversations WHERE user_id = %s ORDER BY start_time DESC"
-    with closing(connect_db()) as db:
+    with db_connection() as db:
         if db is None: return []
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id,))
-            # Updated to handle the new 'video_url' column
-            conversations = [
-                {"id": row[0], "title": row[1], "completion_score": row[2], "video_url": row[3]} 
-                for row in cursor.fetchall()
-            ]
-            return conversations
-
-# ADD this new function to your database.py file
+        with db.cursor() as cursor:
+            cursor.execute(USER_CONVERSATIONS_SQL, (user_id,))
+            # fetchall() is safe to call even with 0 results, it will return []
+            conversations = [{"id": row[0], "title": row[1], "completion_score": row[2], "video_url": row[3]} for row in cursor.fetchall()]
+    return conversations
+
+@writes
+def update_conversation_score(conversation_id, score):
+    sql = "UPDATE conversations SET completion_score = %s WHERE id = %s RETURNING user_id, start_time"
+    with db_connection() as db:
+        if db is None: return
+        with db.cursor() as cursor:
+            cursor.execute(sql, (score, conversation_id))
+            row = cursor.fetchone()
+            if row: _refresh_rollup_day(cursor, row[0], "phq9", row[1])
+            db.commit()
+    if row: _invalidate(row[0], PHQ9_READERS)
+
+@writes
+def update_conversation_answers(conversation_id, answers):
+    sql = "UPDATE conversations SET answers = %s WHERE id = %s RETURNING user_id"
+    with db_connection() as db:
+        if db is None: return
+        with db.cursor() as cursor:
+            cursor.execute(sql, (answers, conversation_id))
+            row = cursor.fetchone()
+            store_phq9_answers(cursor, conversation_id=conversation_id)
+        db.commit()
+    if row: _invalidate(row[0], PHQ9_READERS)
+
+@writes
 def update_conversation_video_url(conversation_id, video_url):
     """Updates the video_url for a completed assessment conversation."""
     sql = "UPDATE conversations SET video_url = %s WHERE id = %s"
-    with closing(connect_db()) as db:
+    with db_connection() as db:
         if db is None: return
-        with closing(db.cursor()) as cursor:
+        with db.cursor() as cursor:
             cursor.execute(sql, (video_url, conversation_id))
         db.commit()
 
+@writes
 def delete_conversation(conversation_id):
-    """Deletes a conversation and its associated messages from the database."""
     # The ON DELETE CASCADE constraint will automatically delete chat_history messages.
-    sql = "DELETE FROM conversations WHERE id = %s"
-    with closing(connect_db()) as db:
+    sql = "DELETE FROM conversations WHERE id = %s RETURNING user_id, start_time"
+    with db_connection() as db:
         if db is None: return False
-        with closing(db.cursor()) as cursor:
+        with db.cursor() as cursor:
             cursor.execute(sql, (conversation_id,))
-        db.commit()
-        return True
+            row = cursor.fetchone()
+            if row: _refresh_rollup_day(cursor, row[0], "phq9", row[1])
+            db.commit()
+    if row: _invalidate(row[0], PHQ9_READERS)
+    return True
+
+def clear_all_assessments(user_id):
+    return bulk_delete_user_data(user_id, ["assessments"]) is not None
 
-        
-# def update_conversation_title(conversation_id, title):
-#     sql = "UPDATE conversations SET title = %s WHERE id = %s"
-#     with closing(connect_db()) as db:
-#         if db is None: return
-#         with closing(db.cursor()) as cursor:
-#             cursor.execute(sql, (title, conversation_id))
-#         db.commit()
+# pg_advisory_xact_lock(key, user_id) serialising a user's assessment numbering
+# (migrations.py and partitions.py use 727_001 and 727_002).
+ASSESSMENT_LOCK_KEY = 727_003
 
+@writes
+def save_completed_assessment(user_id, answers, score, video_url, messages):
+    """
+    Persists a finished PHQ-9 in a single transaction: one INSERT ... RETURNING
+    for the conversation (numbered after the user's existing assessments) and one
+    multi-row INSERT for its chat_history. Returns (conversation_id, title), or
+    (None, None) if nothing was saved.
+    """
+    sql_conversation = """
+        INSERT INTO conversations (user_id, kind, title, answers, completion_score, video_url)
+        SELECT %s, 'phq9', 'PHQ-9 Assessment #' || (COUNT(*) + 1), %s, %s, %s
+        FROM conversations
+        WHERE user_id = %s AND kind = 'phq9'
+        RETURNING id, title, start_time;
+    """
+    # clock_timestamp() advances per row, so get_messages keeps the original order
+    # even though every row is written in the same transaction.
+    sql_messages = "INSERT INTO chat_history (conversation_id, role, content, timestamp) VALUES %s"
+    try:
+        with db_connection() as db:
+            if db is None: return (None, None)
+            with db.cursor() as cursor:
+                if _dialect(db) == "postgres":
+                    # Under READ COMMITTED two concurrent submissions would count the
+                    # same rows and get the same number. SQLite runs the INSERT ... SELECT
+                    # under its single write lock, so it needs no extra lock.
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", (ASSESSMENT_LOCK_KEY, user_id))
+                cursor.execute(sql_conversation, (user_id, answers, score, video_url, user_id))
+                conv_id, title, started = cursor.fetchone()
+                if messages and _dialect(db) == "sqlite":
+                    # SQLite has no clock_timestamp(); space the rows a microsecond apart instead.
+                    sent_at = datetime.now()
+                    rows = [(conv_id, msg['role'], msg['content'], sent_at + timedelta(microseconds=i)) for i, msg in enumerate(messages)]
+                    cursor.executemany(sql_messages.replace("VALUES %s", "VALUES (%s, %s, %s, %s)"), rows)
+                elif messages:
+                    rows = [(conv_id, msg['role'], msg['content']) for msg in messages]
+                    psycopg2.extras.execute_values(cursor, sql_messages, rows, template="(%s, %s, %s, clock_timestamp())", page_size=len(rows))
+                _refresh_rollup_day(cursor, user_id, "phq9", started)
+                store_phq9_answers(cursor, conversation_id=conv_id)
+            db.commit()
+        _invalidate(user_id, PHQ9_READERS)
+        return (conv_id, title)
+    except Exception as e:
+        print(f"Error saving assessment for user {user_id}: {e}")
+        return (None, None)
+
+@writes
 def add_message(conversation_id, role, content):
-    sql = "INSERT INTO chat_history (conversation_id, role, content) VALUES (%s, %s, %s)"
-    with closing(connect_db()) as db:
-        if db is None: return
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (conversation_id, role, content))
-        db.commit()
+    # Stamped now, not when the write-behind drainer applies it: a batch shares one
+    # transaction (and one NOW()), and after an outage NOW() would be hours late.
+    return _submit_write("add_message", conversation_id, role, content, datetime.now(timezone.utc))
+
+_ADD_MESSAGE_SQL = """
+    INSERT INTO chat_history (conversation_id, role, content, timestamp)
+    VALUES (%(id)s, %(role)s, %(content)s, {greatest}(%(sent_at)s, (SELECT start_time FROM conversations WHERE id = %(id)s)))
+"""
+
+def _apply_add_message(cursor, conversation_id, role, content, sent_at=None):
+    # Entries journaled before messages carried their own time have no sent_at.
+    sent_at = sent_at or datetime.now(timezone.utc)
+    if _dialect(cursor.connection) == "sqlite":
+        # SQLite stores local wall-clock text, like its 'localtime' defaults.
+        sent_at = sent_at.astimezone().replace(tzinfo=None)
+        sql = _ADD_MESSAGE_SQL.format(greatest="max")
+    else:
+        sql = _ADD_MESSAGE_SQL.format(greatest="GREATEST")
+    # Never before the conversation started (app and database clocks may differ),
+    # or get_messages would skip the message.
+    cursor.execute(sql, {"id": conversation_id, "role": role, "content": content, "sent_at": sent_at})
+    return None
 
+# Messages are never older than their conversation, and bounding the
+# timestamp lets Postgres skip the chat_history partitions before it.
+MESSAGES_SQL = """
+    SELECT role, content FROM chat_history
+    WHERE conversation_id = %(id)s AND timestamp >= (SELECT start_time FROM conversations WHERE id = %(id)s)
+    ORDER BY timestamp ASC, id ASC
+"""
+
+@reads
 def get_messages(conversation_id):
-    sql = "SELECT role, content FROM chat_history WHERE conversation_id = %s ORDER BY timestamp ASC"
-    with closing(connect_db()) as db:
+    with db_connection() as db:
         if db is None: return []
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (conversation_id,))
+        with db.cursor() as cursor:
+            cursor.execute(MESSAGES_SQL, {"id": conversation_id})
             messages = [{"role": row[0], "content": row[1]} for row in cursor.fetchall()]
             return messages
-        
+
+# --- BEHAVIOUR LOGS ---
+@writes
 def log_behavior(user_id, date, hours, solo_ratio, late_night, mood, social_score, breaks, risk_score):
     sql = """
     INSERT INTO behavior_logs (
@@ -156,133 +699,576 @@ def log_behavior(user_id, date, hours, solo_ratio, late_night, mood, social_scor
         physical_breaks, risk_score
     ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
     """
-    with closing(connect_db()) as db:
+    with db_connection() as db:
         if db is None: return
-        with closing(db.cursor()) as cursor:
+        with db.cursor() as cursor:
             cursor.execute(sql, (
                 user_id, date, hours, solo_ratio, late_night,
                 mood, social_score, breaks, risk_score
             ))
+            _refresh_rollup_day(cursor, user_id, "behavior", date)
         db.commit()
+    _invalidate(user_id, BEHAVIOR_READERS)
 
-def get_todays_events(user_id, today_date):
-    """Fetches all calendar events for a user for a specific date."""
+@writes
+def save_behavior_log(user_id, date, hours_played, mood_score, solo_play_ratio, late_night_gaming, physical_breaks, social_interaction_score):
+    return _submit_write("save_behavior_log", user_id, date, hours_played, mood_score, solo_play_ratio,
+                         late_night_gaming, physical_breaks, social_interaction_score)
+
+def _apply_behavior_log(cursor, user_id, date, hours_played, mood_score, solo_play_ratio, late_night_gaming, physical_breaks, social_interaction_score):
     sql = """
-        SELECT title, start_time
-        FROM calendar_events
-        WHERE user_id = %s AND event_date = %s
-        ORDER BY start_time ASC;
+    INSERT INTO behavior_logs (user_id, log_date, hours_played, mood_score, solo_play_ratio, late_night_gaming, physical_breaks, social_interaction_score)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (user_id, log_date) DO UPDATE SET
+        hours_played = EXCLUDED.hours_played, mood_score = EXCLUDED.mood_score, solo_play_ratio = EXCLUDED.solo_play_ratio,
+        late_night_gaming = EXCLUDED.late_night_gaming, physical_breaks = EXCLUDED.physical_breaks, social_interaction_score = EXCLUDED.social_interaction_score;
     """
+    cursor.execute(sql, (user_id, date, hours_played, mood_score, solo_play_ratio, late_night_gaming, physical_breaks, social_interaction_score))
+    _refresh_rollup_day(cursor, user_id, "behavior", date)
+    return user_id
+
+# The per-user readers' SQL is shared with database_async and migrations.hot_queries.
+BEHAVIOR_LOG_COLUMNS = ["log_date", "hours_played", "mood_score", "solo_play_ratio", "late_night_gaming", "physical_breaks", "social_interaction_score"]
+BEHAVIOR_LOGS_SQL = f"SELECT {', '.join(BEHAVIOR_LOG_COLUMNS)} FROM behavior_logs WHERE user_id = %s ORDER BY log_date DESC"
+
+@cached_reader
+@reads
+def get_behavior_logs(user_id):
+    with db_connection() as db:
+        if db is None: return pd.DataFrame()
+        df = pd.read_sql(BEHAVIOR_LOGS_SQL, db, params=(user_id,))
+        if not df.empty:
+            df = df.rename(columns={"log_date": "date"})
+    return df
+
+# --- PHQ-9 & ASSESSMENT HELPERS ---
+LATEST_PHQ9_SQL = """
+    SELECT start_time, completion_score, answers
+    FROM conversations
+    WHERE user_id = %s AND kind = 'phq9' AND completion_score IS NOT NULL
+    ORDER BY start_time DESC LIMIT 1;
+"""
+
+@cached_reader
+@reads
+def get_latest_phq9(user_id):
+    with db_connection() as db:
+        if db is None: return None
+        with db.cursor() as cursor:
+            cursor.execute(LATEST_PHQ9_SQL, (user_id,))
+            row = cursor.fetchone()
+    if not row:
+        return None
+    return _phq9_result(*row)
+
+def _phq9_result(start_time, score, answers):
     try:
-        with closing(connect_db()) as db:
-            if db is None: return []
-            with closing(db.cursor()) as cursor:
-                cursor.execute(sql, (user_id, today_date))
-                # Fetchall will return a list of tuples, e.g., [('Do this', datetime.time(9, 0))]
-                return cursor.fetchall()
-    except Exception as e:
-        print(f"Error fetching today's events for user {user_id}: {e}")
-        return []
+        from shared import get_severity_for_score
+        severity = get_severity_for_score(score)
+    except (ImportError, AttributeError):
+        severity = "Unknown"
+
+    return {"date": start_time, "total_score": score, "severity_level": severity, "answers": answers}
+
+LATEST_ANSWERS_SQL = "SELECT answers FROM conversations WHERE user_id = %s AND answers IS NOT NULL ORDER BY start_time DESC LIMIT 1;"
+
+@reads
+def get_latest_assessment_answers(user_id):
+    with db_connection() as db:
+        if db is None: return None
+        with db.cursor() as cursor:
+            cursor.execute(LATEST_ANSWERS_SQL, (user_id,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+
+SCORE_TREND_SQL = "SELECT completion_score FROM conversations WHERE user_id = %s AND kind = 'phq9' AND completion_score IS NOT NULL ORDER BY start_time DESC LIMIT 2;"
+
+def _score_trend(scores):
+    if len(scores) == 2: return (scores[0], scores[1])
+    elif len(scores) == 1: return (scores[0], None)
+    else: return (None, None)
+
+@cached_reader
+@reads
+def get_score_trend(user_id):
+    with db_connection() as db:
+        if db is None: return (None, None)
+        with db.cursor() as cursor:
+            cursor.execute(SCORE_TREND_SQL, (user_id,))
+            scores = [row[0] for row in cursor.fetchall()]
+    return _score_trend(scores)
+
+SCORES_OVER_TIME_SQL = """
+    SELECT start_time, completion_score, answers
+    FROM conversations
+    WHERE user_id = %s
+      AND kind = 'phq9'
+      AND completion_score IS NOT NULL
+      AND answers IS NOT NULL
+    ORDER BY start_time ASC;
+"""
+
+def _scores_frame(df):
+    if not df.empty:
+        df = df.rename(columns={
+            "start_time": "Date",
+            "completion_score": "Score",
+            "answers": "Answers" # The 'answers' column will contain lists
+        })
+        df['Date'] = pd.to_datetime(df['Date']).dt.date
+    return df
+
+@cached_reader
+@reads
+def get_scores_over_time(user_id):
+    """
+    Fetches all completed assessment scores, timestamps, and detailed answers for a user.
+    """
+    with db_connection() as db:
+        if db is None: return pd.DataFrame()
+
+        # Use pandas to read directly from the SQL query for simplicity
+        df = pd.read_sql(SCORES_OVER_TIME_SQL, db, params=(user_id,))
+    return _scores_frame(df)
+
+# --- USER SNAPSHOT ---
+def get_user_snapshot(user_id, today=None):
+    """
+    Everything the suggestion, tracker and schedule pages need about a user's
+    current state, fetched in one round trip:
+        phq9            latest PHQ-9 as returned by get_latest_phq9 (or None)
+        previous_score  the PHQ-9 score before it (or None)
+        emotion         latest emotion log as returned by get_latest_emotion (or None)
+        behavior        latest behavior log row, keyed like get_behavior_logs columns (or None)
+        todays_events   [(title, start_time)] as returned by get_todays_events
+    """
+    return _fetch_user_snapshot(user_id, today or date.today())
+
+USER_SNAPSHOT_SQL = """
+    WITH phq AS (
+        SELECT start_time, completion_score, answers,
+               row_number() OVER (ORDER BY start_time DESC) AS rn
+        FROM conversations
+        WHERE user_id = %(user_id)s AND kind = 'phq9' AND completion_score IS NOT NULL
+        ORDER BY start_time DESC
+        LIMIT 2
+    )
+    SELECT p1.start_time, p1.completion_score, p1.answers, p2.completion_score,
+           e.emotion, e.date, e.probability, e.vader_compound,
+           b.log_date, b.hours_played, b.mood_score, b.solo_play_ratio,
+           b.late_night_gaming, b.physical_breaks, b.social_interaction_score,
+           ev.events
+    FROM (SELECT 1) AS anchor
+    LEFT JOIN phq p1 ON p1.rn = 1
+    LEFT JOIN phq p2 ON p2.rn = 2
+    LEFT JOIN LATERAL (
+        SELECT emotion, date, probability, vader_compound FROM emotion_logs
+        WHERE user_id = %(user_id)s ORDER BY date DESC LIMIT 1
+    ) e ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT log_date, hours_played, mood_score, solo_play_ratio, late_night_gaming,
+               physical_breaks, social_interaction_score
+        FROM behavior_logs
+        WHERE user_id = %(user_id)s ORDER BY log_date DESC LIMIT 1
+    ) b ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(json_agg(json_build_array(title, start_time) ORDER BY start_time), '[]'::json) AS events
+        FROM calendar_events
+        WHERE user_id = %(user_id)s AND start_time >= %(day_start)s AND start_time < %(day_end)s
+    ) ev ON TRUE;
+"""
+
+# SQLite has no LATERAL or json_agg; the per-table subqueries don't reference
+# the outer row, so plain joins give the same result.
+USER_SNAPSHOT_SQLITE_SQL = """
+    WITH phq AS (
+        SELECT start_time, completion_score, answers,
+               row_number() OVER (ORDER BY start_time DESC) AS rn
+        FROM conversations
+        WHERE user_id = %(user_id)s AND kind = 'phq9' AND completion_score IS NOT NULL
+        ORDER BY start_time DESC
+        LIMIT 2
+    )
+    SELECT p1.start_time, p1.completion_score, p1.answers, p2.completion_score,
+           e.emotion, e.date, e.probability, e.vader_compound,
+           b.log_date, b.hours_played, b.mood_score, b.solo_play_ratio,
+           b.late_night_gaming, b.physical_breaks, b.social_interaction_score,
+           (SELECT json_group_array(json_array(title, start_time)) FROM (
+                SELECT title, start_time FROM calendar_events
+                WHERE user_id = %(user_id)s AND start_time >= %(day_start)s AND start_time < %(day_end)s
+                ORDER BY start_time
+           )) AS events
+    FROM (SELECT 1) AS anchor
+    LEFT JOIN phq p1 ON p1.rn = 1
+    LEFT JOIN phq p2 ON p2.rn = 2
+    LEFT JOIN (
+        SELECT emotion, date, probability, vader_compound FROM emotion_logs
+        WHERE user_id = %(user_id)s ORDER BY date DESC LIMIT 1
+    ) e ON TRUE
+    LEFT JOIN (
+        SELECT log_date, hours_played, mood_score, solo_play_ratio, late_night_gaming,
+               physical_breaks, social_interaction_score
+        FROM behavior_logs
+        WHERE user_id = %(user_id)s ORDER BY log_date DESC LIMIT 1
+    ) b ON TRUE;
+"""
+
+def _snapshot_params(user_id, today):
+    start_of_day = datetime.combine(today, time.min)
+    return {"user_id": user_id, "day_start": start_of_day, "day_end": start_of_day + timedelta(days=1)}
+
+_EMPTY_SNAPSHOT = {"phq9": None, "previous_score": None, "emotion": None, "behavior": None, "todays_events": []}
+
+def _snapshot_result(row):
+    behavior_columns = ['date', 'hours_played', 'mood_score', 'solo_play_ratio',
+                        'late_night_gaming', 'physical_breaks', 'social_interaction_score']
+    return {
+        "phq9": _phq9_result(row[0], row[1], row[2]) if row[1] is not None else None,
+        "previous_score": row[3],
+        "emotion": {"emotion": row[4], "date": row[5], "probability": row[6], "vader_compound": row[7]} if row[4] is not None else None,
+        "behavior": dict(zip(behavior_columns, row[8:15])) if row[8] is not None else None,
+        "todays_events": [(title, datetime.fromisoformat(start).time()) for title, start in
+                          (json.loads(row[15]) if isinstance(row[15], str) else row[15])],
+    }
+
+@cached_reader
+@reads
+def _fetch_user_snapshot(user_id, today):
+    with db_connection() as db:
+        if db is None: return dict(_EMPTY_SNAPSHOT)
+        with db.cursor() as cursor:
+            sql = USER_SNAPSHOT_SQLITE_SQL if _dialect(db) == "sqlite" else USER_SNAPSHOT_SQL
+            cursor.execute(sql, _snapshot_params(user_id, today))
+            row = cursor.fetchone()
+    return _snapshot_result(row)
+
+# --- PHQ-9 SYMPTOM ANALYTICS ---
+# phq9_answers holds one row per question of each assessment, copied from
+# conversations.answers together with the owner and start time, so symptom
+# queries over a date range are served by its (user_id, question, answered_at) index.
+
+_PHQ9_ANSWER_ROWS = {
+    "postgres": """
+        SELECT c.id, c.user_id, c.start_time, a.question, a.answer
+        FROM conversations c
+        CROSS JOIN LATERAL unnest(c.answers) WITH ORDINALITY AS a(answer, question)
+        WHERE {scope} AND c.kind = 'phq9' AND a.question <= 9 AND a.answer BETWEEN 0 AND 3
+    """,
+    "sqlite": """
+        SELECT c.id, c.user_id, c.start_time, a.key + 1, a.value
+        FROM conversations c, json_each(c.answers) a
+        WHERE {scope} AND c.kind = 'phq9' AND a.key < 9 AND a.value BETWEEN 0 AND 3
+    """,
+}
+
+def store_phq9_answers(cursor, conversation_id=None, user_id=None):
+    """
+    Rewrites the phq9_answers rows of one conversation, or of every assessment of
+    `user_id`, from conversations.answers on an open cursor; the caller owns the
+    transaction.
+    """
+    if conversation_id is not None:
+        target, scope, params = "conversation_id = %(id)s", "c.id = %(id)s", {"id": conversation_id}
+    else:
+        target, scope, params = "user_id = %(id)s", "c.user_id = %(id)s", {"id": user_id}
+    rows = _PHQ9_ANSWER_ROWS[_dialect(cursor.connection)].format(scope=scope)
+    cursor.execute(f"DELETE FROM phq9_answers WHERE {target}", params)
+    cursor.execute(f"INSERT INTO phq9_answers (conversation_id, user_id, answered_at, question, answer) {rows}", params)
+
+def _answer_range(user_id, start, end):
+    """Query parameters for assessments taken on days in [start, end); either bound may be None."""
+    return {
+        "user_id": user_id,
+        "start": datetime.combine(start or date.min, time.min),
+        "end": datetime.combine(end or date.max, time.min),
+    }
+
+SYMPTOM_MATRIX_SQL = """
+    SELECT answered_at, conversation_id, question, answer FROM phq9_answers
+    WHERE user_id = %(user_id)s AND answered_at >= %(start)s AND answered_at < %(end)s
+    ORDER BY answered_at, conversation_id, question
+"""
+
+@cached_reader
+@reads
+def get_symptom_matrix(user_id, start=None, end=None):
+    """
+    Per-question answers (0-3) of the user's assessments taken in [start, end):
+    a DataFrame indexed by assessment time with one column per question 1-9.
+    """
+    with db_connection() as db:
+        if db is None: return pd.DataFrame()
+        with db.cursor() as cursor:
+            cursor.execute(SYMPTOM_MATRIX_SQL, _answer_range(user_id, start, end))
+            rows = cursor.fetchall()
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame(rows, columns=["answered_at", "conversation_id", "question", "answer"])
+    return df.pivot(index=["answered_at", "conversation_id"], columns="question", values="answer").droplevel("conversation_id")
+
+QUESTION_TRENDS_SQL = """
+    WITH ranked AS (
+        SELECT question, answer,
+               row_number() OVER (PARTITION BY question ORDER BY answered_at, conversation_id) AS from_first,
+               row_number() OVER (PARTITION BY question ORDER BY answered_at DESC, conversation_id DESC) AS from_last
+        FROM phq9_answers
+        WHERE user_id = %(user_id)s AND answered_at >= %(start)s AND answered_at < %(end)s
+    )
+    SELECT question, count(*), avg(answer),
+           max(CASE WHEN from_first = 1 THEN answer END),
+           max(CASE WHEN from_last = 1 THEN answer END),
+           sum(CASE WHEN answer > 0 THEN 1 ELSE 0 END)
+    FROM ranked
+    GROUP BY question
+    ORDER BY question
+"""
+
+@cached_reader
+@reads
+def get_question_trends(user_id, start=None, end=None):
+    """
+    One row per question over the assessments taken in [start, end): assessments
+    answered, mean answer, first and latest answer, their change (negative is an
+    improvement) and how often the symptom was present at all (answer > 0).
+    """
+    columns = ["question", "assessments", "mean_answer", "first_answer", "latest_answer", "present"]
+    with db_connection() as db:
+        if db is None: return pd.DataFrame(columns=columns + ["change"])
+        with db.cursor() as cursor:
+            cursor.execute(QUESTION_TRENDS_SQL, _answer_range(user_id, start, end))
+            rows = cursor.fetchall()
+    df = pd.DataFrame(rows, columns=columns)
+    df["mean_answer"] = df["mean_answer"].astype(float)
+    df["change"] = df["latest_answer"] - df["first_answer"]
+    return df
+
+def get_symptom_changes(user_id, start=None, end=None, limit=3):
+    """
+    The most improved and most worsened questions between the first and latest
+    assessment in [start, end), as two lists of (question, change); questions
+    that did not move are left out.
+    """
+    trends = get_question_trends(user_id, start, end)
+    trends = trends[trends["assessments"] > 1]
+    improved = trends[trends["change"] < 0].sort_values(["change", "question"])
+    worsened = trends[trends["change"] > 0].sort_values(["change", "question"], ascending=[False, True])
+    as_pairs = lambda df: [(int(q), int(c)) for q, c in zip(df["question"], df["change"])][:limit]
+    return as_pairs(improved), as_pairs(worsened)
+
+SELF_HARM_SQL = """
+    SELECT count(*),
+           sum(CASE WHEN answer > 0 THEN 1 ELSE 0 END),
+           sum(CASE WHEN answer >= 2 THEN 1 ELSE 0 END),
+           max(CASE WHEN answer > 0 THEN answered_at END)
+    FROM phq9_answers
+    WHERE user_id = %(user_id)s AND question = 9 AND answered_at >= %(start)s AND answered_at < %(end)s
+"""
+
+@cached_reader
+@reads
+def get_self_harm_frequency(user_id, start=None, end=None):
+    """
+    How often question 9 (thoughts of self-harm) was answered above 0 in the
+    assessments taken in [start, end), with the count of answers of 2 or more
+    and the time of the latest positive answer.
+    """
+    with db_connection() as db:
+        if db is None: return None
+        with db.cursor() as cursor:
+            cursor.execute(SELF_HARM_SQL, _answer_range(user_id, start, end))
+            total, positive, frequent, last_positive = cursor.fetchone()
+    positive = positive or 0
+    if isinstance(last_positive, str):  # SQLite doesn't type aggregate results
+        last_positive = datetime.fromisoformat(last_positive)
+    return {
+        "assessments": total, "positive": positive, "frequent": frequent or 0,
+        "rate": positive / total if total else 0.0, "last_positive": last_positive,
+    }
+
+# --- EMOTION LOGS ---
+LATEST_EMOTION_SQL = "SELECT emotion, date, probability, vader_compound FROM emotion_logs WHERE user_id = %s ORDER BY date DESC LIMIT 1;"
+
+def _emotion_result(row):
+    return {"emotion": row[0], "date": row[1], "probability": row[2], "vader_compound": row[3]} if row else None
+
+@cached_reader
+@reads
+def get_latest_emotion(user_id):
+    with db_connection() as db:
+        if db is None: return None
+        with db.cursor() as cursor:
+            cursor.execute(LATEST_EMOTION_SQL, (user_id,))
+            row = cursor.fetchone()
+    return _emotion_result(row)
+
+@writes
+def save_emotion_log(user_id, date, emotion, probability, vader_compound):
+    return _submit_write("save_emotion_log", user_id, date, emotion, probability, vader_compound)
+
+def _apply_emotion_log(cursor, user_id, date, emotion, probability, vader_compound):
+    sql = "INSERT INTO emotion_logs (user_id, date, emotion, probability, vader_compound) VALUES (%s, %s, %s, %s, %s) ON CONFLICT (user_id, date) DO UPDATE SET emotion = EXCLUDED.emotion, probability = EXCLUDED.probability, vader_compound = EXCLUDED.vader_compound;"
+    cursor.execute(sql, (user_id, date, emotion, probability, vader_compound))
+    cursor.execute(_TALLY_ADD_SQL, _tally(user_id, date, "live", emotion, 1, *_vader_totals(vader_compound)))
+    _refresh_rollup_day(cursor, user_id, "emotion", date)
+    return user_id
+
+EMOTION_HISTORY_SQL = "SELECT date, emotion, probability, vader_compound FROM emotion_logs WHERE user_id = %s AND date >= %s AND date < %s ORDER BY date ASC"
 
-def update_conversation_score(conversation_id, score):
-    sql = "UPDATE conversations SET completion_score = %s WHERE id = %s"
-    conn = None
+@reads
+def get_emotion_history(user_id, start=None, end=None):
+    """The user's emotion logs for days in [start, end), oldest first; either bound may be None."""
+    with db_connection() as db:
+        if db is None: return []
+        history = pd.read_sql(EMOTION_HISTORY_SQL, db, params=(user_id, start or date.min, end or date.max))
+    return history.to_dict('records')
+
+@writes
+def save_emotion_days(user_id, days, source="chat"):
+    """
+    Saves many analyses at once (e.g. an uploaded chat log) in one transaction
+    instead of one save_emotion_log call each. `days` has one dict per day:
+    the day's last analysis (date, emotion, probability, vader_compound) plus
+    the totals of all of that day's analyses (emotion_counts, vader_n,
+    vader_sum, vader_sumsq), which become the user's `source` tallies. Saving
+    under the same `source` again (e.g. "chat:" and the log's digest) replaces
+    what it saved before instead of counting the analyses twice.
+    Returns the number of days written, or None if it was rolled back.
+    """
+    rows = _ingest_rows("emotion_logs", [dict(d, user_id=user_id) for d in days])
+    if not rows:
+        return 0
+    tallies = [tally for d in days for tally in _day_tallies(user_id, source, d)]
     try:
-        conn = connect_db()
-        if not conn: return False
-        with conn.cursor() as cursor:
-            cursor.execute(sql, (score, conversation_id))
-        conn.commit()
-        return True
+        with db_connection() as db:
+            if db is None: return None
+            with db.cursor() as cursor:
+                cursor.execute("SELECT DISTINCT day FROM emotion_tallies WHERE user_id = %s AND source = %s", (user_id, source))
+                touched = [row[0] for row in cursor.fetchall()] + [tally["day"] for tally in tallies]
+                cursor.execute("DELETE FROM emotion_tallies WHERE user_id = %s AND source = %s", (user_id, source))
+                _ingest(cursor, "emotion_logs", rows)
+                _execute_many(cursor, _TALLY_ADD_SQL, tallies)
+                refresh_daily_metrics(cursor, user_id, ("emotion",), min(touched), max(touched) + timedelta(days=1))
+            db.commit()
     except Exception as e:
-        print(f"Error updating score: {e}")
-        if conn: conn.rollback()
-        return False
-    finally:
-        if conn: conn.close()
+        print(f"Error saving {len(rows)} emotion days for user {user_id}: {e}")
+        return None
+    _invalidate(user_id, EMOTION_READERS)
+    return len(rows)
 
+# --- CALENDAR & EVENTS ---
+CLEAR_GENERATED_EVENTS_SQL = "DELETE FROM calendar_events WHERE user_id = %s AND is_generated = TRUE"
 
+@writes
 def save_calendar_events(user_id, events_to_save, is_generated):
-    conn = None
-    try:
-        conn = connect_db()
-        if not conn: return False
-        with conn.cursor() as cursor:
+    rows = [(user_id, e['title'], e['start'], e['end'], e.get('color', '#6f42c1'), is_generated) for e in events_to_save]
+    with db_connection() as db:
+        if db is None: return False
+        with db.cursor() as cursor:
             if is_generated:
-                cursor.execute("DELETE FROM calendar_events WHERE user_id = %s AND is_generated = TRUE", (user_id,))
-            sql_insert = """
-                INSERT INTO calendar_events (user_id, title, start_time, end_time, color, is_generated)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            data_to_insert = [
-                (user_id, event['title'], event['start'], event['end'], event.get('color', '#6f42c1'), is_generated) 
-                for event in events_to_save
-            ]
-            psycopg2.extras.execute_batch(cursor, sql_insert, data_to_insert)
-        conn.commit()
-        return True
-    except Exception as e:
-        st.error(f"DB error in save_calendar_events: {e}")
-        if conn: conn.rollback()
-        return False
-    finally:
-        if conn: conn.close()
+                cursor.execute(CLEAR_GENERATED_EVENTS_SQL, (user_id,))
+            if rows:
+                _ingest(cursor, "calendar_events", rows)
+            db.commit()
+    _invalidate(user_id, CALENDAR_READERS)
+    return True
 
-def get_calendar_events(user_id):
-    """Fetches all calendar events, now including completion and mood status."""
-    sql = "SELECT id, title, start_time, end_time, color, is_generated, completed, user_mood FROM calendar_events WHERE user_id = %s"
-    events = []
-    with closing(connect_db()) as db:
-        if db is None: return []
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id,))
-            for row in cursor.fetchall():
-                events.append({
-                    "id": str(row[0]), "title": row[1], "start": row[2].isoformat(),
-                    "end": row[3].isoformat(), "color": row[4], "is_generated": row[5],
-                    "completed": row[6], "user_mood": row[7]
-                })
+CALENDAR_PAGE_SIZE = 500
+# {conditions} is user_id = %s plus whichever bounds a page has.
+CALENDAR_PAGE_SQL = (
+    "SELECT id, title, start_time, end_time, color, is_generated, completed, user_mood FROM calendar_events "
+    "WHERE {conditions} ORDER BY start_time, id LIMIT %s"
+)
+
+@reads
+def get_calendar_events_page(user_id, start=None, end=None, after=None, limit=CALENDAR_PAGE_SIZE, include_generated=True):
+    """
+    Fetches one page of a user's events starting in [start, end), ordered by
+    (start_time, id). `after` is the cursor returned by the previous page.
+    Returns (events, next_cursor); next_cursor is None on the last page.
+    """
+    conditions = ["user_id = %s"]
+    params = [user_id]
+    if start is not None:
+        conditions.append("start_time >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append("start_time < %s")
+        params.append(end)
+    if not include_generated:
+        conditions.append("NOT is_generated")
+    if after is not None:
+        conditions.append("(start_time, id) > (%s, %s)")
+        params.extend(after)
+    sql = CALENDAR_PAGE_SQL.format(conditions=" AND ".join(conditions))
+    params.append(limit + 1)
+    with db_connection() as db:
+        if db is None: return [], None
+        with db.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][2], rows[-1][0])
+    events = [{"id": str(row[0]), "title": row[1], "start": row[2].isoformat(), "end": row[3].isoformat(), "color": row[4], "is_generated": row[5], "completed": row[6], "user_mood": row[7]} for row in rows]
+    return events, next_cursor
+
+@cached_reader
+@reads
+def get_calendar_events(user_id, start=None, end=None, include_generated=True):
+    """
+    Fetches a user's events starting in [start, end) (either bound may be None),
+    walking keyset pages so no single query returns an unbounded result.
+    """
+    events, cursor = get_calendar_events_page(user_id, start, end, include_generated=include_generated)
+    while cursor is not None:
+        page, cursor = get_calendar_events_page(user_id, start, end, after=cursor, include_generated=include_generated)
+        events.extend(page)
     return events
 
-def update_calendar_event_completion(event_id, completed, user_mood):
-    """Updates the completion status and mood for a specific event."""
-    sql = "UPDATE calendar_events SET completed = %s, user_mood = %s WHERE id = %s"
-    with closing(connect_db()) as db:
-        if db is None: return False
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (completed, user_mood, event_id))
-        db.commit()
-        return True
+TODAYS_EVENTS_SQL = "SELECT title, start_time FROM calendar_events WHERE user_id = %s AND start_time >= %s AND start_time < %s ORDER BY start_time ASC;"
+
+@reads
+def get_todays_events(user_id, today_date):
+    start_of_day = datetime.combine(today_date, time.min)
+    end_of_day = start_of_day + timedelta(days=1)
+    try:
+        with db_connection() as db:
+            if db is None: return []
+            with db.cursor() as cursor:
+                cursor.execute(TODAYS_EVENTS_SQL, (user_id, start_of_day, end_of_day))
+                events = []
+                for title, start_timestamp in cursor.fetchall():
+                    events.append((title, start_timestamp.time()))
+                return events
+    except Exception as e:
+        print(f"Error fetching today's events for user {user_id}: {e}")
+        return []
+
+LAST_WEEK_EVENTS_SQL = "SELECT title, completed, user_mood FROM calendar_events WHERE user_id = %s AND start_time >= %s"
 
+@reads
 def get_events_for_last_week(user_id):
     """Fetches completed and skipped events from the past 7 days for the weekly review."""
     seven_days_ago = datetime.now() - timedelta(days=7)
-    sql = "SELECT title, completed, user_mood FROM calendar_events WHERE user_id = %s AND start_time >= %s"
-    with closing(connect_db()) as db:
+    with db_connection() as db:
         if db is None: return []
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id, seven_days_ago))
+        with db.cursor() as cursor:
+            cursor.execute(LAST_WEEK_EVENTS_SQL, (user_id, seven_days_ago))
             return cursor.fetchall()
 
-def delete_calendar_event(event_id):
-    sql = "DELETE FROM calendar_events WHERE id = %s"
-    conn = None
-    try:
-        conn = connect_db()
-        if not conn: return False
-        with conn.cursor() as cursor:
-            cursor.execute(sql, (event_id,))
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error deleting event: {e}")
-        if conn: conn.rollback()
-        return False
-    finally:
-        if conn: conn.close()
+@writes
+def update_calendar_event_completion(event_id, completed, user_mood):
+    """Updates the completion status and mood for a specific event."""
+    return _submit_write("update_calendar_event_completion", event_id, completed, user_mood)
 
-# In database.py, REPLACE the old function with this one.
+def _apply_event_completion(cursor, event_id, completed, user_mood):
+    sql = "UPDATE calendar_events SET completed = %s, user_mood = %s WHERE id = %s RETURNING user_id"
+    cursor.execute(sql, (completed, user_mood, event_id))
+    row = cursor.fetchone()
+    return row[0] if row else None
 
+@writes
 def update_calendar_event(event_id, new_date, new_start_time, new_end_time):
     """Updates the start and end times of an existing event."""
     final_start_time = new_start_time if new_start_time is not None else time(0, 0)
@@ -296,412 +1282,537 @@ def update_calendar_event(event_id, new_date, new_start_time, new_end_time):
         UPDATE calendar_events
         SET start_time = %s, end_time = %s
         WHERE id = %s
+        RETURNING user_id
     """
-    conn = None
     try:
-        conn = connect_db()
-        if not conn: return False
-        with conn.cursor() as cursor:
-            cursor.execute(sql, (new_start_timestamp, new_end_timestamp, event_id))
-        conn.commit()
+        with db_connection() as db:
+            if db is None: return False
+            with db.cursor() as cursor:
+                cursor.execute(sql, (new_start_timestamp, new_end_timestamp, event_id))
+                row = cursor.fetchone()
+            db.commit()
+        if row: _invalidate(row[0], CALENDAR_READERS)
         return True
     except Exception as e:
         print(f"Error updating event {event_id}: {e}")
-        if conn: conn.rollback()
         return False
-    finally:
-        if conn: conn.close()
 
-def clear_all_events(user_id):
-    """Deletes all calendar events for a specific user."""
-    sql = "DELETE FROM calendar_events WHERE user_id = %s"
-    conn = None
+@writes
+def delete_calendar_event(event_id):
+    sql = "DELETE FROM calendar_events WHERE id = %s RETURNING user_id"
     try:
-        conn = connect_db()
-        if not conn: return False
-        with conn.cursor() as cursor:
-            cursor.execute(sql, (user_id,))
-        conn.commit()
+        with db_connection() as db:
+            if db is None: return False
+            with db.cursor() as cursor:
+                cursor.execute(sql, (event_id,))
+                row = cursor.fetchone()
+            db.commit()
+        if row: _invalidate(row[0], CALENDAR_READERS)
         return True
     except Exception as e:
-        print(f"Error clearing all events for user {user_id}: {e}")
-        if conn: conn.rollback()
+        print(f"Error deleting event: {e}")
         return False
-    finally:
-        if conn: conn.close()
 
-# def get_latest_assessment_score(user_id):
-#     sql = "SELECT completion_score FROM conversations WHERE user_id = %s AND completion_score IS NOT NULL ORDER BY start_time DESC LIMIT 1"
-#     with closing(connect_db()) as db, closing(db.cursor()) as cursor:
-#         if db is None: return None
-#         cursor.execute(sql, (user_id,))
-#         result = cursor.fetchone()
-#         return result[0] if result else None
+def clear_all_events(user_id):
+    """Deletes all calendar events for a specific user."""
+    return bulk_delete_user_data(user_id, ["calendar_events"]) is not None
 
+# --- DATA EXPORT ---
+@reads
+def export_user_data(user_id, fmt="csv"):
+    """
+    Streams the account's data into a ZIP in a temporary file (see db_export) and
+    returns its path, or None on failure. The caller deletes the file when done.
+    """
+    path = None
+    try:
+        with db_connection() as db:
+            if db is None: return None
+            with tempfile.NamedTemporaryFile(prefix=f"account-{user_id}-", suffix=".zip", delete=False) as f:
+                path = f.name
+                write_user_export(db, user_id, f, fmt)
+        return path
+    except Exception as e:
+        print(f"Error exporting data for user {user_id}: {e}")
+        if path is not None:
+            os.remove(path)
+        return None
 
+# --- BULK DELETION ---
+_ASSESSMENT_FILTER = "user_id = %s AND kind = 'phq9'"
 
-        
-def update_conversation_answers(conversation_id, answers):
-    sql = "UPDATE conversations SET answers = %s WHERE id = %s"
-    with closing(connect_db()) as db:
-        if db is None: return
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (answers, conversation_id))
-        db.commit()
+# Each target maps to the set-based statements it runs, one per table. chat_history
+# rows are deleted explicitly (rather than left to ON DELETE CASCADE) so they can be counted.
+BULK_DELETE_TARGETS = {
+    "assessments": [
+        ("chat_history", f"DELETE FROM chat_history WHERE conversation_id IN (SELECT id FROM conversations WHERE {_ASSESSMENT_FILTER})"),
+        ("conversations", f"DELETE FROM conversations WHERE {_ASSESSMENT_FILTER}"),
+    ],
+    "conversations": [
+        ("chat_history", "DELETE FROM chat_history WHERE conversation_id IN (SELECT id FROM conversations WHERE user_id = %s)"),
+        ("conversations", "DELETE FROM conversations WHERE user_id = %s"),
+    ],
+    "calendar_events": [("calendar_events", "DELETE FROM calendar_events WHERE user_id = %s")],
+    "emotion_logs": [
+        ("emotion_logs", "DELETE FROM emotion_logs WHERE user_id = %s"),
+        ("emotion_tallies", "DELETE FROM emotion_tallies WHERE user_id = %s"),
+    ],
+    "behavior_logs": [("behavior_logs", "DELETE FROM behavior_logs WHERE user_id = %s")],
+}
 
-def get_latest_assessment_answers(user_id):
-    sql = "SELECT answers FROM conversations WHERE user_id = %s AND answers IS NOT NULL ORDER BY start_time DESC LIMIT 1;"
-    with closing(connect_db()) as db:
-        if db is None: return None
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id,))
-            result = cursor.fetchone()
-            return result[0] if result else None
-        
-# Add this new function to your database.py file
+# Rollup columns recomputed after each target is deleted.
+BULK_DELETE_ROLLUPS = {
+    "assessments": ("phq9",),
+    "conversations": ("phq9",),
+    "emotion_logs": ("emotion",),
+    "behavior_logs": ("behavior",),
+}
 
-def get_score_trend(user_id):
-    """Fetches the last two completed assessment scores to determine a trend."""
-    sql = """
-        SELECT completion_score 
-        FROM conversations 
-        WHERE user_id = %s 
-          AND completion_score IS NOT NULL 
-          AND title LIKE 'PHQ-9 Assessment%%'
-        ORDER BY start_time DESC
-        LIMIT 2;
-    """
-    with closing(connect_db()) as db:
-        if db is None: return (None, None)
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id,))
-            scores = [row[0] for row in cursor.fetchall()]
-            if len(scores) == 2:
-                # Returns (latest_score, previous_score)
-                return (scores[0], scores[1])
-            elif len(scores) == 1:
-                # Returns (latest_score, None) if only one score exists
-                return (scores[0], None)
-            else:
-                return (None, None)
-            
-# In database.py, REPLACE the old function with this one.
+BULK_DELETE_READERS = {
+    "assessments": PHQ9_READERS,
+    "conversations": PHQ9_READERS,
+    "calendar_events": CALENDAR_READERS,
+    "emotion_logs": EMOTION_READERS,
+    "behavior_logs": BEHAVIOR_READERS,
+}
 
-def get_todays_events(user_id, today_date):
+@writes
+def bulk_delete_user_data(user_id, targets):
     """
-    Fetches all calendar events for a user for a specific date by checking
-    if the start_time falls within that day.
-    """
-    # The start of today is the date itself (e.g., '2025-07-16 00:00:00')
-    start_of_day = today_date
-    # The end of today is 24 hours after the start
-    end_of_day = today_date + timedelta(days=1)
-
-    # This query correctly uses the start_time column.
-    sql = """
-        SELECT title, start_time
-        FROM calendar_events
-        WHERE user_id = %s 
-          AND start_time >= %s 
-          AND start_time < %s
-        ORDER BY start_time ASC;
+    Deletes a user's rows for each of `targets` (keys of BULK_DELETE_TARGETS) in a
+    single transaction, one statement per table. Returns a dict of table -> rows
+    deleted, or None if the transaction was rolled back.
     """
+    unknown = [t for t in targets if t not in BULK_DELETE_TARGETS]
+    if unknown:
+        raise ValueError(f"Unknown bulk delete target(s): {', '.join(unknown)}")
+    counts = {}
     try:
-        with closing(connect_db()) as db:
-            if db is None: return []
-            with closing(db.cursor()) as cursor:
-                # We pass the start_of_day and end_of_day as parameters
-                cursor.execute(sql, (user_id, start_of_day, end_of_day))
-                # The result is a list of tuples, e.g., [('Yoga', datetime.time(9, 0))]
-                # We need to extract just the time part for display.
-                events = []
-                for title, start_timestamp in cursor.fetchall():
-                    # The database returns a full datetime object, we extract the time.
-                    events.append((title, start_timestamp.time()))
-                return events
+        with db_connection() as db:
+            if db is None: return None
+            with db.cursor() as cursor:
+                for target in targets:
+                    for table, sql in BULK_DELETE_TARGETS[target]:
+                        cursor.execute(sql, (user_id,))
+                        counts[table] = counts.get(table, 0) + cursor.rowcount
+                kinds = {kind for target in targets for kind in BULK_DELETE_ROLLUPS.get(target, ())}
+                if kinds:
+                    refresh_daily_metrics(cursor, user_id, sorted(kinds))
+            db.commit()
+        for target in targets:
+            _invalidate(user_id, BULK_DELETE_READERS[target])
+        return counts
     except Exception as e:
-        print(f"Error fetching today's events for user {user_id}: {e}")
-        return []
-    
-def clear_all_assessments(user_id):
-    """
-    Finds all conversations that are PHQ-9 assessments for a user and deletes them.
-    """
-    try:
-        # Get all conversations for the user
-        all_conversations = get_user_conversations(user_id)
-        
-        # Filter to find only the assessment conversations
-        assessment_ids_to_delete = [
-            conv['id'] for conv in all_conversations 
-            if conv.get('title', '').startswith("PHQ-9 Assessment")
-        ]
-        
-        if not assessment_ids_to_delete:
-            print(f"No assessments to clear for user_id {user_id}")
-            return True # Nothing to do, so it's a success
-
-        # Loop through and delete each assessment
-        # This reuses the existing delete_conversation logic, which is good practice
-        for conv_id in assessment_ids_to_delete:
-            delete_conversation(conv_id)
-            
-        print(f"Successfully cleared {len(assessment_ids_to_delete)} assessments for user_id {user_id}")
-        return True
+        print(f"Error bulk deleting {targets} for user {user_id}: {e}")
+        return None
 
-    except Exception as e:
-        print(f"An error occurred while clearing all assessments for user {user_id}: {e}")
-        return False
 
+# --- BULK INGEST ---
+# Batches up to this many rows go out as one multi-row INSERT; larger ones are
+# streamed with COPY into a temporary staging table and merged from there.
+COPY_THRESHOLD = 1000
 
+# table -> (columns, conflict key, readers to invalidate). calendar_events has no
+# natural key, so its rows are always inserted.
+INGEST_TABLES = {
+    "calendar_events": (
+        ("user_id", "title", "start_time", "end_time", "color", "is_generated"),
+        None, CALENDAR_READERS,
+    ),
+    "behavior_logs": (
+        ("user_id", "log_date", "hours_played", "mood_score", "solo_play_ratio", "late_night_gaming", "physical_breaks", "social_interaction_score"),
+        ("user_id", "log_date"), BEHAVIOR_READERS,
+    ),
+    "emotion_logs": (
+        ("user_id", "date", "emotion", "probability", "vader_compound"),
+        ("user_id", "date"), EMOTION_READERS,
+    ),
+}
 
-import streamlit as st
-import psycopg2
-import psycopg2.extras
-from contextlib import closing
-import pandas as pd
-from datetime import datetime, timedelta, date, time
+def _ingest_rows(table, rows):
+    """Normalises a DataFrame or a list of dicts/tuples to tuples in INGEST_TABLES column order."""
+    columns, key, _ = INGEST_TABLES[table]
+    if isinstance(rows, pd.DataFrame):
+        missing = [c for c in columns if c not in rows.columns]
+        if missing:
+            raise ValueError(f"Missing column(s) for {table}: {', '.join(missing)}")
+        frame = rows[list(columns)].astype(object)
+        rows = list(frame.where(pd.notna(frame), None).itertuples(index=False, name=None))
+    else:
+        rows = [tuple(r.get(c) for c in columns) if isinstance(r, dict) else tuple(r) for r in rows]
+    if key is None:
+        return rows
+    # ON CONFLICT DO UPDATE can't touch the same row twice in one statement, so the last row per key wins.
+    positions = [columns.index(c) for c in key]
+    latest = {}
+    for row in rows:
+        latest[tuple(row[i] for i in positions)] = row
+    return list(latest.values())
 
-# --- DATABASE CONNECTION ---
-def connect_db():
-    """Connects to the PostgreSQL database using credentials from st.secrets."""
-    try:
-        conn = psycopg2.connect(
-            host=st.secrets.database.host,
-            port=st.secrets.database.port,
-            dbname=st.secrets.database.dbname,
-            user=st.secrets.database.user,
-            password=st.secrets.database.password
+def _upsert_clause(table):
+    columns, key, _ = INGEST_TABLES[table]
+    if key is None:
+        return ""
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in key)
+    return f" ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}"
+
+def _merge_sql(table, source):
+    """INSERT ... `source` with the table's upsert clause, reduced to (inserted, updated) counts."""
+    columns = INGEST_TABLES[table][0]
+    conflict = _upsert_clause(table)
+    # xmax is 0 on a freshly inserted row version and set on one written by DO UPDATE.
+    return f"""
+        WITH merged AS (
+            INSERT INTO {table} ({', '.join(columns)}) {source}{conflict}
+            RETURNING (xmax = 0) AS inserted
         )
-        return conn
-    except psycopg2.OperationalError as e:
-        st.error(f"Database connection failed: {e}")
-        return None
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+    """
 
-# --- USER MANAGEMENT ---
-def add_password_user(email, username, hashed_password):
-    sql = "INSERT INTO users (email, username, full_name, hashed_password) VALUES (%s, %s, %s, %s)"
-    with closing(connect_db()) as db:
-        if db is None: return False
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (email, username, username, hashed_password))
-            db.commit()
-    return True
+def _csv_buffer(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow("\\N" if value is None else value for value in row)
+    buffer.seek(0)
+    return buffer
 
-def get_user_by_email(email):
-    sql = "SELECT id, email, username, full_name, hashed_password FROM users WHERE email = %s"
+def _ingest(cursor, table, rows, method="auto"):
+    """Writes normalised `rows` on an open cursor; the caller owns the transaction."""
+    if _dialect(cursor.connection) == "sqlite":
+        return _ingest_sqlite(cursor, table, rows)
+    columns = ", ".join(INGEST_TABLES[table][0])
+    if method == "auto":
+        method = "copy" if len(rows) > COPY_THRESHOLD else "values"
+    if method == "values":
+        counts = psycopg2.extras.execute_values(cursor, _merge_sql(table, "VALUES %s"), rows, page_size=len(rows), fetch=True)[0]
+    elif method == "copy":
+        stage = f"ingest_{table}"
+        cursor.execute(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA")
+        cursor.copy_expert(f"COPY {stage} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", _csv_buffer(rows))
+        cursor.execute(_merge_sql(table, f"SELECT {columns} FROM {stage}"))
+        counts = cursor.fetchone()
+    else:
+        raise ValueError(f"Unknown ingest method: {method}")
+    return {"inserted": counts[0], "updated": counts[1]}
+
+def _ingest_sqlite(cursor, table, rows):
+    """SQLite has no COPY or xmax: stage the rows, count keys that already exist, then upsert."""
+    columns, key, _ = INGEST_TABLES[table]
+    names = ", ".join(columns)
+    insert = f"INSERT INTO {{}} ({names}) VALUES ({', '.join(['%s'] * len(columns))})"
+    if key is None:
+        cursor.executemany(insert.format(table), rows)
+        return {"inserted": len(rows), "updated": 0}
+    stage = f"ingest_{table}"
+    cursor.execute(f"CREATE TEMP TABLE {stage} AS SELECT {names} FROM {table} WHERE 0")
     try:
-        with closing(connect_db()) as db:
+        cursor.executemany(insert.format(stage), rows)
+        cursor.execute(f"SELECT count(*) FROM {stage} s JOIN {table} t ON " + " AND ".join(f"s.{c} = t.{c}" for c in key))
+        updated = cursor.fetchone()[0]
+        # WHERE true stops SQLite from reading ON CONFLICT as part of the SELECT.
+        cursor.execute(f"INSERT INTO {table} ({names}) SELECT {names} FROM {stage} WHERE true{_upsert_clause(table)}")
+    finally:
+        cursor.execute(f"DROP TABLE {stage}")
+    return {"inserted": len(rows) - updated, "updated": updated}
+
+@writes
+def bulk_ingest(table, rows, method="auto"):
+    """
+    Writes many rows to `table` (a key of INGEST_TABLES) in one transaction, e.g.
+    for backfills and imports. `rows` is a DataFrame or a list of dicts/tuples
+    with the table's INGEST_TABLES columns. `method` is "values" (one multi-row
+    INSERT), "copy" (COPY into a staging table, then merge) or "auto".
+    Returns {"inserted": n, "updated": m}, or None if it was rolled back.
+    """
+    if table not in INGEST_TABLES:
+        raise ValueError(f"Unknown ingest table: {table}")
+    rows = _ingest_rows(table, rows)
+    if not rows:
+        return {"inserted": 0, "updated": 0}
+    try:
+        with db_connection() as db:
             if db is None: return None
-            with closing(db.cursor()) as cursor:
-                cursor.execute(sql, (email,))
-                user_data = cursor.fetchone()
-                if user_data:
-                    columns = ['id', 'email', 'username', 'full_name', 'hashed_password']
-                    return dict(zip(columns, user_data))
-                return None
+            with db.cursor() as cursor:
+                counts = _ingest(cursor, table, rows, method)
+                if table in INGEST_SOURCES:
+                    INGEST_SOURCES[table](cursor, rows)
+                if table in INGEST_ROLLUPS:
+                    _refresh_ingested_days(cursor, INGEST_ROLLUPS[table], rows)
+            db.commit()
     except Exception as e:
-        print(f"Error getting user by email: {e}")
+        print(f"Error bulk ingesting {len(rows)} rows into {table}: {e}")
         return None
+    for user_id in {row[0] for row in rows}:
+        _invalidate(user_id, INGEST_TABLES[table][2])
+    return counts
 
-# --- CONVERSATION & ASSESSMENT ---
-def create_conversation(user_id, title="New Chat"):
-    sql = "INSERT INTO conversations (user_id, title) VALUES (%s, %s) RETURNING id"
-    with closing(connect_db()) as db:
-        if db is None: return None
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id, title))
-            new_id = cursor.fetchone()[0]
-            db.commit()
-    return new_id
 
-def get_user_conversations(user_id):
-    sql = "SELECT id, title, completion_score, video_url FROM conversations WHERE user_id = %s ORDER BY start_time DESC"
-    with closing(connect_db()) as db:
-        if db is None: return []
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id,))
-            # fetchall() is safe to call even with 0 results, it will return []
-            conversations = [{"id": row[0], "title": row[1], "completion_score": row[2], "video_url": row[3]} for row in cursor.fetchall()]
-    return conversations
+# --- DAILY ROLLUP ---
+# daily_user_metrics keeps one row per user per day for the dashboards. Writers
+# update it in their own transaction by recomputing the affected days from the
+# source rows: conversations for PHQ-9, behavior_logs for behaviour and, since
+# emotion_logs only keeps a day's last analysis, emotion_tallies for emotions.
+# A tally counts the analyses of one emotion per user, day and source ("live"
+# for save_emotion_log, "ingest" for bulk_ingest, "chat:<digest>" per chat log
+# saved with save_emotion_days),
+# with their VADER count, sum and sum of squares, so a day's VADER mean and
+# variance survive any rebuild.
 
-def update_conversation_score(conversation_id, score):
-    sql = "UPDATE conversations SET completion_score = %s WHERE id = %s"
-    with closing(connect_db()) as db:
-        if db is None: return
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (score, conversation_id))
-            db.commit()
+# The behavioural part of the Behaviour Tracker risk score (0-13); the page adds
+# the PHQ-9 component for the user's latest assessment. migrations.py backfills
+# with the same expression.
+BEHAVIOR_RISK_SQL = """(
+    CASE WHEN hours_played > 6 THEN 3 WHEN hours_played > 4 THEN 1 ELSE 0 END
+    + CASE WHEN mood_score < -0.5 THEN 4 WHEN mood_score < 0 THEN 2 ELSE 0 END
+    + CASE WHEN solo_play_ratio > 0.8 THEN 2 ELSE 0 END
+    + CASE WHEN late_night_gaming THEN 1 ELSE 0 END
+    + CASE WHEN physical_breaks < 1 THEN 1 ELSE 0 END
+    + CASE WHEN social_interaction_score < 3 THEN 2 ELSE 0 END
+)"""
 
-def delete_conversation(conversation_id):
-    sql = "DELETE FROM conversations WHERE id = %s"
-    with closing(connect_db()) as db:
-        if db is None: return False
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (conversation_id,))
-            db.commit()
-        return True
+ROLLUP_KINDS = ("phq9", "behavior", "emotion")
 
-def clear_all_assessments(user_id):
-    sql = "DELETE FROM conversations WHERE user_id = %s AND title LIKE 'PHQ-9 Assessment%%'"
-    with closing(connect_db()) as db:
-        if db is None: return False
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id,))
-            db.commit()
-        return True
+_ROLLUP_RANGE = "user_id = %(user_id)s AND day >= %(start)s AND day < %(end)s"
 
-# --- BEHAVIOUR LOGS ---
-def save_behavior_log(user_id, date, hours_played, mood_score, solo_play_ratio, late_night_gaming, physical_breaks, social_interaction_score):
-    sql = """
-    INSERT INTO behavior_logs (user_id, log_date, hours_played, mood_score, solo_play_ratio, late_night_gaming, physical_breaks, social_interaction_score) 
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (user_id, log_date) DO UPDATE SET
-        hours_played = EXCLUDED.hours_played, mood_score = EXCLUDED.mood_score, solo_play_ratio = EXCLUDED.solo_play_ratio,
-        late_night_gaming = EXCLUDED.late_night_gaming, physical_breaks = EXCLUDED.physical_breaks, social_interaction_score = EXCLUDED.social_interaction_score;
+def _rollup_statements(json_agg, day_of):
+    """kind -> (reset, fill) statements recomputing the kind's columns for a user and date range."""
+    return {
+        "phq9": (
+            f"UPDATE daily_user_metrics SET phq9_score = NULL, assessments = 0 WHERE {_ROLLUP_RANGE}",
+            f"""
+            INSERT INTO daily_user_metrics (user_id, day, phq9_score, assessments)
+            SELECT user_id, day, completion_score, n FROM (
+                SELECT user_id, {day_of} AS day, completion_score,
+                       count(*) OVER (PARTITION BY {day_of}) AS n,
+                       row_number() OVER (PARTITION BY {day_of} ORDER BY start_time DESC) AS rn
+                FROM conversations
+                WHERE user_id = %(user_id)s AND kind = 'phq9' AND completion_score IS NOT NULL
+                  AND start_time >= %(start_ts)s AND start_time < %(end_ts)s
+            ) latest
+            WHERE rn = 1
+            ON CONFLICT (user_id, day) DO UPDATE SET phq9_score = EXCLUDED.phq9_score, assessments = EXCLUDED.assessments
+            """,
+        ),
+        "behavior": (
+            f"UPDATE daily_user_metrics SET risk_score = NULL, mood_score = NULL, hours_played = NULL WHERE {_ROLLUP_RANGE}",
+            f"""
+            INSERT INTO daily_user_metrics (user_id, day, risk_score, mood_score, hours_played)
+            SELECT user_id, log_date, {BEHAVIOR_RISK_SQL}, mood_score, hours_played
+            FROM behavior_logs
+            WHERE user_id = %(user_id)s AND log_date >= %(start)s AND log_date < %(end)s
+            ON CONFLICT (user_id, day) DO UPDATE SET
+                risk_score = EXCLUDED.risk_score, mood_score = EXCLUDED.mood_score, hours_played = EXCLUDED.hours_played
+            """,
+        ),
+        "emotion": (
+            f"UPDATE daily_user_metrics SET emotion_counts = '{{}}', vader_n = 0, vader_sum = 0, vader_sumsq = 0 WHERE {_ROLLUP_RANGE}",
+            f"""
+            INSERT INTO daily_user_metrics (user_id, day, emotion_counts, vader_n, vader_sum, vader_sumsq)
+            SELECT user_id, day, {json_agg}(emotion, analyses), sum(vader_n), sum(vader_sum), sum(vader_sumsq)
+            FROM (
+                SELECT user_id, day, emotion, sum(analyses) AS analyses,
+                       sum(vader_n) AS vader_n, sum(vader_sum) AS vader_sum, sum(vader_sumsq) AS vader_sumsq
+                FROM emotion_tallies
+                WHERE {_ROLLUP_RANGE}
+                GROUP BY user_id, day, emotion
+            ) per_emotion
+            GROUP BY user_id, day
+            ON CONFLICT (user_id, day) DO UPDATE SET
+                emotion_counts = EXCLUDED.emotion_counts, vader_n = EXCLUDED.vader_n,
+                vader_sum = EXCLUDED.vader_sum, vader_sumsq = EXCLUDED.vader_sumsq
+            """,
+        ),
+    }
+
+_ROLLUP_SQL = {
+    "postgres": _rollup_statements("jsonb_object_agg", "start_time::date"),
+    "sqlite": _rollup_statements("json_group_object", "date(start_time)"),
+}
+
+_TALLY_COLUMNS = "user_id, day, source, emotion, analyses, vader_n, vader_sum, vader_sumsq"
+
+_TALLY_ADD_SQL = f"""
+    INSERT INTO emotion_tallies ({_TALLY_COLUMNS})
+    VALUES (%(user_id)s, %(day)s, %(source)s, %(emotion)s, %(analyses)s, %(n)s, %(sum)s, %(sumsq)s)
+    ON CONFLICT (user_id, day, source, emotion) DO UPDATE SET
+        analyses = emotion_tallies.analyses + EXCLUDED.analyses,
+        vader_n = emotion_tallies.vader_n + EXCLUDED.vader_n,
+        vader_sum = emotion_tallies.vader_sum + EXCLUDED.vader_sum,
+        vader_sumsq = emotion_tallies.vader_sumsq + EXCLUDED.vader_sumsq
+"""
+
+def refresh_daily_metrics(cursor, user_id, kinds=ROLLUP_KINDS, start=None, end=None):
     """
-    with closing(connect_db()) as db:
-        if db is None: return
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id, date, hours_played, mood_score, solo_play_ratio, late_night_gaming, physical_breaks, social_interaction_score))
-            db.commit()
+    Recomputes the `kinds` columns of a user's rollup rows for days in [start, end)
+    (all days if omitted) from the source tables, on an open cursor; the caller
+    owns the transaction.
+    """
+    start = start or date.min
+    end = end or date.max
+    params = {
+        "user_id": user_id, "start": start, "end": end,
+        "start_ts": datetime.combine(start, time.min), "end_ts": datetime.combine(end, time.min),
+    }
+    statements = _ROLLUP_SQL[_dialect(cursor.connection)]
+    for kind in kinds:
+        for sql in statements[kind]:
+            cursor.execute(sql, params)
 
-def get_behavior_logs(user_id):
-    sql = "SELECT log_date, hours_played, mood_score, solo_play_ratio, late_night_gaming, physical_breaks, social_interaction_score FROM behavior_logs WHERE user_id = %s ORDER BY log_date DESC"
-    with closing(connect_db()) as db:
-        if db is None: return pd.DataFrame()
-        df = pd.read_sql(sql, db, params=(user_id,))
-        if not df.empty:
-            df = df.rename(columns={"log_date": "date"})
-    return df
+def _refresh_rollup_day(cursor, user_id, kind, day):
+    if isinstance(day, datetime):
+        day = day.date()
+    refresh_daily_metrics(cursor, user_id, (kind,), day, day + timedelta(days=1))
 
-# --- PHQ-9 & ASSESSMENT HELPERS ---
-def get_latest_phq9(user_id):
-    sql = """
-        SELECT start_time, completion_score, answers 
-        FROM conversations 
-        WHERE user_id = %s AND completion_score IS NOT NULL AND title LIKE 'PHQ-9 Assessment%%' 
-        ORDER BY start_time DESC LIMIT 1;
+def _vader_totals(vader_compound):
+    """(n, sum, sumsq) of a single analysis' VADER compound, which may be missing."""
+    if vader_compound is None:
+        return 0, 0.0, 0.0
+    vader = float(vader_compound)
+    return 1, vader, vader * vader
+
+def _tally(user_id, day, source, emotion, analyses, n, total, sumsq):
+    if isinstance(day, datetime):
+        day = day.date()
+    return {"user_id": user_id, "day": day, "source": source, "emotion": emotion,
+            "analyses": int(analyses), "n": int(n), "sum": float(total), "sumsq": float(sumsq)}
+
+def _day_tallies(user_id, source, day):
+    """Tallies of a save_emotion_days day; its VADER totals go in with the first emotion only."""
+    totals = (day["vader_n"], day["vader_sum"], day["vader_sumsq"])
+    return [
+        _tally(user_id, day["date"], source, emotion, count, *(totals if i == 0 else (0, 0.0, 0.0)))
+        for i, (emotion, count) in enumerate(day["emotion_counts"].items())
+    ]
+
+def _execute_many(cursor, sql, params):
+    """executemany, sent in pages of statements on Postgres rather than one round trip per row."""
+    if _dialect(cursor.connection) == "sqlite":
+        cursor.executemany(sql, params)
+    else:
+        psycopg2.extras.execute_batch(cursor, sql, params, page_size=500)
+
+def _replace_ingested_tallies(cursor, rows):
     """
-    with closing(connect_db()) as db:
-        if db is None: return None
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id,))
-            row = cursor.fetchone()
-    if not row:
-        return None
-    
-    try:
-        from shared import get_severity_for_score
-        severity = get_severity_for_score(row[1])
-    except (ImportError, AttributeError):
-        severity = "Unknown"
-        
-    return {"date": row[0], "total_score": row[1], "severity_level": severity, "answers": row[2]}
+    Counts each bulk-ingested emotion_logs row (already one per user and day)
+    as the day's only "ingest" analysis, so ingesting a day again replaces
+    rather than adds to it.
+    """
+    tallies = [_tally(row[0], row[1], "ingest", row[2], 1, *_vader_totals(row[4])) for row in rows]
+    _execute_many(
+        cursor, "DELETE FROM emotion_tallies WHERE user_id = %(user_id)s AND day = %(day)s AND source = %(source)s", tallies)
+    _execute_many(cursor, _TALLY_ADD_SQL, tallies)
 
+# Ingest tables whose rows are also recorded in a rollup source table, before the refresh below.
+INGEST_SOURCES = {"emotion_logs": _replace_ingested_tallies}
 
-def get_score_trend(user_id):
-    sql = "SELECT completion_score FROM conversations WHERE user_id = %s AND completion_score IS NOT NULL AND title LIKE 'PHQ-9 Assessment%%' ORDER BY start_time DESC LIMIT 2;"
-    with closing(connect_db()) as db:
-        if db is None: return (None, None)
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id,))
-            scores = [row[0] for row in cursor.fetchall()]
-    if len(scores) == 2: return (scores[0], scores[1])
-    elif len(scores) == 1: return (scores[0], None)
-    else: return (None, None)
+# Ingest tables whose rows feed the rollup, with the row index of their date column.
+INGEST_ROLLUPS = {"behavior_logs": ("behavior", 1), "emotion_logs": ("emotion", 1)}
 
-# --- EMOTION LOGS ---
-def get_latest_emotion(user_id):
-    sql = "SELECT emotion, date, probability, vader_compound FROM emotion_logs WHERE user_id = %s ORDER BY date DESC LIMIT 1;"
-    with closing(connect_db()) as db:
-        if db is None: return None
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id,))
-            row = cursor.fetchone()
-    return {"emotion": row[0], "date": row[1], "probability": row[2], "vader_compound": row[3]} if row else None
+def _refresh_ingested_days(cursor, rollup, rows):
+    kind, date_index = rollup
+    spans = {}
+    for row in rows:
+        day = row[date_index]
+        day = day.date() if isinstance(day, datetime) else day
+        low, high = spans.get(row[0], (day, day))
+        spans[row[0]] = (min(low, day), max(high, day))
+    for user_id, (low, high) in spans.items():
+        refresh_daily_metrics(cursor, user_id, (kind,), low, high + timedelta(days=1))
 
-def save_emotion_log(user_id, date, emotion, probability, vader_compound):
-    sql = "INSERT INTO emotion_logs (user_id, date, emotion, probability, vader_compound) VALUES (%s, %s, %s, %s, %s) ON CONFLICT (user_id, date) DO UPDATE SET emotion = EXCLUDED.emotion, probability = EXCLUDED.probability, vader_compound = EXCLUDED.vader_compound;"
-    with closing(connect_db()) as db:
-        if db is None: return
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id, date, emotion, probability, vader_compound))
-            db.commit()
+DAILY_METRICS_COLUMNS = ["day", "phq9_score", "assessments", "risk_score", "mood_score", "hours_played",
+                         "emotion_counts", "vader_n", "vader_sum", "vader_sumsq"]
+DAILY_METRICS_SQL = f"SELECT {', '.join(DAILY_METRICS_COLUMNS)} FROM daily_user_metrics WHERE user_id = %s AND day >= %s AND day < %s ORDER BY day"
 
-def get_emotion_history(user_id):
-    sql = "SELECT date, emotion, probability, vader_compound FROM emotion_logs WHERE user_id = %s ORDER BY date ASC"
-    with closing(connect_db()) as db:
-        if db is None: return []
-        history = pd.read_sql(sql, db, params=(user_id,))
-    return history.to_dict('records')
+def _daily_metrics_frame(rows):
+    """Builds the get_daily_metrics DataFrame, deriving vader_mean and the sample vader_var."""
+    df = pd.DataFrame([tuple(row) for row in rows], columns=DAILY_METRICS_COLUMNS)
+    df["emotion_counts"] = df["emotion_counts"].map(lambda c: json.loads(c) if isinstance(c, str) else (c or {}))
+    n = df["vader_n"].astype(float)
+    df["vader_mean"] = (df["vader_sum"] / n).where(n > 0)
+    df["vader_var"] = ((df["vader_sumsq"] - df["vader_sum"] ** 2 / n) / (n - 1)).clip(lower=0).where(n > 1)
+    return df
 
-# --- CALENDAR & EVENTS ---
-def save_calendar_events(user_id, events_to_save, is_generated):
-    with closing(connect_db()) as db:
+@cached_reader
+@reads
+def get_daily_metrics(user_id, start=None, end=None):
+    """
+    Returns the user's daily_user_metrics rows for days in [start, end), oldest
+    first, as a DataFrame with DAILY_METRICS_COLUMNS plus vader_mean and vader_var.
+    """
+    with db_connection() as db:
+        if db is None: return _daily_metrics_frame([])
+        with db.cursor() as cursor:
+            cursor.execute(DAILY_METRICS_SQL, (user_id, start or date.min, end or date.max))
+            rows = cursor.fetchall()
+    return _daily_metrics_frame(rows)
+
+
+# --- WRITE-BEHIND ---
+# Non-critical log writes can be journaled locally and applied by a background
+# thread (see db_queue), so click handlers don't wait on, or lose data to, the
+# database. Enabled with write_behind = true in [database]; optional keys:
+# write_behind_journal (default write_behind.db), write_behind_batch (200),
+# write_behind_max_backoff (60 seconds), write_behind_read_wait (2 seconds a
+# session's next read waits for its own pending write).
+
+# op -> (apply(cursor, *args) returning the user_id to invalidate, readers,
+# coalescing key of the args, or None when every write must be applied).
+DEFERRED_WRITES = {
+    "add_message": (_apply_add_message, (), None),
+    "save_behavior_log": (_apply_behavior_log, BEHAVIOR_READERS, lambda args: args[:2]),
+    "save_emotion_log": (_apply_emotion_log, EMOTION_READERS, None),
+    "update_calendar_event_completion": (_apply_event_completion, CALENDAR_READERS, lambda args: args[0]),
+}
+
+def _is_transient(exc):
+    return isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError, sqlite3.OperationalError))
+
+@writes
+def _apply_writes(entries):
+    """Applies journaled (op, args) entries in one transaction. Returns False if the database is unreachable."""
+    with db_connection() as db:
         if db is None: return False
-        with closing(db.cursor()) as cursor:
-            if is_generated:
-                cursor.execute("DELETE FROM calendar_events WHERE user_id = %s AND is_generated = TRUE", (user_id,))
-            sql_insert = "INSERT INTO calendar_events (user_id, title, start_time, end_time, color, is_generated) VALUES (%s, %s, %s, %s, %s, %s)"
-            data_to_insert = [(user_id, e['title'], e['start'], e['end'], e.get('color', '#6f42c1'), is_generated) for e in events_to_save]
-            psycopg2.extras.execute_batch(cursor, sql_insert, data_to_insert)
-            db.commit()
+        with db.cursor() as cursor:
+            touched = []
+            for op, args in entries:
+                apply, readers, _ = DEFERRED_WRITES[op]
+                touched.append((apply(cursor, *args), readers))
+        db.commit()
+    for user_id, readers in touched:
+        _invalidate(user_id, readers)
     return True
 
-def get_calendar_events(user_id):
-    sql = "SELECT id, title, start_time, end_time, color, is_generated, completed, user_mood FROM calendar_events WHERE user_id = %s"
-    events = []
-    with closing(connect_db()) as db:
-        if db is None: return []
-        with closing(db.cursor()) as cursor:
-            cursor.execute(sql, (user_id,))
-            for row in cursor.fetchall():
-                events.append({"id": str(row[0]), "title": row[1], "start": row[2].isoformat(), "end": row[3].isoformat(), "color": row[4], "is_generated": row[5], "completed": row[6], "user_mood": row[7]})
-    return events
+@st.cache_resource
+def get_write_queue():
+    """The process-wide write-behind queue, or None when write_behind is off."""
+    cfg = st.secrets.database
+    if not cfg.get("write_behind", False):
+        return None
+    return WriteQueue(
+        cfg.get("write_behind_journal", "write_behind.db"), _apply_writes, is_transient=_is_transient,
+        batch_size=int(cfg.get("write_behind_batch", 200)),
+        max_backoff=float(cfg.get("write_behind_max_backoff", 60)),
+        read_wait=float(cfg.get("write_behind_read_wait", 2)),
+    )
 
-def get_todays_events(user_id, today_date):
-    start_of_day = datetime.combine(today_date, time.min)
-    end_of_day = start_of_day + timedelta(days=1)
-    sql = "SELECT title, start_time FROM calendar_events WHERE user_id = %s AND start_time >= %s AND start_time < %s ORDER BY start_time ASC;"
-    try:
-        with closing(connect_db()) as db:
-            if db is None: return []
-            with closing(db.cursor()) as cursor:
-                cursor.execute(sql, (user_id, start_of_day, end_of_day))
-                events = []
-                for title, start_timestamp in cursor.fetchall():
-                    events.append((title, start_timestamp.time()))
-                return events
-    except Exception as e:
-        print(f"Error fetching today's events for user {user_id}: {e}")
-        return []
+def _current_write_queue():
+    return _standalone.get("write_queue") if "pool" in _standalone else get_write_queue()
 
-#######Changed
+def _submit_write(op, *args):
+    """Journals `op` when write-behind is on, otherwise applies it now. Returns True unless the write was lost."""
+    queue = _current_write_queue()
+    if queue is not None:
+        key = DEFERRED_WRITES[op][2]
+        try:
+            _note_pending_write(queue.enqueue(op, args, None if key is None else key(args)))
+            _note_write()
+            return True
+        except (sqlite3.Error, OSError, RuntimeError) as e:
+            print(f"[write-behind] could not journal {op}, writing directly: {e}")
+    return _apply_writes([(op, args)])
 
-def get_scores_over_time(user_id):
-    """
-    Fetches all completed assessment scores, timestamps, and detailed answers for a user.
-    """
-    sql = """
-        SELECT start_time, completion_score, answers 
-        FROM conversations 
-        WHERE user_id = %s 
-          AND completion_score IS NOT NULL 
-          AND answers IS NOT NULL
-          AND title LIKE 'PHQ-9 Assessment%%'
-        ORDER BY start_time ASC;
-    """
-    with closing(connect_db()) as db:
-        if db is None: return pd.DataFrame()
-        
-        # Use pandas to read directly from the SQL query for simplicity
-        df = pd.read_sql(sql, db, params=(user_id,))
-        if not df.empty:
-            df = df.rename(columns={
-                "start_time": "Date", 
-                "completion_score": "Score",
-                "answers": "Answers" # The 'answers' column will contain lists
-            })
-            df['Date'] = pd.to_datetime(df['Date']).dt.date
-    return df
\ No newline at end of file
+def get_write_queue_stats():
+    """Depth, lag and drain counters of the write-behind queue, or None when it is off."""
+    queue = _current_write_queue()
+    return queue.stats() if queue is not None else None
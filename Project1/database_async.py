@@ -0,0 +1,270 @@
+"""
+Asyncio variants of the per-user readers in database.py, backed by asyncpg.
+
+Streamlit scripts are synchronous, so the asyncpg pools live on a dedicated
+event-loop thread owned by AsyncRuntime. Pages call run_concurrently() to
+issue several independent reads at once; it blocks until all of them finish.
+
+The readers run the same SQL as their synchronous twins in database.py (with
+placeholders rewritten for asyncpg) and behave like them: results share the
+read-through cache, so a value loaded here is a cache hit for the matching
+synchronous reader and vice versa; queries are recorded in database.py's
+QueryStats under the synchronous reader's name; reads go to a replica when
+database.py would send them to one, and to the primary while the session is
+in its read_your_writes window.
+
+The synchronous functions in database.py remain the primary API. If the async
+runtime is unavailable, run_concurrently() falls back to calling them one
+after another.
+"""
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import re
+import threading
+import time
+from collections.abc import Mapping
+from datetime import date
+
+import asyncpg
+import pandas as pd
+import streamlit as st
+
+import database
+from database import (
+    BEHAVIOR_LOG_COLUMNS, BEHAVIOR_LOGS_SQL, DAILY_METRICS_SQL, EMOTION_HISTORY_SQL, LATEST_EMOTION_SQL,
+    LATEST_PHQ9_SQL, SCORE_TREND_SQL, SCORES_OVER_TIME_SQL, USER_SNAPSHOT_SQL, _daily_metrics_frame,
+    _emotion_result, _phq9_result, _score_trend, _scores_frame, _snapshot_params, _snapshot_result,
+)
+from db_cache import async_read_through
+
+
+class AsyncRuntime:
+    """
+    An event loop on a daemon thread plus the asyncpg pools bound to it: one for
+    the primary and one per read replica, in the replica router's order.
+    `stats` is the QueryStats queries are recorded in (None: not recorded).
+    """
+
+    def __init__(self, cache, stats=None, call_timeout=30):
+        self.cache = cache
+        self.stats = stats
+        self.call_timeout = call_timeout
+        self.pool = None
+        self.replicas = []
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="db-async-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coro):
+        """Runs a coroutine on the runtime's loop and blocks for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(self.call_timeout)
+
+    async def open_pool(self, dsn_kwargs, min_size, max_size, connect_timeout, command_timeout, replica_dsn_kwargs=()):
+        async def init(conn):
+            await conn.set_type_codec("json", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+        def create(kwargs, min_size):
+            return asyncpg.create_pool(
+                min_size=min_size, max_size=max_size, timeout=connect_timeout,
+                command_timeout=command_timeout, init=init, **kwargs
+            )
+
+        self.pool = await create(dsn_kwargs, min_size)
+        # Replica pools connect on first use, so a replica that is down doesn't stop the runtime from starting.
+        self.replicas = [await create(kwargs, 0) for kwargs in replica_dsn_kwargs]
+
+    def close(self):
+        for pool in [self.pool, *self.replicas]:
+            if pool is not None:
+                self.run(pool.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_active_runtime = None
+
+def _connect_kwargs(cfg, replica=None):
+    """asyncpg keyword arguments for the primary, or for a [database] replicas entry (a DSN or overrides)."""
+    primary = {"host": cfg.host, "port": int(cfg.port), "database": cfg.dbname, "user": cfg.user, "password": cfg.password}
+    if replica is None:
+        return primary
+    if not isinstance(replica, Mapping):
+        return {"dsn": replica}
+    overrides = {("database" if key == "dbname" else key): value for key, value in replica.items()}
+    return dict(primary, **overrides, port=int(overrides.get("port", primary["port"])))
+
+@st.cache_resource
+def get_async_runtime():
+    """
+    Builds the process-wide async runtime, with a pool per entry of [database]
+    replicas when database.get_replica_router() routes reads to them. Optional
+    keys in [database]: async_pool_min, async_pool_max, connect_timeout,
+    async_command_timeout.
+    """
+    cfg = st.secrets.database
+    stats = database.get_query_stats() if cfg.get("instrument", True) else None
+    runtime = AsyncRuntime(cache=database.get_query_cache(), stats=stats)
+    replicas = cfg.get("replicas", []) if database.get_replica_router() is not None else []
+    try:
+        runtime.run(runtime.open_pool(
+            dsn_kwargs=_connect_kwargs(cfg),
+            replica_dsn_kwargs=[_connect_kwargs(cfg, replica) for replica in replicas],
+            min_size=int(cfg.get("async_pool_min", 1)),
+            max_size=int(cfg.get("async_pool_max", 10)),
+            connect_timeout=float(cfg.get("connect_timeout", 5)),
+            command_timeout=float(cfg.get("async_command_timeout", 30)),
+        ))
+    except Exception:
+        runtime.close()
+        raise
+    return runtime
+
+def _current_runtime():
+    """The runtime for this process; under database.use_standalone_resources, the one given there (or None)."""
+    if "pool" in database._standalone:
+        return database._standalone.get("async_runtime")
+    return get_async_runtime()
+
+# The coroutines run on the loop thread, where st.cache_resource lookups have
+# no script context, so they reach the cache and pool through the runtime.
+cached_reader = async_read_through(lambda: _active_runtime.cache)
+
+# Index into the runtime's replica pools for the reads of one run_concurrently call, or None for the primary.
+_replica = contextvars.ContextVar("replica", default=None)
+
+def _pool():
+    index = _replica.get()
+    return _active_runtime.pool if index is None else _active_runtime.replicas[index]
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s")
+
+@functools.lru_cache(maxsize=None)
+def _to_numeric_placeholders(sql):
+    """
+    Rewrites psycopg2 placeholders as asyncpg $n ones: each %s in turn, or each
+    distinct %(name)s once. Returns (sql, names in $n order, empty for %s).
+    """
+    names, positions = [], itertools.count(1)
+
+    def replace(match):
+        name = match.group(1)
+        if name is None:
+            return f"${next(positions)}"
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    return _PLACEHOLDER.sub(replace, sql).replace("%%", "%"), names
+
+async def _query(method, function, sql, *args):
+    """
+    Runs database.py's `sql` with pool.<method> ("fetch" or "fetchrow"), taking
+    the same arguments as cursor.execute (a dict for %(name)s placeholders), and
+    records it in QueryStats under `function`, the synchronous reader's name.
+    """
+    translated, names = _to_numeric_placeholders(sql)
+    if names:
+        args = [args[0][name] for name in names]
+    stats = _active_runtime.stats
+    started, rows = time.perf_counter(), 0
+    try:
+        result = await getattr(_pool(), method)(translated, *args)
+        rows = len(result) if method == "fetch" else int(result is not None)
+        return result
+    finally:
+        if stats is not None:
+            key = stats.record(function, sql, time.perf_counter() - started, rows)
+            stats.add_fetched(key, rows)
+
+# --- READERS ---
+@cached_reader
+async def get_latest_phq9(user_id):
+    row = await _query("fetchrow", "get_latest_phq9", LATEST_PHQ9_SQL, user_id)
+    return _phq9_result(*row) if row else None
+
+@cached_reader
+async def get_score_trend(user_id):
+    return _score_trend([row[0] for row in await _query("fetch", "get_score_trend", SCORE_TREND_SQL, user_id)])
+
+@cached_reader
+async def get_scores_over_time(user_id):
+    rows = await _query("fetch", "get_scores_over_time", SCORES_OVER_TIME_SQL, user_id)
+    return _scores_frame(pd.DataFrame([tuple(r) for r in rows], columns=["start_time", "completion_score", "answers"]))
+
+@cached_reader
+async def get_behavior_logs(user_id):
+    rows = await _query("fetch", "get_behavior_logs", BEHAVIOR_LOGS_SQL, user_id)
+    df = pd.DataFrame([tuple(r) for r in rows], columns=BEHAVIOR_LOG_COLUMNS)
+    if not df.empty:
+        df = df.rename(columns={"log_date": "date"})
+    return df
+
+@cached_reader
+async def get_latest_emotion(user_id):
+    return _emotion_result(await _query("fetchrow", "get_latest_emotion", LATEST_EMOTION_SQL, user_id))
+
+async def get_emotion_history(user_id, start=None, end=None):
+    rows = await _query("fetch", "get_emotion_history", EMOTION_HISTORY_SQL, user_id, start or date.min, end or date.max)
+    return [dict(row) for row in rows]
+
+@cached_reader
+async def get_daily_metrics(user_id, start=None, end=None):
+    rows = await _query("fetch", "get_daily_metrics", DAILY_METRICS_SQL, user_id, start or date.min, end or date.max)
+    return _daily_metrics_frame(rows)
+
+async def get_user_snapshot(user_id, today=None):
+    return await _fetch_user_snapshot(user_id, today or date.today())
+
+@cached_reader
+async def _fetch_user_snapshot(user_id, today):
+    row = await _query("fetchrow", "get_user_snapshot", USER_SNAPSHOT_SQL, _snapshot_params(user_id, today))
+    return _snapshot_result(tuple(row))
+
+# --- CONCURRENCY HELPER ---
+def run_concurrently(*calls):
+    """
+    Runs independent async reads at the same time from synchronous code and
+    returns their results in order, e.g.
+
+        snapshot, logs = run_concurrently(
+            (get_user_snapshot, user_id),
+            (get_behavior_logs, user_id),
+        )
+
+    If the async runtime can't be started or a read fails, or the storage
+    backend isn't Postgres, the matching synchronous functions from database.py
+    are called one after another instead.
+    """
+    global _active_runtime
+
+    # The event loop thread has no session state, so the routing decisions that
+    # need it are made here: wait for this session's journaled write, then pick
+    # a replica unless the session wrote within its read_your_writes window.
+    database._await_own_writes()
+    sequential = lambda: [getattr(database, func.__name__)(*args) for func, *args in calls]
+    if database.backend_dialect() != "postgres":
+        return sequential()
+    router = database._current_router()
+    replica = None
+    if router is not None and not database._wrote_recently(router):
+        replica = router.choose()
+
+    async def gather():
+        _replica.set(replica)  # copied into every task gather() creates
+        return await asyncio.gather(*(func(*args) for func, *args in calls))
+
+    try:
+        runtime = _current_runtime()
+        if runtime is None:
+            return sequential()
+        if replica is not None and replica >= len(runtime.replicas):
+            replica = None
+        _active_runtime = runtime
+        return runtime.run(gather())
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+        if replica is not None and not isinstance(e, asyncpg.PostgresError):
+            router.mark_down(router.pools[replica])
+        print(f"Async reads failed, falling back to sequential queries: {e}")
+        return sequential()
@@ -0,0 +1,248 @@
+import copy
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def _copy_value(value):
+    """Callers sometimes mutate what they get back, so hand out copies of cached values."""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, (list, dict)):
+        return copy.deepcopy(value)
+    return value
+
+
+class QueryCache:
+    """
+    A per-process, size-bounded LRU cache with a TTL for per-user database reads.
+
+    Entries are keyed by (function name, user_id, remaining arguments) and also
+    indexed by (user_id, function name) so a writer can drop exactly the entries
+    its change affects. Other processes never see those invalidations, so the
+    TTL is what bounds staleness across server replicas.
+    """
+
+    def __init__(self, maxsize=2048, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._by_user = {}              # (user_id, func_name) -> set of keys
+        self._counters = {}             # func_name -> {"hits", "misses", "invalidations"}
+        self._generations = {}          # (user_id, func_name) -> bumped on every invalidation
+        self._evictions = 0
+
+    def _count(self, func_name, field, n=1):
+        counters = self._counters.setdefault(func_name, {"hits": 0, "misses": 0, "invalidations": 0})
+        counters[field] += n
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        func_name, user_id = key[0], key[1]
+        keys = self._by_user.get((user_id, func_name))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[(user_id, func_name)]
+
+    def lookup(self, func_name, user_id, args):
+        """
+        Returns (hit, value, generation). On a miss, pass `generation` back to
+        store() so a write that lands while the value is loading isn't overwritten.
+        """
+        key = (func_name, user_id, args)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._count(func_name, "hits")
+                return True, _copy_value(entry[1]), None
+            if entry is not None:
+                self._drop(key)
+            self._count(func_name, "misses")
+            return False, None, self._generations.get((user_id, func_name), 0)
+
+    def store(self, func_name, user_id, args, value, generation):
+        """Caches `value` unless the key was invalidated since lookup(); returns a copy for the caller."""
+        key = (func_name, user_id, args)
+        with self._lock:
+            # A write invalidated this key while we were loading; the value may predate it.
+            if self._generations.get((user_id, func_name), 0) != generation:
+                return value
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._by_user.setdefault((user_id, func_name), set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._evictions += 1
+        return _copy_value(value)
+
+    def get_or_load(self, func_name, user_id, args, loader):
+        """
+        Returns the cached value for the key, or calls `loader()`, which must return
+        (value, cacheable). Values are only stored when `cacheable` is true.
+        """
+        hit, value, generation = self.lookup(func_name, user_id, args)
+        if hit:
+            return value
+        value, cacheable = loader()
+        if not cacheable:
+            return value
+        return self.store(func_name, user_id, args, value, generation)
+
+    def invalidate(self, user_id, *func_names):
+        """Drops every cached entry of `func_names` for one user."""
+        with self._lock:
+            for func_name in func_names:
+                self._generations[(user_id, func_name)] = self._generations.get((user_id, func_name), 0) + 1
+                keys = self._by_user.pop((user_id, func_name), set())
+                for key in keys:
+                    self._entries.pop(key, None)
+                if keys:
+                    self._count(func_name, "invalidations", len(keys))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self):
+        """Returns hit/miss/invalidation counters per function plus overall totals."""
+        with self._lock:
+            per_function = {name: dict(c) for name, c in self._counters.items()}
+            hits = sum(c["hits"] for c in per_function.values())
+            misses = sum(c["misses"] for c in per_function.values())
+            return {
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "evictions": self._evictions,
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+                "functions": per_function,
+            }
+
+
+class SessionCache:
+    """
+    A per-process LRU of validated login sessions, keyed by token hash.
+
+    An entry idle for longer than `idle_timeout` seconds is dropped. A hit
+    older than `revalidate_after` seconds is reported as stale so the caller
+    re-checks (and touches) the session in the database, which is how a
+    logout or expiry in another process reaches this one.
+    """
+
+    def __init__(self, maxsize=10000, idle_timeout=43200, revalidate_after=300):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.revalidate_after = revalidate_after
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # token hash -> [user, validated_at, last_seen, rotation_due]
+        self._counters = {"hits": 0, "misses": 0, "revalidations": 0, "expired": 0, "evictions": 0}
+
+    def get(self, token_hash):
+        """Returns (user, stale), or (None, True) if the session isn't cached or has gone idle."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None, True
+            if now - entry[2] > self.idle_timeout:
+                del self._entries[token_hash]
+                self._counters["expired"] += 1
+                return None, True
+            entry[2] = now
+            self._entries.move_to_end(token_hash)
+            stale = now - entry[1] > self.revalidate_after
+            self._counters["revalidations" if stale else "hits"] += 1
+            return copy.deepcopy(entry[0]), stale
+
+    def put(self, token_hash, user, rotation_due=False):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[token_hash] = [copy.deepcopy(user), now, now, rotation_due]
+            self._entries.move_to_end(token_hash)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def take_rotation(self, token_hash):
+        """True, once, if the session was put with rotation_due since it was last taken."""
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None or not entry[3]:
+                return False
+            entry[3] = False
+            return True
+
+    def discard(self, token_hash):
+        with self._lock:
+            self._entries.pop(token_hash, None)
+
+    def discard_user(self, user_id):
+        """Drops every cached session of one user, e.g. after a password change."""
+        with self._lock:
+            for token_hash in [k for k, entry in self._entries.items() if entry[0]["id"] == user_id]:
+                del self._entries[token_hash]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "maxsize": self.maxsize, **self._counters}
+
+
+def _key_args(args, kwargs):
+    user_id = args[0] if args else kwargs["user_id"]
+    extra = (tuple(args[1:]), tuple(sorted((k, v) for k, v in kwargs.items() if k != "user_id")))
+    return user_id, extra
+
+
+def read_through(get_cache, failure_marker=lambda: 0):
+    """
+    Decorator factory for readers whose first argument is a user_id. `get_cache`
+    returns the QueryCache to use. `failure_marker` returns a counter of failed
+    connection attempts; if it moves during the wrapped call, the (empty)
+    fallback result is returned without being cached.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            user_id, extra = _key_args(args, kwargs)
+
+            def load():
+                failures_before = failure_marker()
+                value = func(*args, **kwargs)
+                return value, failure_marker() == failures_before
+
+            return get_cache().get_or_load(func.__name__, user_id, extra, load)
+        return wrapper
+    return decorator
+
+
+def async_read_through(get_cache):
+    """
+    The coroutine counterpart of read_through. Keys are built the same way, so a
+    value loaded by the async reader is a hit for the sync reader of the same
+    name and vice versa. Failures raise instead of returning fallbacks, so
+    every successful result is cacheable.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            user_id, extra = _key_args(args, kwargs)
+            cache = get_cache()
+            hit, value, generation = cache.lookup(func.__name__, user_id, extra)
+            if hit:
+                return value
+            value = await func(*args, **kwargs)
+            return cache.store(func.__name__, user_id, extra, value, generation)
+        return wrapper
+    return decorator
@@ -0,0 +1,181 @@
+"""
+Streaming export of everything stored for one account, as a ZIP of CSV or
+Parquet files (one per table plus a manifest.json).
+
+Each table is read through a named (server-side) cursor in fixed-size batches
+and written to the archive batch by batch, so memory use does not grow with
+the size of the account's history.
+
+The app offers the export from the sidebar. Support staff can run it directly
+(from the Project1 directory):
+    python db_export.py --user-id 42 --format parquet -o account-42.zip
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+from datetime import datetime, timezone
+
+from db_pool import connect_from_secrets
+
+EXPORT_BATCH_SIZE = 2000
+EXPORT_FORMATS = ("csv", "parquet")
+
+# file name -> query; every query takes the user id as its only parameter.
+EXPORT_TABLES = {
+    "users": "SELECT id, email, username, full_name FROM users WHERE id = %s",
+    "conversations": """
+        SELECT id, kind, title, start_time, completion_score, answers, video_url
+        FROM conversations WHERE user_id = %s ORDER BY start_time, id
+    """,
+    "chat_history": """
+        SELECT h.id, h.conversation_id, h.role, h.content, h.timestamp
+        FROM chat_history h JOIN conversations c ON c.id = h.conversation_id
+        WHERE c.user_id = %s ORDER BY h.conversation_id, h.timestamp, h.id
+    """,
+    "calendar_events": """
+        SELECT id, title, start_time, end_time, color, is_generated, completed, user_mood
+        FROM calendar_events WHERE user_id = %s ORDER BY start_time, id
+    """,
+    "behavior_logs": """
+        SELECT log_date, hours_played, mood_score, solo_play_ratio, late_night_gaming,
+               physical_breaks, social_interaction_score, risk_score
+        FROM behavior_logs WHERE user_id = %s ORDER BY log_date
+    """,
+    "emotion_logs": """
+        SELECT date, emotion, probability, vader_compound
+        FROM emotion_logs WHERE user_id = %s ORDER BY date
+    """,
+}
+
+
+def _batches(conn, table, sql, user_id, batch_size):
+    """
+    Yields (column names, type OIDs, rows) per batch from a server-side cursor.
+    The first batch is always yielded, even when empty, so writers get the columns.
+    """
+    with conn.cursor(name=f"export_{table}") as cursor:
+        cursor.itersize = batch_size
+        cursor.execute(sql, (user_id,))
+        first = True
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows and not first:
+                break
+            yield [col[0] for col in cursor.description], [col[1] for col in cursor.description], rows
+            if not rows:
+                break
+            first = False
+
+
+def _write_csv(archive, name, batches):
+    count = 0
+    with archive.open(f"{name}.csv", "w") as raw:
+        out = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        writer = csv.writer(out)
+        for columns, _, rows in batches:
+            if count == 0:
+                writer.writerow(columns)
+            writer.writerows(rows)
+            count += len(rows)
+        out.flush()
+        out.detach()
+    return count
+
+
+# Postgres type OIDs -> Arrow types; anything else is exported as text.
+_PG_ARROW_TYPES = {
+    16: "bool", 20: "int64", 21: "int16", 23: "int32", 25: "string", 700: "float32",
+    701: "float64", 1082: "date32", 1114: "timestamp", 1184: "timestamptz", 1007: "int32_list",
+}
+
+def _arrow_schema(columns, type_codes):
+    import pyarrow as pa
+    types = {
+        "bool": pa.bool_(), "int64": pa.int64(), "int16": pa.int16(), "int32": pa.int32(),
+        "string": pa.string(), "float32": pa.float32(), "float64": pa.float64(), "date32": pa.date32(),
+        "timestamp": pa.timestamp("us"), "timestamptz": pa.timestamp("us", tz="UTC"),
+        "int32_list": pa.list_(pa.int32()),
+    }
+    return pa.schema([(col, types[_PG_ARROW_TYPES.get(oid, "string")]) for col, oid in zip(columns, type_codes)])
+
+
+def _write_parquet(archive, name, batches):
+    """Writes one row group per batch to a temp file, then copies it into the archive."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    count = 0
+    writer = None
+    with tempfile.TemporaryFile() as spool:
+        for columns, type_codes, rows in batches:
+            if writer is None:
+                schema = _arrow_schema(columns, type_codes)
+                writer = pq.ParquetWriter(spool, schema)
+            data = {
+                col: [v if v is None or schema.field(i).type != pa.string() else str(v) for v in values]
+                for i, (col, values) in enumerate(zip(columns, zip(*rows)))
+            }
+            if rows:
+                writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            count += len(rows)
+        writer.close()
+        spool.seek(0)
+        with archive.open(f"{name}.parquet", "w") as out:
+            shutil.copyfileobj(spool, out, 1 << 20)
+    return count
+
+
+def write_user_export(conn, user_id, fileobj, fmt="csv", batch_size=EXPORT_BATCH_SIZE):
+    """
+    Writes a ZIP of the account's data to `fileobj` using `conn` (left open, its
+    transaction rolled back). Empty tables are written with their columns only.
+    Returns the manifest, which is also stored in the archive.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    write_table = _write_csv if fmt == "csv" else _write_parquet
+    manifest = {"user_id": user_id, "format": fmt, "exported_at": datetime.now(timezone.utc).isoformat(), "tables": {}}
+    try:
+        with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for table, sql in EXPORT_TABLES.items():
+                manifest["tables"][table] = write_table(archive, table, _batches(conn, table, sql, user_id, batch_size))
+            archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    finally:
+        conn.rollback()
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export everything stored for one account as a ZIP.")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("-o", "--output", help="Output path (defaults to account-<id>-<format>.zip)")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    parser.add_argument("--dsn", help="libpq connection string (defaults to $DATABASE_URL or .streamlit/secrets.toml)")
+    parser.add_argument("--secrets", help="Path to a secrets.toml containing a [database] table")
+    args = parser.parse_args(argv)
+
+    output = args.output or f"account-{args.user_id}-{args.format}.zip"
+    conn = connect_from_secrets(args.dsn, args.secrets)
+    try:
+        with open(output, "wb") as f:
+            manifest = write_user_export(conn, args.user_id, f, args.format, args.batch_size)
+    except Exception:
+        if os.path.exists(output):
+            os.remove(output)
+        raise
+    finally:
+        conn.close()
+    for table, count in manifest["tables"].items():
+        print(f"{table:<16} {count:>8} rows")
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
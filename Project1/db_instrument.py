@@ -0,0 +1,231 @@
+"""
+Query instrumentation for the psycopg2 connections used by database.py.
+
+Pool connections are created with InstrumentedCursor as their cursor factory.
+Every execute is timed and aggregated under (database.py function, SQL
+fingerprint) together with the rows it affected or returned and the rows the
+caller actually fetched. Queries slower than the threshold are printed and
+kept in a short log, and each Streamlit rerun's query count is recorded.
+
+Bookkeeping is a dict update under a lock plus a short stack walk per query,
+which is small next to a network round trip.
+"""
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+import psycopg2.extensions
+
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:  # older Streamlit
+    from streamlit.scriptrunner import get_script_run_ctx
+
+# Queries are attributed to the outermost function of these modules on the stack.
+INSTRUMENTED_MODULES = {"database"}
+
+_FINGERPRINT_INPUT_LIMIT = 4096
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_VALUE = r"(?:\?(?:::[\w\[\] ]+)?|NULL|true|false|%s|ARRAY\[[^\]]*\])"
+_ROW = rf"\(\s*{_VALUE}(?:\s*,\s*{_VALUE})*\s*\)"
+_ROW_LIST = re.compile(rf"{_ROW}(?:\s*,\s*{_ROW})+", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def _fingerprint(sql):
+    sql = _LITERAL.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _ROW_LIST.sub("(...), ...", sql)
+    return _SPACE.sub(" ", sql).strip().rstrip(";")
+
+
+def fingerprint(sql):
+    """Normalises a statement so calls differing only in literal values group together."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    elif not isinstance(sql, str):  # psycopg2.sql.Composed
+        sql = str(sql)
+    return _fingerprint(sql[:_FINGERPRINT_INPUT_LIMIT])
+
+
+def _caller():
+    frame = sys._getframe(2)
+    name = None
+    while frame is not None:
+        if frame.f_globals.get("__name__") in INSTRUMENTED_MODULES:
+            name = frame.f_code.co_name
+        elif name is not None:
+            break
+        frame = frame.f_back
+    return name or "(unknown)"
+
+
+def _script_run_ctx():
+    try:
+        return get_script_run_ctx(suppress_warning=True)
+    except TypeError:
+        return get_script_run_ctx()
+
+
+class QueryStats:
+    """Aggregated per-query statistics, a slow-query log and per-rerun query counts."""
+
+    def __init__(self, slow_threshold_ms=200, slow_log_size=200, rerun_log_size=500, max_sessions=1000):
+        self.slow_threshold = slow_threshold_ms / 1000
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._queries = {}              # (function, fingerprint) -> [calls, seconds, max_seconds, rowcount, fetched]
+        self._slow = deque(maxlen=slow_log_size)
+        self._reruns = deque(maxlen=rerun_log_size)
+        self._sessions = OrderedDict()  # session_id -> [rerun marker, queries, seconds]
+
+    def record(self, function, sql, seconds, rowcount):
+        """Adds one executed statement; returns the key to pass to add_fetched()."""
+        key = (function, fingerprint(sql))
+        ctx = _script_run_ctx()
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is None:
+                entry = self._queries[key] = [0, 0.0, 0.0, 0, 0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3] += max(rowcount, 0)
+            if ctx is not None:
+                self._count_rerun(ctx, seconds)
+            slow = seconds >= self.slow_threshold
+            if slow:
+                self._slow.append({"at": time.time(), "function": key[0], "query": key[1],
+                                   "ms": seconds * 1000, "rows": rowcount})
+        if slow:
+            print(f"[slow query] {seconds * 1000:.0f} ms in {key[0]}: {key[1][:200]}")
+        return key
+
+    def _count_rerun(self, ctx, seconds):
+        # Streamlit gives every rerun a fresh `widget_ids_this_run` set, so a
+        # different object means the session has started a new rerun.
+        marker = getattr(ctx, "widget_ids_this_run", None)
+        if marker is None:
+            return
+        session = self._sessions.get(ctx.session_id)
+        if session is not None and session[0] is marker:
+            session[1] += 1
+            session[2] += seconds
+            self._sessions.move_to_end(ctx.session_id)
+            return
+        if session is not None:
+            self._reruns.append((session[1], session[2]))
+        self._sessions[ctx.session_id] = [marker, 1, seconds]
+        self._sessions.move_to_end(ctx.session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def add_fetched(self, key, n):
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is not None:
+                entry[4] += n
+
+    def current_rerun(self, session_id):
+        """(queries, seconds) so far in the session's current rerun."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return (session[1], session[2]) if session else (0, 0.0)
+
+    def top(self, by="total_ms", limit=20):
+        """Returns the `limit` heaviest queries, ordered by `by` (any key of the returned dicts)."""
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._queries.items()]
+        rows = [{
+            "function": function, "query": query, "calls": calls,
+            "total_ms": seconds * 1000, "mean_ms": seconds * 1000 / calls, "max_ms": max_seconds * 1000,
+            "rows": rowcount, "rows_fetched": fetched,
+        } for (function, query), (calls, seconds, max_seconds, rowcount, fetched) in items]
+        rows.sort(key=lambda r: r[by], reverse=True)
+        return rows[:limit]
+
+    def slow_queries(self):
+        """Most recent slow queries first."""
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def rerun_summary(self):
+        """Query counts of recently completed reruns across all sessions."""
+        with self._lock:
+            reruns = list(self._reruns)
+        if not reruns:
+            return {"reruns": 0, "mean_queries": 0.0, "max_queries": 0, "mean_db_ms": 0.0}
+        return {
+            "reruns": len(reruns),
+            "mean_queries": sum(q for q, _ in reruns) / len(reruns),
+            "max_queries": max(q for q, _ in reruns),
+            "mean_db_ms": sum(s for _, s in reruns) * 1000 / len(reruns),
+        }
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+            self._slow.clear()
+            self._reruns.clear()
+
+
+_active = None
+
+def install(stats):
+    """Makes InstrumentedCursor report to `stats` (None turns recording off)."""
+    global _active
+    _active = stats
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    _stats_key = None
+
+    def _timed(self, method, query, *args):
+        stats = _active
+        if stats is None:
+            return method(query, *args)
+        started = time.perf_counter()
+        try:
+            return method(query, *args)
+        finally:
+            self._stats_key = stats.record(_caller(), query, time.perf_counter() - started, self.rowcount)
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, file, size)
+
+    def _fetched(self, n):
+        stats = _active
+        if stats is not None and self._stats_key is not None and n:
+            stats.add_fetched(self._stats_key, n)
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._fetched(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._fetched(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self._fetched(1)
+        return row
@@ -0,0 +1,327 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no pooled connection becomes free within the checkout timeout."""
+
+
+def load_database_secrets(secrets_path=None):
+    """
+    Reads the [database] table of Streamlit's secrets.toml for code that runs
+    outside `streamlit run` (CLI tools, benchmarks). Looks in `secrets_path`,
+    then ./.streamlit/ and the app directory's .streamlit/.
+    """
+    import toml
+    candidates = [Path(secrets_path)] if secrets_path else [
+        Path.cwd() / ".streamlit" / "secrets.toml",
+        Path(__file__).resolve().parent / ".streamlit" / "secrets.toml",
+        Path.home() / ".streamlit" / "secrets.toml",
+    ]
+    for path in candidates:
+        if path.is_file():
+            return dict(toml.load(path).get("database", {}))
+    raise FileNotFoundError("No secrets.toml with a [database] table found in " + ", ".join(map(str, candidates)))
+
+
+def connect_from_secrets(dsn=None, secrets_path=None, connect_timeout=5):
+    """Opens a standalone connection from a DSN, $DATABASE_URL, or secrets.toml."""
+    dsn = dsn or os.environ.get("DATABASE_URL")
+    if dsn:
+        return psycopg2.connect(dsn, connect_timeout=connect_timeout)
+    cfg = load_database_secrets(secrets_path)
+    return psycopg2.connect(
+        host=cfg["host"], port=cfg["port"], dbname=cfg["dbname"],
+        user=cfg["user"], password=cfg["password"], connect_timeout=connect_timeout
+    )
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of psycopg2 connections shared by every
+    Streamlit session in the process.
+
+    Connections are checked for liveness on checkout when they have been idle
+    longer than `health_check_interval`; a failed check drops every idle
+    connection (they are almost always dead together after a server restart)
+    and dials a fresh one.
+    """
+
+    def __init__(self, dsn_kwargs, minconn=1, maxconn=10, connect_timeout=5,
+                 checkout_timeout=10, health_check_interval=30):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError("Pool size must satisfy 0 <= minconn <= maxconn and maxconn >= 1")
+        self.dsn_kwargs = dict(dsn_kwargs)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.connect_timeout = connect_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Condition()
+        self._idle = []          # list of (connection, last_used_monotonic)
+        self._size = 0           # idle + checked out
+        self._closed = False
+        self._stats = {
+            "checkouts": 0, "waits": 0, "wait_time_total": 0.0, "timeouts": 0,
+            "dials": 0, "dial_failures": 0, "health_checks": 0,
+            "failed_health_checks": 0, "discarded": 0,
+        }
+
+        for _ in range(minconn):
+            try:
+                conn = self._dial()
+            except psycopg2.OperationalError:
+                break
+            self._size += 1
+            self._idle.append((conn, time.monotonic()))
+
+    # --- Connection lifecycle ---
+    def _dial(self):
+        try:
+            conn = psycopg2.connect(
+                connect_timeout=self.connect_timeout,
+                keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3,
+                **self.dsn_kwargs
+            )
+        except psycopg2.OperationalError:
+            with self._lock:
+                self._stats["dial_failures"] += 1
+            raise
+        with self._lock:
+            self._stats["dials"] += 1
+        return conn
+
+    def _is_alive(self, conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Checks out a live connection, blocking up to `checkout_timeout` seconds."""
+        deadline = time.monotonic() + self.checkout_timeout
+        waited = False
+        wait_started = time.monotonic()
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("Connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    conn, last_used = None, None
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection available within {self.checkout_timeout}s "
+                                      f"(pool size {self.maxconn})")
+                waited = True
+                self._lock.wait(remaining)
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_time_total"] += time.monotonic() - wait_started
+
+        if conn is not None and (conn.closed or time.monotonic() - last_used > self.health_check_interval):
+            with self._lock:
+                self._stats["health_checks"] += 1
+            if not self._is_alive(conn):
+                self._discard(conn)
+                conn = None
+                with self._lock:
+                    self._stats["failed_health_checks"] += 1
+                    self._stats["discarded"] += 1
+                    stale, self._idle = self._idle, []
+                    self._size -= len(stale)
+                    self._stats["discarded"] += len(stale)
+                for stale_conn, _ in stale:
+                    self._discard(stale_conn)
+
+        if conn is None:
+            try:
+                conn = self._dial()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+        return conn
+
+    def release(self, conn, discard=False):
+        """Returns a connection to the pool, or drops it if it is broken."""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                discard = True
+        if discard or conn.closed:
+            self._discard(conn)
+            with self._lock:
+                self._size -= 1
+                self._stats["discarded"] += 1
+                self._lock.notify()
+            return
+        with self._lock:
+            if self._closed:
+                self._size -= 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection for the duration of a `with` block."""
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close(self):
+        """Closes every idle connection; checked-out ones are closed on release."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    # --- Introspection ---
+    def stats(self):
+        """Returns a snapshot of pool occupancy and lifetime counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "maxconn": self.maxconn,
+            })
+        return snapshot
+
+
+# --- Read/write routing ---
+_route = threading.local()
+
+def _routed(kind):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            previous = getattr(_route, "kind", None)
+            # Anything called from inside a write stays on the primary.
+            _route.kind = previous if previous == "write" else kind
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _route.kind = previous
+        wrapper.route = kind
+        return wrapper
+    return decorator
+
+# Tags for data-access functions: `reads` may be served by a replica, `writes`
+# always go to the primary and open the caller's read-your-writes window.
+reads = _routed("read")
+writes = _routed("write")
+
+def current_route():
+    """"read", "write" or None (untagged) for the innermost tagged function on this thread."""
+    return getattr(_route, "kind", None)
+
+
+class ReplicaRouter:
+    """
+    Round-robin over one ConnectionPool per read replica. A replica whose pool
+    fails to connect, or whose connection breaks mid-query, is skipped for
+    `retry_after` seconds; one whose pool is merely saturated (PoolTimeout) is
+    passed over for this read only. When no replica hands out a connection,
+    acquire() returns (None, None) and the caller falls back to the primary.
+    """
+
+    def __init__(self, pools, retry_after=30, read_your_writes=5):
+        self.pools = list(pools)
+        self.retry_after = retry_after
+        self.read_your_writes = read_your_writes
+        self._lock = threading.Lock()
+        self._next = 0
+        self._down_until = [0.0] * len(self.pools)
+        self._failovers = 0
+
+    def choose(self):
+        """
+        Index of the next replica that isn't marked down, or None; lets a client
+        with its own pool per replica (database_async) follow the same rotation.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.pools)):
+                index = self._next
+                self._next = (index + 1) % len(self.pools)
+                if self._down_until[index] <= now:
+                    return index
+        return None
+
+    def acquire(self):
+        """Returns (pool, connection) from the next healthy replica, or (None, None)."""
+        for _ in range(len(self.pools)):
+            index = self.choose()
+            if index is None:
+                break
+            pool = self.pools[index]
+            try:
+                return pool, pool.acquire()
+            except PoolTimeout:
+                continue    # busy, not broken: try the next replica
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self.mark_down(pool)
+        return None, None
+
+    def mark_down(self, pool):
+        with self._lock:
+            self._down_until[self.pools.index(pool)] = time.monotonic() + self.retry_after
+            self._failovers += 1
+
+    def owns(self, pool):
+        return any(pool is p for p in self.pools)
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            down = [until > now for until in self._down_until]
+            failovers = self._failovers
+        return {
+            "failovers": failovers,
+            "replicas": [dict(pool.stats(), healthy=not d) for pool, d in zip(self.pools, down)],
+        }
@@ -0,0 +1,298 @@
+"""
+Durable write-behind queue for non-critical writes.
+
+Writes are journaled to a local SQLite file and return at once; a background
+thread drains the journal oldest-first, applying up to `batch_size` entries in
+one database transaction. An entry enqueued with a key supersedes earlier
+entries with the same (op, key) in its batch, so repeated upserts of one row
+collapse to the last. While the database is unreachable the drainer retries
+with exponential backoff; the journal survives restarts, and draining resumes
+where it stopped.
+
+An entry that fails on its own for a reason other than connectivity is
+retried up to `max_attempts` times, then moved to the `dead_letters` table.
+
+enqueue() returns the entry's id; wait_for(id) lets the writer block (up to
+`read_wait` seconds by default) until that entry has been applied, so it can
+read its own write back.
+
+One journal file belongs to one process: two queues draining the same file
+would apply its entries twice.
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if hasattr(value, "item"):  # numpy scalars
+        return value.item()
+    raise TypeError(f"Cannot journal {type(value).__name__} values")
+
+
+def _decode(obj):
+    if "$datetime" in obj:
+        return datetime.fromisoformat(obj["$datetime"])
+    if "$date" in obj:
+        return date.fromisoformat(obj["$date"])
+    return obj
+
+
+def dumps(args):
+    return json.dumps(args, default=_encode)
+
+
+def loads(text):
+    return json.loads(text, object_hook=_decode)
+
+
+class WriteQueue:
+    """
+    Journals writes and applies them in the background through `apply_batch`.
+
+    `apply_batch(entries)` receives a list of (op, args) in journal order and
+    must apply them in a single transaction, returning False if the database
+    could not be reached. `is_transient(exc)` tells connectivity errors (retry
+    the whole batch later) from errors caused by an entry itself.
+    """
+
+    def __init__(self, path, apply_batch, is_transient=lambda exc: True, batch_size=200,
+                 max_backoff=60, max_attempts=5, idle_wait=1.0, read_wait=2.0):
+        self.path = path
+        self.apply_batch = apply_batch
+        self.is_transient = is_transient
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.idle_wait = idle_wait
+        self.read_wait = read_wait
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._drained = threading.Condition(self._lock)
+        self._closed = False
+        self._failures = 0            # consecutive failed drains
+        self._retry_at = 0.0
+        self._stats = {
+            "enqueued": 0, "applied": 0, "coalesced": 0, "batches": 0,
+            "retries": 0, "dead_letters": 0, "last_error": None, "last_lag_s": None,
+        }
+        self._journal = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._journal.execute("PRAGMA journal_mode = WAL")
+        self._journal.execute("PRAGMA synchronous = FULL")
+        self._journal.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                args TEXT NOT NULL,
+                key TEXT,
+                enqueued_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                id INTEGER PRIMARY KEY,
+                op TEXT NOT NULL,
+                args TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                attempts INTEGER NOT NULL,
+                error TEXT,
+                failed_at REAL NOT NULL
+            );
+        """)
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, op, args, key=None):
+        """Durably journals one write; returns its entry id once it is on disk."""
+        row = (op, dumps(list(args)), None if key is None else dumps(key), time.time())
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Write queue is closed")
+            entry_id = self._journal.execute("INSERT INTO entries (op, args, key, enqueued_at) VALUES (?, ?, ?, ?)", row).lastrowid
+            self._stats["enqueued"] += 1
+        self._wake.set()
+        return entry_id
+
+    def wait_for(self, entry_id, timeout=None):
+        """
+        Waits until entry `entry_id` and every entry before it have left the
+        journal (applied, superseded or dead-lettered). `timeout` defaults to
+        read_wait. Returns False on timeout.
+        """
+        timeout = self.read_wait if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        self._wake.set()
+        with self._drained:
+            while self._journal.execute("SELECT 1 FROM entries WHERE id <= ? LIMIT 1", (entry_id,)).fetchone():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    return False
+                self._drained.wait(remaining)
+        return True
+
+    def flush(self, timeout=None):
+        """Waits until the journal is empty. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._wake.set()
+        with self._drained:
+            while self._depth() and not self._closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._drained.wait(remaining if remaining is not None else 1.0)
+        return True
+
+    def close(self, timeout=5):
+        """Stops the drainer after its current batch. Pending entries stay journaled."""
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+        self._thread.join(timeout)
+        self._journal.close()
+
+    def stats(self):
+        """Queue depth, lag (age of the oldest pending entry) and drain counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            depth = self._depth()
+            oldest = self._journal.execute("SELECT min(enqueued_at) FROM entries").fetchone()[0]
+            snapshot.update({
+                "depth": depth,
+                "lag_s": 0.0 if oldest is None else max(time.time() - oldest, 0.0),
+                "consecutive_failures": self._failures,
+                "retry_in_s": max(self._retry_at - time.monotonic(), 0.0),
+            })
+        return snapshot
+
+    def _depth(self):
+        return self._journal.execute("SELECT count(*) FROM entries").fetchone()[0]
+
+    # --- drainer ---
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+            wait = self._retry_at - time.monotonic()
+            if wait > 0:
+                self._wake.wait(wait)
+                self._wake.clear()
+                continue
+            if not self._drain_once():
+                self._wake.wait(self.idle_wait)
+                self._wake.clear()
+
+    def _read_batch(self):
+        with self._lock:
+            if self._closed:
+                return []
+            return self._journal.execute(
+                "SELECT id, op, args, key, enqueued_at, attempts FROM entries ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+
+    def _coalesce(self, rows):
+        """Keeps only the last entry of each (op, key) pair, preserving journal order otherwise."""
+        last = {}
+        for i, (_, op, _, key, _, _) in enumerate(rows):
+            if key is not None:
+                last[(op, key)] = i
+        kept = [row for i, row in enumerate(rows) if row[3] is None or last[(row[1], row[3])] == i]
+        return kept, len(rows) - len(kept)
+
+    def _drain_once(self):
+        """Applies one batch. Returns True if there may be more to do right away."""
+        rows = self._read_batch()
+        if not rows:
+            with self._drained:
+                self._drained.notify_all()
+            return False
+        kept, coalesced = self._coalesce(rows)
+        try:
+            applied = self.apply_batch([(op, loads(args)) for _, op, args, _, _, _ in kept])
+        except Exception as e:
+            if self.is_transient(e):
+                self._back_off(e)
+                return False
+            return self._drain_individually(rows, kept, e)
+        if applied is False:
+            self._back_off("database unavailable")
+            return False
+        self._finish(rows, applied=len(kept), coalesced=coalesced)
+        return True
+
+    def _drain_individually(self, rows, kept, batch_error):
+        """Isolates the entries that make a batch fail, so the rest still go through."""
+        print(f"[write-behind] batch of {len(kept)} failed ({batch_error}); applying entries one by one")
+        done = [row for row in rows if row not in kept]   # superseded entries
+        applied = 0
+        backed_off = False
+        for row in kept:
+            entry_id, op, args, key, enqueued_at, attempts = row
+            try:
+                if self.apply_batch([(op, loads(args))]) is False:
+                    self._back_off("database unavailable")
+                    backed_off = True
+                    break
+            except Exception as e:
+                if self.is_transient(e):
+                    self._back_off(e)
+                    backed_off = True
+                    break
+                self._record_failure(row, e)
+                continue
+            done.append(row)
+            applied += 1
+        self._finish(done, applied=applied, coalesced=len(rows) - len(kept), recovered=not backed_off)
+        return not backed_off
+
+    def _record_failure(self, row, error):
+        entry_id, op, args, key, enqueued_at, attempts = row
+        attempts += 1
+        with self._lock:
+            self._stats["last_error"] = f"{op}: {error}"
+            if attempts < self.max_attempts:
+                self._journal.execute("UPDATE entries SET attempts = ? WHERE id = ?", (attempts, entry_id))
+                return
+            self._journal.execute("BEGIN")
+            self._journal.execute(
+                "INSERT INTO dead_letters (id, op, args, enqueued_at, attempts, error, failed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry_id, op, args, enqueued_at, attempts, str(error), time.time()),
+            )
+            self._journal.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+            self._journal.execute("COMMIT")
+            self._stats["dead_letters"] += 1
+            self._drained.notify_all()
+        print(f"[write-behind] gave up on {op} entry {entry_id} after {attempts} attempts: {error}")
+
+    def _finish(self, rows, applied, coalesced, recovered=True):
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            self._journal.execute(
+                f"DELETE FROM entries WHERE id IN ({', '.join('?' * len(rows))})", [row[0] for row in rows]
+            )
+            self._stats["applied"] += applied
+            self._stats["coalesced"] += coalesced
+            self._stats["batches"] += 1
+            self._stats["last_lag_s"] = now - min(row[4] for row in rows)
+            self._drained.notify_all()   # wake wait_for() callers
+            if recovered:
+                self._failures = 0
+                self._retry_at = 0.0
+
+    def _back_off(self, error):
+        with self._lock:
+            self._failures += 1
+            self._stats["retries"] += 1
+            self._stats["last_error"] = str(error)
+            delay = min(self.max_backoff, 0.5 * 2 ** (self._failures - 1)) * random.uniform(0.5, 1.0)
+            self._retry_at = time.monotonic() + delay
+        print(f"[write-behind] drain failed ({error}); retrying in {delay:.1f}s")
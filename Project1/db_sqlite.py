@@ -0,0 +1,308 @@
+"""
+Embedded SQLite storage backend for single-node deployments and tests.
+
+Selected with `backend = "sqlite"` (and optionally `sqlite_path`) in the
+[database] secrets table. SQLiteBackend offers the same acquire/release/stats
+interface as db_pool.ConnectionPool, and its connections accept the
+psycopg2-style SQL in database.py: %s / %(name)s placeholders are rewritten,
+Python lists are stored as JSON (answers), and dates, timestamps and booleans
+come back as the same Python types Postgres returns. database.py branches on
+`db.dialect` only where Postgres-specific features are used.
+
+Needs SQLite 3.35+ (RETURNING); the database runs in WAL mode with foreign
+keys on, so ON DELETE CASCADE behaves as it does on Postgres.
+"""
+import itertools
+import json
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, time
+from functools import lru_cache
+
+SCHEMA_VERSION = 5
+
+_NOW = "(strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'))"
+
+# Mirrors migrations.py (baseline schema, conversation kind, hot-path indexes, daily rollup,
+# per-question PHQ-9 answers, login sessions, emotion tallies). Monthly partitioning is
+# Postgres-only.
+SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        email TEXT NOT NULL UNIQUE,
+        username TEXT NOT NULL,
+        full_name TEXT,
+        hashed_password TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT {_NOW}
+    );
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        kind TEXT NOT NULL DEFAULT 'chat',
+        title TEXT NOT NULL DEFAULT 'New Chat',
+        start_time TIMESTAMP NOT NULL DEFAULT {_NOW},
+        completion_score INTEGER,
+        answers INTARRAY,
+        video_url TEXT
+    );
+    CREATE TABLE IF NOT EXISTS chat_history (
+        id INTEGER PRIMARY KEY,
+        conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TIMESTAMP NOT NULL DEFAULT {_NOW}
+    );
+    CREATE TABLE IF NOT EXISTS calendar_events (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        title TEXT NOT NULL,
+        start_time TIMESTAMP NOT NULL,
+        end_time TIMESTAMP NOT NULL,
+        color TEXT DEFAULT '#6f42c1',
+        is_generated BOOLEAN NOT NULL DEFAULT FALSE,
+        completed BOOLEAN NOT NULL DEFAULT FALSE,
+        user_mood INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS behavior_logs (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        log_date DATE NOT NULL,
+        hours_played REAL,
+        mood_score REAL,
+        solo_play_ratio REAL,
+        late_night_gaming BOOLEAN,
+        physical_breaks INTEGER,
+        social_interaction_score INTEGER,
+        risk_score INTEGER,
+        UNIQUE (user_id, log_date)
+    );
+    CREATE TABLE IF NOT EXISTS emotion_logs (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        date DATE NOT NULL,
+        emotion TEXT NOT NULL,
+        probability REAL,
+        vader_compound REAL,
+        UNIQUE (user_id, date)
+    );
+    CREATE TABLE IF NOT EXISTS daily_user_metrics (
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        day DATE NOT NULL,
+        phq9_score INTEGER,
+        assessments INTEGER NOT NULL DEFAULT 0,
+        risk_score INTEGER,
+        mood_score REAL,
+        hours_played REAL,
+        emotion_counts JSON NOT NULL DEFAULT '{{}}',
+        vader_n INTEGER NOT NULL DEFAULT 0,
+        vader_sum REAL NOT NULL DEFAULT 0,
+        vader_sumsq REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    );
+    CREATE TABLE IF NOT EXISTS emotion_tallies (
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        day DATE NOT NULL,
+        source TEXT NOT NULL,
+        emotion TEXT NOT NULL,
+        analyses INTEGER NOT NULL,
+        vader_n INTEGER NOT NULL DEFAULT 0,
+        vader_sum REAL NOT NULL DEFAULT 0,
+        vader_sumsq REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, source, emotion)
+    );
+    INSERT INTO emotion_tallies (user_id, day, source, emotion, analyses, vader_n, vader_sum, vader_sumsq)
+    SELECT m.user_id, m.day, 'live', e.key, e.value,
+           CASE WHEN e.id = first_id THEN m.vader_n ELSE 0 END,
+           CASE WHEN e.id = first_id THEN m.vader_sum ELSE 0 END,
+           CASE WHEN e.id = first_id THEN m.vader_sumsq ELSE 0 END
+    FROM (SELECT *, (SELECT min(id) FROM json_each(emotion_counts)) AS first_id FROM daily_user_metrics) m,
+         json_each(m.emotion_counts) e
+    WHERE true
+    ON CONFLICT (user_id, day, source, emotion) DO NOTHING;
+    CREATE TABLE IF NOT EXISTS phq9_answers (
+        conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        answered_at TIMESTAMP NOT NULL,
+        question INTEGER NOT NULL CHECK (question BETWEEN 1 AND 9),
+        answer INTEGER NOT NULL CHECK (answer BETWEEN 0 AND 3),
+        PRIMARY KEY (conversation_id, question)
+    );
+    CREATE TABLE IF NOT EXISTS sessions (
+        token_hash TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        created_at TIMESTAMP NOT NULL,
+        last_seen TIMESTAMP NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id);
+    CREATE INDEX IF NOT EXISTS idx_phq9_answers_user_question_time ON phq9_answers (user_id, question, answered_at, answer);
+    CREATE INDEX IF NOT EXISTS idx_conversations_user_start ON conversations (user_id, start_time DESC);
+    CREATE INDEX IF NOT EXISTS idx_conversations_phq9_user_start ON conversations (user_id, start_time DESC)
+        WHERE kind = 'phq9' AND completion_score IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_chat_history_conversation_ts ON chat_history (conversation_id, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_calendar_events_user_start ON calendar_events (user_id, start_time);
+    CREATE INDEX IF NOT EXISTS idx_calendar_events_user_generated ON calendar_events (user_id) WHERE is_generated;
+"""
+
+# Declared column types -> Python values, matching what psycopg2 returns.
+sqlite3.register_converter("TIMESTAMP", lambda b: datetime.fromisoformat(b.decode()))
+sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()[:10]))
+sqlite3.register_converter("BOOLEAN", lambda b: b not in (b"0", b""))
+sqlite3.register_converter("INTARRAY", lambda b: json.loads(b))
+sqlite3.register_converter("JSON", lambda b: json.loads(b))
+
+
+def _adapt(value):
+    if isinstance(value, datetime):
+        # A fixed-width fraction keeps stored timestamps ordered as text.
+        return value.isoformat(timespec="microseconds")
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return json.dumps([_adapt(v) for v in value])
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):  # numpy scalars
+        return value.item()
+    return value
+
+
+def _adapt_params(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return {k: _adapt(v) for k, v in params.items()}
+    return tuple(_adapt(v) for v in params)
+
+
+_NAMED_PARAM = re.compile(r"%\((\w+)\)s")
+
+@lru_cache(maxsize=512)
+def translate(sql):
+    """Rewrites psycopg2 placeholders (%s, %(name)s, %%) as SQLite ones (?, :name, %)."""
+    return _NAMED_PARAM.sub(r":\1", sql).replace("%s", "?").replace("%%", "%")
+
+
+class SQLiteCursor(sqlite3.Cursor):
+    def execute(self, sql, params=None):
+        return super().execute(translate(sql), _adapt_params(params))
+
+    def executemany(self, sql, seq_of_params):
+        return super().executemany(translate(sql), (_adapt_params(p) for p in seq_of_params))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SQLiteConnection(sqlite3.Connection):
+    dialect = "sqlite"
+
+    def cursor(self, name=None, factory=None):
+        # `name` is psycopg2's server-side cursor name; SQLite cursors already step lazily.
+        return super().cursor(factory or SQLiteCursor)
+
+
+class SQLiteBackend:
+    """
+    A small pool of sqlite3 connections to one database file, with the
+    acquire/release/stats/close interface of db_pool.ConnectionPool. The schema
+    is created on first use. Pass ":memory:" for a private in-process database.
+    """
+    dialect = "sqlite"
+    _memory_ids = itertools.count()
+
+    def __init__(self, path, max_idle=10, busy_timeout=5):
+        self.max_idle = max_idle
+        self.busy_timeout = busy_timeout
+        self._uri = path == ":memory:"
+        # Every connection to a shared-cache memory database sees the same data
+        # as long as one stays open, so the backend keeps `_keeper` for its lifetime.
+        self.path = f"file:companion-{next(self._memory_ids)}?mode=memory&cache=shared" if self._uri else path
+        self._lock = threading.Lock()
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._stats = {"checkouts": 0, "dials": 0, "discarded": 0}
+        self._keeper = self._open()
+        self._ensure_schema(self._keeper)
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path, timeout=self.busy_timeout, detect_types=sqlite3.PARSE_DECLTYPES,
+            factory=SQLiteConnection, check_same_thread=False, uri=self._uri,
+        )
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        with self._lock:
+            self._stats["dials"] += 1
+        return conn
+
+    def _ensure_schema(self, conn):
+        conn.execute("PRAGMA journal_mode = WAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+
+    def acquire(self):
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("SQLite backend is closed")
+            self._stats["checkouts"] += 1
+            self._size += 1
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return self._open()
+        except sqlite3.Error:
+            with self._lock:
+                self._size -= 1
+            raise
+
+    def release(self, conn, discard=False):
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                discard = True
+        with self._lock:
+            self._size -= 1
+            keep = not discard and not self._closed and len(self._idle) < self.max_idle
+            if keep:
+                self._idle.append(conn)
+            elif discard:
+                self._stats["discarded"] += 1
+        if not keep:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except sqlite3.OperationalError:
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+        self._keeper.close()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "size": self._size + len(self._idle), "idle": len(self._idle), "in_use": self._size,
+                "maxconn": self.max_idle, "waits": 0, "timeouts": 0,
+            })
+        return snapshot
@@ -0,0 +1,117 @@
+"""
+Batched emotion and sentiment inference for the Emotion Analysis page.
+
+analyze_many() tokenizes every text in one call, sorts the texts by token
+length and runs them through the transformer in micro-batches padded only to
+the longest text of each batch, so short messages don't pay for long ones.
+Results come back in input order together with each text's VADER scores.
+
+The classifier runs on one of BACKENDS, chosen with load_classifier():
+"torch" (the PyTorch model), "onnx" (ONNX Runtime) or "onnx-int8" (ONNX
+Runtime with int8-quantized weights); see emotion_onnx. torch, transformers
+and nltk are only imported when a model is first loaded or run.
+"""
+from lazy_loading import lazy_import
+
+torch = lazy_import("torch")
+
+MODEL_NAME = "bhadresh-savani/distilbert-base-uncased-emotion"
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Micro-batches hold at most this many texts and this many (padded) tokens.
+BATCH_SIZE = 64
+MAX_BATCH_TOKENS = 8192
+MAX_LENGTH = 512
+
+
+def length_buckets(lengths, batch_size=BATCH_SIZE, max_tokens=MAX_BATCH_TOKENS):
+    """
+    Groups text indices into batches of similar length: shortest first, each
+    batch closed when adding the next text would exceed `batch_size` texts or
+    `max_tokens` padded tokens.
+    """
+    batch = []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # Sorted ascending, so text i is the longest of the batch if added.
+        if batch and (len(batch) == batch_size or (len(batch) + 1) * lengths[i] > max_tokens):
+            yield batch
+            batch = []
+        batch.append(i)
+    if batch:
+        yield batch
+
+
+def load_classifier(backend="torch", model_name=MODEL_NAME, model_dir=None, threads=None):
+    """
+    Loads the emotion model for `backend`. `threads` sets the intra-op thread
+    count (torch.set_num_threads for "torch"); `model_dir` is where the onnx
+    backends keep their exported files.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown emotion backend: {backend}")
+    if backend == "torch":
+        from transformers import AutoModelForSequenceClassification
+
+        if threads:
+            torch.set_num_threads(int(threads))
+        return AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    from emotion_onnx import MODEL_DIR, load_onnx_model
+
+    return load_onnx_model(model_name, quantized=backend == "onnx-int8", model_dir=model_dir or MODEL_DIR, threads=threads)
+
+
+def load_vader():
+    """VADER's analyzer, downloading its lexicon first if nltk doesn't have it."""
+    import nltk
+    from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+    try:
+        nltk.data.find('sentiment/vader_lexicon.zip')
+    except LookupError:
+        nltk.download('vader_lexicon')
+    return SentimentIntensityAnalyzer()
+
+
+def load_pipeline(backend="torch", model_dir=None, threads=None):
+    """(tokenizer, classifier, VADER analyzer), the arguments analyze_many takes after the texts."""
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(MODEL_NAME), load_classifier(backend, model_dir=model_dir, threads=threads), load_vader()
+
+
+def _batch_probabilities(tokenizer, model, features):
+    if hasattr(model, "probabilities"):  # emotion_onnx.OnnxEmotionModel: numpy only, never imports torch
+        return model.probabilities(tokenizer.pad(features, return_tensors="np"))
+    with torch.inference_mode():
+        padded = tokenizer.pad(features, return_tensors="pt")
+        return torch.softmax(model(**padded).logits, dim=-1).tolist()
+
+
+def emotion_distributions(texts, tokenizer, model, batch_size=BATCH_SIZE, max_tokens=MAX_BATCH_TOKENS):
+    """Returns one {label: probability} dict per text, in input order."""
+    if not texts:
+        return []
+    encoded = tokenizer(list(texts), truncation=True, max_length=MAX_LENGTH)
+    input_ids, attention_mask = encoded["input_ids"], encoded["attention_mask"]
+    labels = [model.config.id2label[i] for i in range(model.config.num_labels)]
+    results = [None] * len(texts)
+    for batch in length_buckets([len(ids) for ids in input_ids], batch_size, max_tokens):
+        features = {"input_ids": [input_ids[i] for i in batch], "attention_mask": [attention_mask[i] for i in batch]}
+        for i, row in zip(batch, _batch_probabilities(tokenizer, model, features)):
+            results[i] = dict(zip(labels, row))
+    return results
+
+
+def analyze_many(texts, tokenizer, model, vader_analyzer, batch_size=BATCH_SIZE, max_tokens=MAX_BATCH_TOKENS):
+    """
+    Emotion distribution and VADER scores for every text, in input order:
+    [{"emotions": {label: probability}, "vader": {"neg", "neu", "pos", "compound"}}, ...]
+    """
+    emotions = emotion_distributions(texts, tokenizer, model, batch_size, max_tokens)
+    return [{"emotions": dist, "vader": vader_analyzer.polarity_scores(text)} for text, dist in zip(texts, emotions)]
+
+
+def top_emotion(distribution):
+    """(label, probability) of the most likely emotion."""
+    label = max(distribution, key=distribution.get)
+    return label, distribution[label]
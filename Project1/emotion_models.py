@@ -0,0 +1,80 @@
+"""
+Process-wide emotion models and their background warm-up.
+
+load_models() and get_inference_cache() are shared by every session of the
+server process. app.py calls start_warmup() on the login screen, which imports
+the heavy libraries, loads the models and runs a first inference on a
+background thread, so the Emotion Analysis page is ready by the time a user
+opens it.
+
+Configured by the optional [emotion] table in st.secrets: backend ("torch",
+"onnx" or "onnx-int8"), model_dir, threads, cache_path ("" keeps results in
+memory only), cache_max_entries, cache_disk_max_entries and warmup (default
+true).
+"""
+import functools
+
+import streamlit as st
+
+from emotion_inference import analyze_many, load_pipeline
+from inference_cache import InferenceCache, cached_analyze, model_version
+from lazy_loading import Warmup, preload
+
+# Imported by the warm-up before anything needs them; the pages import them lazily.
+# The onnx backends run on numpy and onnxruntime and never need torch.
+PRELOAD_MODULES = {
+    "torch": ("torch", "transformers", "nltk", "google.generativeai"),
+    "onnx": ("onnxruntime", "transformers", "nltk", "google.generativeai"),
+}
+
+
+def _settings():
+    return st.secrets.get("emotion", {})
+
+
+def preload_modules(backend):
+    """The heavy modules `backend` ("torch", "onnx" or "onnx-int8") imports."""
+    return PRELOAD_MODULES["torch" if backend == "torch" else "onnx"]
+
+
+@st.cache_resource(show_spinner="Loading the emotion models...")
+def load_models():
+    cfg = _settings()
+    return load_pipeline(cfg.get("backend", "torch"), model_dir=cfg.get("model_dir"), threads=cfg.get("threads"))
+
+
+@st.cache_resource
+def get_inference_cache():
+    cfg = _settings()
+    _, transformer_model, vader_analyzer = load_models()
+    return InferenceCache(
+        model_version(cfg.get("backend", "torch"), transformer_model, vader_analyzer),
+        path=cfg.get("cache_path", "inference_cache.db") or None,
+        maxsize=int(cfg.get("cache_max_entries", 4096)),
+        disk_max_entries=int(cfg.get("cache_disk_max_entries", 200_000)),
+    )
+
+
+def analyze_texts(texts):
+    """analyze_many for `texts`, reusing cached results of texts seen before."""
+    tokenizer, transformer_model, vader_analyzer = load_models()
+    analyze = functools.partial(analyze_many, tokenizer=tokenizer, model=transformer_model, vader_analyzer=vader_analyzer)
+    return cached_analyze(texts, get_inference_cache(), analyze)
+
+
+def warmup_steps(load, backend):
+    """Steps importing `backend`'s modules, calling load() for the pipeline and running a first inference with it."""
+    steps = [(f"import {name}", functools.partial(preload, name)) for name in preload_modules(backend)]
+    steps.append(("load models", load))
+    steps.append(("first inference", lambda: analyze_many(["warm-up"], *load())))
+    return steps
+
+
+@st.cache_resource
+def start_warmup():
+    """Starts the warm-up once per server process (unless warmup = false) and returns it for its stats."""
+    cfg = _settings()
+    warmup = Warmup(warmup_steps(load_models, cfg.get("backend", "torch")) + [("inference cache", get_inference_cache)])
+    if cfg.get("warmup", True):
+        warmup.start()
+    return warmup
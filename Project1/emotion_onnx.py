@@ -0,0 +1,104 @@
+"""
+ONNX Runtime backend for the emotion classifier.
+
+The Hugging Face model is exported to ONNX once (and, for "onnx-int8", its
+weights dynamically quantized to int8) under `model_dir`, then served by an
+onnxruntime InferenceSession instead of PyTorch:
+
+    models/<model name>/model.onnx
+    models/<model name>/model.int8.onnx
+
+The files are rebuilt when missing; delete the directory to re-export after a
+model change. Needs onnxruntime (and onnx for export and quantization),
+which are optional: `pip install -r requirements-onnx.txt`. The default
+"torch" backend works without them.
+"""
+import os
+
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:  # optional; only the onnx backends need it
+    onnxruntime = None
+
+MODEL_DIR = "models"
+OPSET = 14
+
+
+def model_paths(model_name, model_dir=MODEL_DIR):
+    """(fp32 path, int8 path) of a model's exported files."""
+    base = os.path.join(model_dir, model_name.replace("/", "__"))
+    return os.path.join(base, "model.onnx"), os.path.join(base, "model.int8.onnx")
+
+
+def export_onnx(model_name, path):
+    """Exports the PyTorch model to ONNX with dynamic batch and sequence axes."""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + ".partial"
+    axes = {0: "batch", 1: "sequence"}
+    with torch.inference_mode():
+        torch.onnx.export(
+            model, (sample["input_ids"], sample["attention_mask"]), partial,
+            input_names=["input_ids", "attention_mask"], output_names=["logits"],
+            dynamic_axes={"input_ids": axes, "attention_mask": axes, "logits": {0: "batch"}},
+            opset_version=OPSET,
+        )
+    os.replace(partial, path)   # a crashed export never leaves a half-written model behind
+
+
+def quantize_int8(source, path):
+    """Dynamic int8 quantization: weights stored as int8, activations quantized per batch at run time."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    partial = path + ".partial"
+    quantize_dynamic(source, partial, weight_type=QuantType.QInt8)
+    os.replace(partial, path)
+
+
+class OnnxEmotionModel:
+    """
+    An exported classifier on an onnxruntime session. `config` is the Hugging
+    Face config (for id2label), `threads` the intra-op thread count (None lets
+    onnxruntime use every core).
+    """
+
+    def __init__(self, path, config, threads=None):
+        if onnxruntime is None:
+            raise RuntimeError("The onnx emotion backends need onnxruntime installed")
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        self.path = path
+        self.config = config
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def probabilities(self, encoded):
+        """Softmax rows for a padded numpy batch with input_ids and attention_mask."""
+        logits = self.session.run(["logits"], {
+            "input_ids": encoded["input_ids"].astype(np.int64),
+            "attention_mask": encoded["attention_mask"].astype(np.int64),
+        })[0]
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return (exp / exp.sum(axis=-1, keepdims=True)).tolist()
+
+
+def load_onnx_model(model_name, quantized=False, model_dir=MODEL_DIR, threads=None):
+    """Returns an OnnxEmotionModel, exporting (and quantizing) the model first if its files are missing."""
+    from transformers import AutoConfig
+
+    fp32, int8 = model_paths(model_name, model_dir)
+    if not os.path.exists(fp32):
+        export_onnx(model_name, fp32)
+    if quantized and not os.path.exists(int8):
+        quantize_int8(fp32, int8)
+    return OnnxEmotionModel(int8 if quantized else fp32, AutoConfig.from_pretrained(model_name), threads)
@@ -0,0 +1,200 @@
+"""
+Content-addressed cache of emotion and sentiment results.
+
+A result ({"emotions": {...}, "vader": {...}}, as emotion_inference.analyze_many
+returns it) is stored under the SHA-256 of the model version and the
+normalized text. Normalization only folds Unicode forms and whitespace; case
+and punctuation stay, because VADER scores "GG!!!" differently from "gg".
+
+Two tiers: a per-process LRU in memory and an optional SQLite file shared by
+every process on the host. The model version is a fingerprint of the model
+artifact and the VADER lexicon (model_version()), so a new model or lexicon
+gets fresh keys, and opening the file deletes results of every other version.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_IN_BATCH = 500   # keys per SELECT ... IN (...) on the disk tier
+
+
+def normalize(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def _file_digest(path, digest):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+
+
+def model_version(backend, model, vader_analyzer=None):
+    """
+    Fingerprint of what produces a result: the backend, the model artifact
+    (the ONNX file's contents, a local model directory's weights, or the Hugging
+    Face revision) and the VADER lexicon.
+    """
+    digest = hashlib.sha256(backend.encode())
+    path = getattr(model, "path", None)  # emotion_onnx.OnnxEmotionModel
+    source = getattr(getattr(model, "config", None), "_name_or_path", "")
+    if path:
+        _file_digest(path, digest)
+    elif source and os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.endswith((".safetensors", ".bin", ".json")):
+                _file_digest(os.path.join(source, name), digest)
+    else:
+        digest.update(f"{source}@{getattr(model.config, '_commit_hash', None)}".encode())
+    lexicon = getattr(vader_analyzer, "lexicon_file", None)  # nltk keeps the lexicon text here
+    if isinstance(lexicon, str):
+        digest.update(lexicon.encode())
+    return digest.hexdigest()
+
+
+def _copy_result(result):
+    """Callers may mutate what they get back; hand out copies."""
+    return {part: dict(scores) for part, scores in result.items()}
+
+
+class InferenceCache:
+    """
+    Memory LRU of `maxsize` results in front of an optional SQLite file at
+    `path` holding up to `disk_max_entries` (oldest dropped first). Counts hits
+    per tier and the inference time they saved, estimated from the mean time
+    per analysed text.
+    """
+
+    def __init__(self, version, path=None, maxsize=4096, disk_max_entries=200_000):
+        self.version = version
+        self.path = path
+        self.maxsize = maxsize
+        self.disk_max_entries = disk_max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> result
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "inferred": 0, "inference_seconds": 0.0}
+        self._disk = None
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._disk.execute("PRAGMA journal_mode = WAL")
+            self._disk.execute("PRAGMA synchronous = NORMAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, version TEXT NOT NULL, "
+                "result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS idx_results_created ON results (created_at)")
+            self._disk.execute("DELETE FROM results WHERE version != ?", (version,))
+            self._disk_entries = self._disk.execute("SELECT count(*) FROM results").fetchone()[0]
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.version}\0{normalize(text)}".encode()).hexdigest()
+
+    def _remember(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get_many(self, keys):
+        """Results for `keys` in order, None for misses; disk hits are promoted to memory."""
+        results = [None] * len(keys)
+        with self._lock:
+            missing = {}
+            for i, key in enumerate(keys):
+                result = self._entries.get(key)
+                if result is not None:
+                    self._entries.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    results[i] = _copy_result(result)
+                else:
+                    missing.setdefault(key, []).append(i)
+            if missing and self._disk is not None:
+                wanted = list(missing)
+                for start in range(0, len(wanted), _IN_BATCH):
+                    batch = wanted[start:start + _IN_BATCH]
+                    rows = self._disk.execute(
+                        f"SELECT key, result FROM results WHERE key IN ({', '.join('?' * len(batch))})", batch
+                    ).fetchall()
+                    for key, text in rows:
+                        result = json.loads(text)
+                        self._remember(key, result)
+                        for i in missing.pop(key):
+                            self._stats["disk_hits"] += 1
+                            results[i] = _copy_result(result)
+            self._stats["misses"] += sum(len(positions) for positions in missing.values())
+        return results
+
+    def put_many(self, items, seconds=0.0):
+        """Stores (key, result) pairs that took `seconds` of inference to compute."""
+        items = list(items)
+        with self._lock:
+            self._stats["inferred"] += len(items)
+            self._stats["inference_seconds"] += seconds
+            for key, result in items:
+                self._remember(key, result)
+            if self._disk is None or not items:
+                return
+            now = time.time()
+            self._disk.execute("BEGIN")
+            try:
+                before = self._disk.total_changes
+                self._disk.executemany(
+                    "INSERT OR IGNORE INTO results (key, version, result, created_at) VALUES (?, ?, ?, ?)",
+                    [(key, self.version, json.dumps(result), now) for key, result in items],
+                )
+                self._disk_entries += self._disk.total_changes - before
+                excess = self._disk_entries - self.disk_max_entries
+                if excess > 0:
+                    self._disk.execute(
+                        "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY created_at LIMIT ?)", (excess,)
+                    )
+                    self._disk_entries -= excess
+                self._disk.execute("COMMIT")
+            except Exception:
+                self._disk.execute("ROLLBACK")
+                raise
+
+    def stats(self):
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            lookups = hits + self._stats["misses"]
+            per_text = self._stats["inference_seconds"] / self._stats["inferred"] if self._stats["inferred"] else 0.0
+            return {
+                **self._stats, "entries": len(self._entries), "maxsize": self.maxsize,
+                "disk_entries": self._disk_entries if self._disk is not None else 0,
+                "hit_ratio": hits / lookups if lookups else 0.0, "saved_seconds": hits * per_text,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM results")
+                self._disk_entries = 0
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+
+
+def cached_analyze(texts, cache, analyze):
+    """
+    analyze(texts) through `cache`: only texts without a cached result (each
+    distinct one once) are analysed. Returns results in input order.
+    """
+    keys = [cache.key(text) for text in texts]
+    results = cache.get_many(keys)
+    pending = {}
+    for key, text, result in zip(keys, texts, results):
+        if result is None:
+            pending.setdefault(key, text)
+    if pending:
+        started = time.perf_counter()
+        fresh = dict(zip(pending, analyze(list(pending.values()))))
+        cache.put_many(fresh.items(), time.perf_counter() - started)
+        results = [_copy_result(fresh[key]) if result is None else result for key, result in zip(keys, results)]
+    return results
@@ -0,0 +1,116 @@
+"""
+Deferred imports and background warm-up for heavy dependencies.
+
+    torch = lazy_import("torch")
+
+binds a placeholder module that imports the real one on first attribute
+access, so a page that only sometimes needs torch, transformers, nltk or
+google.generativeai doesn't pay for the import on every first visit. A Warmup
+runs slow start-up steps (imports, model loads) once on a daemon thread, so they
+are usually finished before a user needs them.
+"""
+import importlib
+import sys
+import threading
+import time
+import types
+
+_import_times = {}
+_import_lock = threading.Lock()
+
+
+def preload(name):
+    """Imports `name` now, recording how long the first import took."""
+    if name in sys.modules:
+        return sys.modules[name]
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    with _import_lock:
+        _import_times.setdefault(name, time.perf_counter() - started)
+    return module
+
+
+def import_times():
+    """Seconds each module imported through this module took, in import order."""
+    with _import_lock:
+        return dict(_import_times)
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for module `name` until an attribute is first read."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = self.__dict__["_module"] = preload(self.__name__)
+        return module
+
+    def __getattr__(self, attr):
+        # Only reached for attributes the placeholder itself doesn't have.
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name):
+    """The module itself if it is already imported, else a LazyModule for it."""
+    return sys.modules.get(name) or LazyModule(name)
+
+
+class Warmup:
+    """
+    Runs (name, callable) steps in order on a daemon thread, once, timing each.
+    A failing step is printed and stops the run; whatever it was loading is
+    then loaded on demand as before.
+    """
+
+    def __init__(self, steps):
+        self._steps = list(steps)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+        self._timings = {}
+        self._error = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            for name, step in self._steps:
+                started = time.perf_counter()
+                try:
+                    step()
+                except Exception as e:
+                    print(f"Warm-up step '{name}' failed: {e}")
+                    with self._lock:
+                        self._error = f"{name}: {e}"
+                    return
+                finally:
+                    with self._lock:
+                        self._timings[name] = time.perf_counter() - started
+        finally:
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """True once the warm-up has finished (or failed); False on timeout or if it never started."""
+        return self._thread is not None and self._done.wait(timeout)
+
+    def stats(self):
+        with self._lock:
+            if self._thread is None:
+                state = "off"
+            elif not self._done.is_set():
+                state = "running"
+            else:
+                state = "failed" if self._error else "done"
+            return {"state": state, "steps": dict(self._timings), "seconds": sum(self._timings.values()), "error": self._error}
@@ -0,0 +1,17 @@
+"""
+Synthetic multi-user load harness for database.py.
+
+Seeds a local Postgres with generated users and history, then replays the
+app's page workflows against the real data-access functions from many
+threads at once. Run from the Project1 directory:
+
+    python -m loadtest seed --users 500 --days 730
+    python -m loadtest run --concurrency 50 --duration 60
+    python -m loadtest reset
+    python -m loadtest.hashing --costs 14,15,16 --workers 1,2,4
+    python -m loadtest.emotion bench --backends torch,onnx,onnx-int8
+    python -m loadtest.startup --login-seconds 5
+
+See `python -m loadtest <command> --help` for every option. The hashing,
+emotion and startup benchmarks need no database; each takes --help too.
+"""
@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import psycopg2
+
+import database
+from db_cache import QueryCache
+from db_pool import ConnectionPool, load_database_secrets
+from loadtest import seed as seeding
+from loadtest.metrics import CountingConnection, Recorder, format_report, round_trips
+from loadtest.workflows import WORKFLOWS
+from migrations import upgrade
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1", ""}
+
+
+def _dsn_kwargs(args):
+    dsn = args.dsn or os.environ.get("DATABASE_URL")
+    if dsn:
+        return {"dsn": dsn}, urlparse(dsn).hostname or ""
+    cfg = load_database_secrets(args.secrets)
+    return {k: cfg[k] for k in ("host", "port", "dbname", "user", "password")}, cfg["host"]
+
+
+def _install(args, maxconn):
+    """Points database.py at the target database through a round-trip counting pool."""
+    dsn_kwargs, host = _dsn_kwargs(args)
+    if host not in LOCAL_HOSTS and not args.allow_remote:
+        sys.exit(f"Refusing to load-test non-local host {host!r}; pass --allow-remote to override.")
+    dsn_kwargs["connection_factory"] = CountingConnection
+    pool = ConnectionPool(dsn_kwargs, minconn=1, maxconn=maxconn, checkout_timeout=60)
+    database.use_standalone_resources(pool, QueryCache(maxsize=args.cache_entries, ttl=args.cache_ttl))
+    return pool
+
+
+def _virtual_user(rng, users, mix, recorder, deadline, iterations):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    done = 0
+    while time.monotonic() < deadline and (iterations is None or done < iterations):
+        name = rng.choices(names, weights)[0]
+        user_id, email = rng.choice(users)
+        trips_before = round_trips()
+        started = time.perf_counter()
+        ok = True
+        try:
+            WORKFLOWS[name][0](rng, user_id, email)
+        except Exception as e:
+            ok = False
+            print(f"[{name}] user {user_id}: {e}", file=sys.stderr)
+        recorder.record(name, time.perf_counter() - started, round_trips() - trips_before, ok)
+        done += 1
+
+
+def run(concurrency, duration, iterations=None, mix=None, random_seed=11):
+    """Replays weighted workflows from `concurrency` threads. Returns (report, pool stats, cache stats)."""
+    users = seeding.seeded_users()
+    if not users:
+        raise RuntimeError("No synthetic users found; run `python -m loadtest seed` first.")
+    mix = mix or {name: weight for name, (_, weight) in WORKFLOWS.items()}
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=_virtual_user, name=f"vu-{i}",
+                         args=(random.Random(random_seed + i), users, mix, recorder, deadline, iterations))
+        for i in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return recorder.summary(elapsed), database.get_pool_stats(), database.get_cache_stats()
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in WORKFLOWS:
+            raise argparse.ArgumentTypeError(f"Unknown workflow {name!r}; choose from {', '.join(WORKFLOWS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m loadtest", description="Seed and load-test a local database.")
+    parser.add_argument("--dsn", help="libpq connection string (defaults to $DATABASE_URL or .streamlit/secrets.toml)")
+    parser.add_argument("--secrets", help="Path to a secrets.toml containing a [database] table")
+    parser.add_argument("--allow-remote", action="store_true", help="Allow a database that is not on localhost")
+    parser.add_argument("--cache-entries", type=int, default=2048)
+    parser.add_argument("--cache-ttl", type=float, default=60)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_seed = sub.add_parser("seed", help="Create the schema and add synthetic users with history")
+    p_seed.add_argument("--users", type=int, default=100)
+    p_seed.add_argument("--days", type=int, default=365, help="Days of history per user")
+    p_seed.add_argument("--events-per-day", type=int, default=3)
+    p_seed.add_argument("--assessment-interval", type=int, default=14, help="Days between PHQ-9 assessments")
+    p_seed.add_argument("--seed", type=int, default=7)
+
+    sub.add_parser("reset", help="Delete every synthetic user")
+
+    p_run = sub.add_parser("run", help="Replay page workflows concurrently")
+    p_run.add_argument("--concurrency", type=int, default=20, help="Number of simulated users")
+    p_run.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    p_run.add_argument("--iterations", type=int, help="Stop each simulated user after this many workflows")
+    p_run.add_argument("--pool-max", type=int, default=10)
+    p_run.add_argument("--mix", type=_parse_mix, help="e.g. login=1,calendar=4 (default: every workflow)")
+    p_run.add_argument("--seed", type=int, default=11)
+    p_run.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    pool = _install(args, maxconn=getattr(args, "pool_max", 4))
+    try:
+        if args.command == "seed":
+            with database.db_connection() as db:
+                upgrade(db)
+            totals = seeding.seed(args.users, args.days, args.events_per_day, args.assessment_interval, args.seed)
+            print(", ".join(f"{count} {name}" for name, count in totals.items()))
+        elif args.command == "reset":
+            print(f"Deleted {seeding.reset()} synthetic users")
+        else:
+            report, pool_stats, cache_stats = run(args.concurrency, args.duration, args.iterations, args.mix, args.seed)
+            if args.json:
+                print(json.dumps({"workflows": report, "pool": pool_stats, "cache": cache_stats}, indent=2, default=str))
+            else:
+                print(format_report(report))
+                print(f"\npool: {pool_stats['checkouts']} checkouts, {pool_stats['waits']} waits, "
+                      f"{pool_stats['timeouts']} timeouts; cache hit ratio {cache_stats['hit_ratio']:.0%}")
+    except psycopg2.Error as e:
+        print(f"Database error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
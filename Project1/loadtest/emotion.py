@@ -0,0 +1,172 @@
+"""
+Parity check and benchmark for the emotion classifier backends; needs no database.
+
+    python -m loadtest.emotion parity --backends onnx,onnx-int8
+    python -m loadtest.emotion bench --backends torch,onnx,onnx-int8 --threads 4
+
+`parity` runs the same messages through PyTorch and each backend and reports how
+often the top emotion agrees and the largest probability difference; it exits
+with status 1 when agreement falls below --min-agreement. `bench` loads each
+backend in a fresh process and reports load time, single-message latency,
+batched throughput and resident memory. Messages are generated gaming-chat
+lines, or the messages of a chat export given with --file.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from loadtest.metrics import percentile
+
+PHRASES = [
+    "gg everyone", "that was so much fun, we should queue again tomorrow", "ugh this lag is killing me",
+    "why does nobody ever heal", "I'm honestly scared to play ranked after last night",
+    "love this squad", "wait WHAT just happened", "I can't believe we threw that lead",
+    "I've been feeling really down lately and gaming is the only thing that helps",
+    "nice shot!", "stop feeding, seriously", "I'm so nervous for the tournament",
+    "thanks for carrying me", "omg that clutch was unbelievable", "I'm tired of losing every single game",
+    "miss you guys, haven't played in weeks", "this update is amazing", "I hate this map so much",
+]
+
+
+def sample_messages(count, seed=7):
+    """`count` chat lines of one to four phrases each."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(PHRASES, k=rng.randint(1, 4))) for _ in range(count)]
+
+
+def file_messages(path, count):
+    from itertools import islice
+
+    from chat_logs import parse_chat_log
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return [record.text for record in islice(parse_chat_log(f), count)]
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:  # not Linux: report the peak instead
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def _load(backend, model_dir, threads):
+    from transformers import AutoTokenizer
+
+    from emotion_inference import MODEL_NAME, load_classifier
+
+    return AutoTokenizer.from_pretrained(MODEL_NAME), load_classifier(backend, model_dir=model_dir, threads=threads)
+
+
+def parity(backend, messages, model_dir=None, threads=None):
+    """Compares `backend` with the torch backend on `messages`."""
+    from emotion_inference import emotion_distributions, top_emotion
+
+    tokenizer, reference = _load("torch", model_dir, threads)
+    _, candidate = _load(backend, model_dir, threads)
+    expected = emotion_distributions(messages, tokenizer, reference)
+    actual = emotion_distributions(messages, tokenizer, candidate)
+    agree = sum(top_emotion(e)[0] == top_emotion(a)[0] for e, a in zip(expected, actual))
+    deltas = [abs(e[label] - a[label]) for e, a in zip(expected, actual) for label in e]
+    return {
+        "backend": backend, "messages": len(messages), "agreement": agree / len(messages),
+        "max_delta": max(deltas), "mean_delta": sum(deltas) / len(deltas),
+    }
+
+
+def bench(backend, messages, batch_size, repeat, model_dir=None, threads=None):
+    """Runs one backend and returns its result row; call it in a fresh process for a clean RSS."""
+    from emotion_inference import emotion_distributions
+
+    baseline = _rss_mb()
+    started = time.perf_counter()
+    tokenizer, model = _load(backend, model_dir, threads)
+    load_s = time.perf_counter() - started
+    # Taken after a first batch, so whatever inference imports or allocates is included.
+    emotion_distributions(messages[:batch_size], tokenizer, model)
+    loaded = _rss_mb()
+    latencies = []
+    for text in messages[:repeat]:
+        started = time.perf_counter()
+        emotion_distributions([text], tokenizer, model)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    started = time.perf_counter()
+    emotion_distributions(messages, tokenizer, model, batch_size=batch_size)
+    batch_s = time.perf_counter() - started
+    return {
+        "backend": backend, "threads": threads, "load_s": load_s,
+        "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95),
+        "messages_per_s": len(messages) / batch_s,
+        "rss_model_mb": loaded - baseline, "rss_mb": _rss_mb(), "peak_rss_mb": _peak_rss_mb(),
+        "torch_loaded": "torch" in sys.modules,
+    }
+
+
+def _isolated(fn, *args):
+    # spawn, so each backend starts without the previous one's memory or threads.
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+PARITY_HEADER = f"{'backend':<10} {'messages':>8} {'agreement':>10} {'max delta':>10} {'mean delta':>11}"
+BENCH_HEADER = f"{'backend':<10} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'msgs/s':>8} {'model MB':>9} {'RSS MB':>8} {'peak MB':>8}"
+
+
+def format_parity(row):
+    return (f"{row['backend']:<10} {row['messages']:>8} {row['agreement']:>10.2%} "
+            f"{row['max_delta']:>10.4f} {row['mean_delta']:>11.5f}")
+
+
+def format_bench(row):
+    return (f"{row['backend']:<10} {row['load_s']:>7.2f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+            f"{row['messages_per_s']:>8.1f} {row['rss_model_mb']:>9.0f} {row['rss_mb']:>8.0f} {row['peak_rss_mb']:>8.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m loadtest.emotion", description="Compare emotion classifier backends.")
+    parser.add_argument("command", choices=["parity", "bench"])
+    parser.add_argument("--backends", default=None, help="Comma-separated backends (parity: onnx,onnx-int8; bench: all)")
+    parser.add_argument("--messages", type=int, default=500, help="Messages to classify")
+    parser.add_argument("--file", help="Use the messages of this chat export instead of generated ones")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads (default: every core)")
+    parser.add_argument("--model-dir", default=None, help="Where the onnx backends keep exported models")
+    parser.add_argument("--batch-size", type=int, default=32, help="bench: micro-batch size for the throughput run")
+    parser.add_argument("--repeat", type=int, default=100, help="bench: single-message calls timed for latency")
+    parser.add_argument("--min-agreement", type=float, default=0.95, help="parity: fail below this top-emotion agreement")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    messages = file_messages(args.file, args.messages) if args.file else sample_messages(args.messages)
+    default = "onnx,onnx-int8" if args.command == "parity" else "torch,onnx,onnx-int8"
+    rows, status = [], 0
+    if not args.json:
+        print(PARITY_HEADER if args.command == "parity" else BENCH_HEADER)
+    for backend in (args.backends or default).split(","):
+        if args.command == "parity":
+            row = parity(backend, messages, args.model_dir, args.threads)
+            status |= row["agreement"] < args.min_agreement
+        else:
+            row = _isolated(bench, backend, messages, args.batch_size, args.repeat, args.model_dir, args.threads)
+        rows.append(row)
+        if not args.json:
+            print(format_parity(row) if args.command == "parity" else format_bench(row), flush=True)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    return int(status)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
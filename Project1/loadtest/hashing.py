@@ -0,0 +1,133 @@
+"""
+Login throughput benchmark for passwords.HashingPool; needs no database.
+
+    python -m loadtest.hashing --costs 14,15,16 --workers 1,2,4 --pool process,thread
+
+For every (cost, workers, pool kind) combination, `--concurrency` threads log in
+back to back for `--duration` seconds while a probe thread repeatedly runs a
+short piece of pure-Python work, standing in for another session's rerun. The
+probe's p99 shows how much the logins slow that rerun down. Cost is log2(n)
+for scrypt and time_cost for argon2.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from loadtest.metrics import percentile
+from passwords import DEFAULT_PARAMS, HashingPool
+
+PASSWORD = "benchmark-password"
+PROBE_WORK = 20_000   # loop iterations, about a millisecond of pure Python
+
+
+def _probe(stop, samples):
+    while not stop.is_set():
+        started = time.perf_counter()
+        total = 0
+        for i in range(PROBE_WORK):
+            total += i
+        samples.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.005)
+
+
+def _probe_for(seconds, samples):
+    stop = threading.Event()
+    timer = threading.Timer(seconds, stop.set)
+    timer.start()
+    _probe(stop, samples)
+
+
+def _login_loop(pool, stored, deadline, latencies, lock):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        matches, _ = pool.verify(stored, PASSWORD)
+        if not matches:
+            raise RuntimeError("Benchmark password did not verify")
+        with lock:
+            latencies.append((time.perf_counter() - started) * 1000)
+
+
+def measure(scheme, cost, workers, kind, concurrency, duration):
+    """Runs one configuration and returns its result row."""
+    params = dict(DEFAULT_PARAMS, scheme=scheme)
+    if scheme == "scrypt":
+        params["scrypt_n"] = 2 ** cost
+    else:
+        params["argon2_time_cost"] = cost
+    pool = HashingPool(params, workers=workers, kind=kind, max_pending=concurrency, timeout=duration + 60)
+    try:
+        stored = pool.hash(PASSWORD)
+        pool.verify(stored, PASSWORD)   # start every worker process before timing
+        baseline = []
+        _probe_for(0.5, baseline)
+
+        latencies, probe, lock, stop = [], [], threading.Lock(), threading.Event()
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=_login_loop, args=(pool, stored, deadline, latencies, lock))
+                   for _ in range(concurrency)]
+        prober = threading.Thread(target=_probe, args=(stop, probe))
+        started = time.perf_counter()
+        prober.start()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        prober.join()
+    finally:
+        pool.close()
+    latencies.sort()
+    probe.sort()
+    baseline.sort()
+    return {
+        "scheme": scheme, "cost": cost, "workers": workers, "pool": kind,
+        "logins": len(latencies), "logins_per_s": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95),
+        "probe_idle_p99_ms": percentile(baseline, 99), "probe_p99_ms": percentile(probe, 99),
+    }
+
+
+HEADER = f"{'scheme':<7} {'cost':>4} {'workers':>7} {'pool':<8} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'rerun p99 ms (idle)':>20}"
+
+
+def format_row(row):
+    return (
+        f"{row['scheme']:<7} {row['cost']:>4} {row['workers']:>7} {row['pool']:<8} {row['logins_per_s']:>9.1f} "
+        f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['probe_p99_ms']:>11.2f} ({row['probe_idle_p99_ms']:.2f})"
+    )
+
+
+def _int_list(text):
+    return [int(part) for part in text.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m loadtest.hashing", description="Benchmark login hashing.")
+    parser.add_argument("--scheme", choices=["scrypt", "argon2"], default="scrypt")
+    parser.add_argument("--costs", type=_int_list, default=[14, 15, 16], help="log2(n) for scrypt, time_cost for argon2")
+    parser.add_argument("--workers", type=_int_list, default=[1, 2, 4])
+    parser.add_argument("--pool", default="process,thread", help="Comma-separated pool kinds: process, thread")
+    parser.add_argument("--concurrency", type=int, default=8, help="Simultaneous logins")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds per configuration")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    rows = []
+    if not args.json:
+        print(HEADER)
+    for cost in args.costs:
+        for workers in args.workers:
+            for kind in args.pool.split(","):
+                rows.append(measure(args.scheme, cost, workers, kind, args.concurrency, args.duration))
+                if not args.json:
+                    print(format_row(rows[-1]), flush=True)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Round-trip counting for psycopg2 connections and latency summaries."""
+import threading
+
+import psycopg2.extensions
+
+_local = threading.local()
+
+
+def _tick(n=1):
+    _local.round_trips = getattr(_local, "round_trips", 0) + n
+
+
+def round_trips():
+    """Statements sent to the server so far by the calling thread."""
+    return getattr(_local, "round_trips", 0)
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        _tick()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        _tick(len(vars_list))
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        _tick()
+        return super().copy_expert(sql, file, size)
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """A connection whose cursors, commits and rollbacks count as round trips."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = CountingCursor
+
+    def _in_transaction(self):
+        return self.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        # psycopg2 sends nothing when there is no open transaction.
+        if self._in_transaction():
+            _tick()
+        return super().commit()
+
+    def rollback(self):
+        if self._in_transaction():
+            _tick()
+        return super().rollback()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """Collects (latency, round trips, ok) samples per workflow from many threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, workflow, seconds, trips, ok):
+        with self._lock:
+            self._samples.setdefault(workflow, []).append((seconds, trips, ok))
+
+    def summary(self, elapsed):
+        """Returns one dict per workflow, plus an "all" row, sorted by name."""
+        with self._lock:
+            samples = {name: list(rows) for name, rows in self._samples.items()}
+        samples["all"] = [row for rows in samples.values() for row in rows]
+        report = []
+        for name in sorted(samples, key=lambda n: (n == "all", n)):
+            rows = samples[name]
+            if not rows:
+                continue
+            latencies = sorted(seconds * 1000 for seconds, _, _ in rows)
+            report.append({
+                "workflow": name,
+                "runs": len(rows),
+                "errors": sum(1 for _, _, ok in rows if not ok),
+                "throughput": len(rows) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+                "round_trips": sum(trips for _, trips, _ in rows) / len(rows),
+            })
+        return report
+
+
+def format_report(report):
+    lines = [f"{'workflow':<12} {'runs':>7} {'errors':>6} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'trips/op':>9}"]
+    for row in report:
+        lines.append(
+            f"{row['workflow']:<12} {row['runs']:>7} {row['errors']:>6} {row['throughput']:>8.1f} "
+            f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['round_trips']:>9.1f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,144 @@
+"""Generates synthetic users and their history."""
+import functools
+import random
+from datetime import date, datetime, time, timedelta
+
+import psycopg2.extras
+
+import database
+import passwords
+
+EMAIL_PATTERN = "loadtest+{}@example.com"
+EMAIL_LIKE = "loadtest+%@example.com"
+PASSWORD = "loadtest-password"
+
+EMOTIONS = ["joy", "sadness", "anger", "fear", "love", "surprise"]
+ACTIVITIES = ["Morning walk", "Study session", "Gaming", "Call a friend", "Meditation",
+              "Workout", "Reading", "Lunch break", "Journal", "Board game night"]
+PHQ9_PROMPT = "Over the last 2 weeks, how often have you been bothered by problem {}?"
+ANSWER_TEXT = ["Not at all", "Several days", "More than half the days", "Nearly every day"]
+
+
+@functools.lru_cache(maxsize=None)
+def password_hash(password=PASSWORD):
+    """One scrypt hash shared by every synthetic user, so seeding doesn't pay the hashing cost per user."""
+    return passwords.hash_password(password)
+
+
+def _insert_users(cursor, count, start_index):
+    rows = [(EMAIL_PATTERN.format(i), f"loadtest{i}", f"Load Test {i}", password_hash())
+            for i in range(start_index, start_index + count)]
+    return psycopg2.extras.execute_values(
+        cursor,
+        "INSERT INTO users (email, username, full_name, hashed_password) VALUES %s "
+        "ON CONFLICT (email) DO NOTHING RETURNING id",
+        rows, page_size=len(rows), fetch=True,
+    )
+
+
+def _assessments(rng, user_id, first_day, days, interval):
+    """Yields (conversation row, start time, messages) with answers drifting around a per-user baseline."""
+    baseline = rng.uniform(0.3, 2.2)
+    for n, offset in enumerate(range(0, days, interval), start=1):
+        baseline = min(2.8, max(0.1, baseline + rng.uniform(-0.3, 0.3)))
+        answers = [min(3, max(0, round(rng.gauss(baseline, 0.8)))) for _ in range(9)]
+        started = datetime.combine(first_day + timedelta(days=offset), time(20, 0))
+        messages = []
+        for q, answer in enumerate(answers, start=1):
+            messages.append(("assistant", PHQ9_PROMPT.format(q)))
+            messages.append(("user", ANSWER_TEXT[answer]))
+        messages.append(("assistant", f"Thank you. Your total score is {sum(answers)}."))
+        yield (user_id, "phq9", f"PHQ-9 Assessment #{n}", started, sum(answers), answers), started, messages
+
+
+def _insert_assessments(cursor, rng, user_id, first_day, days, interval):
+    generated = list(_assessments(rng, user_id, first_day, days, interval))
+    if not generated:
+        return 0
+    ids = psycopg2.extras.execute_values(
+        cursor,
+        "INSERT INTO conversations (user_id, kind, title, start_time, completion_score, answers) VALUES %s RETURNING id",
+        [row for row, _, _ in generated], page_size=len(generated), fetch=True,
+    )
+    messages = [
+        (conv_id, role, content, started + timedelta(seconds=i))
+        for (conv_id,), (_, started, convo) in zip(ids, generated)
+        for i, (role, content) in enumerate(convo)
+    ]
+    psycopg2.extras.execute_values(
+        cursor, "INSERT INTO chat_history (conversation_id, role, content, timestamp) VALUES %s", messages, page_size=5000
+    )
+    return len(generated)
+
+
+def _daily_rows(rng, user_id, first_day, days, events_per_day):
+    events, behavior, emotions = [], [], []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        for hour in sorted(rng.sample(range(7, 22), min(events_per_day, 15))):
+            start = datetime.combine(day, time(hour, 0))
+            events.append((user_id, rng.choice(ACTIVITIES), start, start + timedelta(hours=1),
+                           "#6f42c1", rng.random() < 0.5))
+        if rng.random() < 0.7:
+            behavior.append((user_id, day, rng.choice([0, 1, 2, 3, 4, 5, 6, 8, 10]), rng.choice([-1.0, -0.5, 0.0, 0.5, 1.0]),
+                             rng.choice([0.0, 0.25, 0.5, 0.75, 1.0]), rng.random() < 0.3, rng.randint(0, 10), rng.randint(0, 10)))
+        if rng.random() < 0.5:
+            emotions.append((user_id, day, rng.choice(EMOTIONS), round(rng.uniform(0.4, 0.99), 3), round(rng.uniform(-1, 1), 3)))
+    return events, behavior, emotions
+
+
+def seed(users=100, days=365, events_per_day=3, assessment_interval=14, random_seed=7, progress=print):
+    """
+    Adds `users` synthetic accounts with `days` of history each, up to today.
+    Accounts that already exist are left untouched. Returns row counts.
+    """
+    rng = random.Random(random_seed)
+    first_day = date.today() - timedelta(days=days - 1)
+    totals = {"users": 0, "assessments": 0, "calendar_events": 0, "behavior_logs": 0, "emotion_logs": 0}
+
+    with database.db_connection() as db:
+        if db is None: raise RuntimeError("Database unavailable")
+        with db.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM users WHERE email LIKE %s", (EMAIL_LIKE,))
+            start_index = cursor.fetchone()[0]
+            user_ids = [row[0] for row in _insert_users(cursor, users, start_index)]
+        db.commit()
+    totals["users"] = len(user_ids)
+
+    for n, user_id in enumerate(user_ids, start=1):
+        with database.db_connection() as db:
+            if db is None: raise RuntimeError("Database unavailable")
+            with db.cursor() as cursor:
+                totals["assessments"] += _insert_assessments(cursor, rng, user_id, first_day, days, assessment_interval)
+                database.refresh_daily_metrics(cursor, user_id, ("phq9",))
+                database.store_phq9_answers(cursor, user_id=user_id)
+            db.commit()
+        events, behavior, emotions = _daily_rows(rng, user_id, first_day, days, events_per_day)
+        for table, rows in (("calendar_events", events), ("behavior_logs", behavior), ("emotion_logs", emotions)):
+            result = database.bulk_ingest(table, rows)
+            if result is None:
+                raise RuntimeError(f"Seeding {table} failed for user {user_id}")
+            totals[table] += result["inserted"]
+        if n % 25 == 0 or n == len(user_ids):
+            progress(f"Seeded {n}/{len(user_ids)} users")
+    return totals
+
+
+def reset():
+    """Deletes every synthetic account; their rows go with them through ON DELETE CASCADE."""
+    with database.db_connection() as db:
+        if db is None: raise RuntimeError("Database unavailable")
+        with db.cursor() as cursor:
+            cursor.execute("DELETE FROM users WHERE email LIKE %s", (EMAIL_LIKE,))
+            deleted = cursor.rowcount
+        db.commit()
+    return deleted
+
+
+def seeded_users():
+    """Returns [(id, email)] of every synthetic account."""
+    with database.db_connection() as db:
+        if db is None: raise RuntimeError("Database unavailable")
+        with db.cursor() as cursor:
+            cursor.execute("SELECT id, email FROM users WHERE email LIKE %s ORDER BY id", (EMAIL_LIKE,))
+            return cursor.fetchall()
@@ -0,0 +1,94 @@
+"""
+Start-up benchmark for the Emotion Analysis page; needs no database.
+
+    python -m loadtest.startup --login-seconds 5 --backend torch
+
+Replays a user's first visit in a fresh interpreter, once per mode:
+
+    eager   the heavy libraries are imported when the page is first opened and
+            the models loaded on the first click (the behaviour before lazy
+            imports and warm-up)
+    warm    app start launches emotion_models' warm-up thread, the user spends
+            --login-seconds on the login screen, then opens the page and clicks
+
+and reports what the user waits for: the page import, then the first analysis
+(model load plus inference), with per-module import times.
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+MESSAGE = "that was such a close game, I'm still shaking"
+
+
+def _first_visit(mode, backend, login_seconds):
+    # streamlit is loaded before the clock starts in both modes: app.py always imports it.
+    import streamlit  # noqa: F401
+
+    from emotion_inference import analyze_many, load_pipeline
+    from emotion_models import preload_modules, warmup_steps
+    from lazy_loading import Warmup, import_times, preload
+
+    load = functools.cache(functools.partial(load_pipeline, backend))
+    warmup = None
+    if mode == "warm":
+        warmup = Warmup(warmup_steps(load, backend)).start()
+    time.sleep(login_seconds)
+
+    started = time.perf_counter()
+    if mode == "eager":
+        for name in preload_modules(backend):
+            preload(name)
+    page_import_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if warmup is not None:
+        warmup.wait()
+    analyze_many([MESSAGE], *load())
+    first_result_s = time.perf_counter() - started
+    return {
+        "mode": mode, "backend": backend, "login_seconds": login_seconds,
+        "page_import_s": page_import_s, "first_result_s": first_result_s,
+        "imports_s": import_times(), "warmup": warmup.stats() if warmup else None,
+    }
+
+
+def measure(mode, backend, login_seconds):
+    # spawn: every mode starts from a cold interpreter with nothing imported yet.
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_first_visit, mode, backend, login_seconds).result()
+
+
+def format_row(row):
+    imports = ", ".join(f"{name} {seconds:.2f}" for name, seconds in row["imports_s"].items())
+    line = (f"{row['mode']:<6} page import {row['page_import_s']:>6.2f} s   "
+            f"first result {row['first_result_s']:>6.2f} s   imports: {imports}")
+    if row["warmup"]:
+        line += f"\n       warm-up {row['warmup']['state']} in {row['warmup']['seconds']:.2f} s"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m loadtest.startup", description="Benchmark first-visit latency.")
+    parser.add_argument("--modes", default="eager,warm", help="Comma-separated modes: eager, warm")
+    parser.add_argument("--backend", default="torch", help="Emotion backend: torch, onnx or onnx-int8")
+    parser.add_argument("--login-seconds", type=float, default=5, help="Time the user spends on the login screen")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for mode in args.modes.split(","):
+        rows.append(measure(mode, args.backend, args.login_seconds))
+        if not args.json:
+            print(format_row(rows[-1]), flush=True)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+The page workflows replayed by the load harness. Each one issues the same
+database.py calls, in the same order, as the page it is named after.
+"""
+from datetime import date, datetime, timedelta
+
+import database
+import passwords
+from loadtest.seed import ANSWER_TEXT, PASSWORD, PHQ9_PROMPT
+
+
+def login(rng, user_id, email):
+    """app.py: look the user up by email, check the password and start a session."""
+    user = database.get_user_by_email(email)
+    if user is None or not passwords.verify_password(user["hashed_password"], PASSWORD)[0]:
+        raise RuntimeError(f"Login failed for {email}")
+    token, _ = database.create_session(user["id"])
+    if token is None:
+        raise RuntimeError(f"No session stored for {email}")
+    return token
+
+
+# user_id -> the session token its simulated browser holds
+_session_tokens = {}
+
+
+def refresh(rng, user_id, email):
+    """
+    A browser refresh or new tab: every page guard restores the session from
+    its cookie (auth.restore_session), which may rotate the token.
+    """
+    token = _session_tokens.get(user_id)
+    if token is None or database.resume_session(token) is None:
+        _session_tokens[user_id] = login(rng, user_id, email)
+        return
+    if database.SESSION_DEFAULTS["rotate"]:
+        new_token = database.rotate_session(token)
+        if new_token:
+            _session_tokens[user_id] = new_token
+
+
+def assessment(rng, user_id, email):
+    """Assessment page: sidebar history, then one completed PHQ-9 saved at the end."""
+    database.get_user_conversations(user_id)
+    answers = [rng.randint(0, 3) for _ in range(9)]
+    messages = []
+    for q, answer in enumerate(answers, start=1):
+        messages.append({"role": "assistant", "content": PHQ9_PROMPT.format(q)})
+        messages.append({"role": "user", "content": ANSWER_TEXT[answer]})
+    conv_id, _ = database.save_completed_assessment(user_id, answers, sum(answers), None, messages)
+    if conv_id is None:
+        raise RuntimeError("Assessment was not saved")
+    database.get_user_conversations(user_id)
+
+
+def calendar(rng, user_id, email):
+    """Calendar page: the visible week, then a ticked-off event from the homepage sidebar."""
+    today = date.today()
+    start = datetime.combine(today - timedelta(days=(today.weekday() + 1) % 7), datetime.min.time())
+    events = database.get_calendar_events(user_id, start, start + timedelta(days=7))
+    database.get_todays_events(user_id, today)
+    if events:
+        event = rng.choice(events)
+        database.update_calendar_event_completion(int(event["id"]), True, rng.randint(1, 5))
+
+
+def behavior(rng, user_id, email):
+    """Behaviour Tracker: save today's log, then the snapshot, full history and daily rollup."""
+    database.save_behavior_log(
+        user_id=user_id, date=date.today(), hours_played=rng.choice([0, 1, 2, 4, 6, 8]),
+        mood_score=rng.choice([-1.0, -0.5, 0.0, 0.5, 1.0]), solo_play_ratio=rng.choice([0.0, 0.5, 1.0]),
+        late_night_gaming=rng.random() < 0.3, physical_breaks=rng.randint(0, 10),
+        social_interaction_score=rng.randint(0, 10),
+    )
+    database.get_user_snapshot(user_id)
+    database.get_behavior_logs(user_id)
+    database.get_daily_metrics(user_id)
+
+
+def suggestions(rng, user_id, email):
+    """Game Suggestions page: a single snapshot read."""
+    database.get_user_snapshot(user_id)
+
+
+# name -> (workflow, relative weight in the default mix)
+WORKFLOWS = {
+    "login": (login, 2),
+    "refresh": (refresh, 4),
+    "assessment": (assessment, 1),
+    "calendar": (calendar, 4),
+    "behavior": (behavior, 3),
+    "suggestions": (suggestions, 3),
+}
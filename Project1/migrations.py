@@ -0,0 +1,453 @@
+"""
+Versioned schema migrations for the Mental Health Companion database.
+
+Usage (from the Project1 directory):
+    python migrations.py status
+    python migrations.py upgrade
+    python migrations.py explain [--user-id 1]
+
+Monthly partitions of chat_history and emotion_logs are created and archived
+by partitions.py.
+
+Each migration runs in its own transaction, is recorded in `schema_migrations`,
+and is written to be idempotent so it is safe on databases created by hand
+before this module existed.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from db_pool import connect_from_secrets
+
+# Serialises concurrent `upgrade` runs (e.g. several app replicas starting at once).
+MIGRATION_LOCK_KEY = 727_001
+
+
+def _partition_by_month(table, key, columns, constraints, indexes, bound_type):
+    """
+    A DO block that rebuilds `table` as a table range-partitioned by month on
+    `key`: partitions cover every month from its oldest row to three months
+    ahead, plus a DEFAULT partition, and the rows and id sequence carry over.
+    Does nothing if the table is already partitioned.
+    """
+    names = ", ".join(line.split()[0] for line in columns.split(",\n") if not line.lstrip().startswith(("PRIMARY", "UNIQUE")))
+    return f"""
+        DO $$
+        DECLARE
+            seq TEXT;
+            first_month TIMESTAMPTZ;
+            month TIMESTAMPTZ;
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = '{table}'::regclass) THEN
+                RETURN;
+            END IF;
+            ALTER TABLE {table} RENAME TO {table}_unpartitioned;
+            ALTER TABLE {table}_unpartitioned DROP CONSTRAINT IF EXISTS {table}_pkey;
+            {' '.join(f"DROP INDEX IF EXISTS {name};" for name in indexes)}
+            {' '.join(f"ALTER TABLE {table}_unpartitioned DROP CONSTRAINT IF EXISTS {name};" for name in constraints)}
+            CREATE TABLE {table} ({columns}) PARTITION BY RANGE ({key});
+            seq := pg_get_serial_sequence('{table}_unpartitioned', 'id');
+            EXECUTE format('ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval(%L)', seq);
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY {table}.id', seq);
+            {' '.join(f"CREATE INDEX {name} ON {table} {definition};" for name, definition in indexes.items())}
+            CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;
+            SELECT date_trunc('month', COALESCE(min({key}), now())) INTO first_month FROM {table}_unpartitioned;
+            FOR month IN SELECT generate_series(first_month, date_trunc('month', now()) + interval '3 months', interval '1 month') LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                               '{table}_' || to_char(month, '"y"YYYY"m"MM'),
+                               month::{bound_type}, (month + interval '1 month')::{bound_type});
+            END LOOP;
+            INSERT INTO {table} ({names}) SELECT {names} FROM {table}_unpartitioned;
+            DROP TABLE {table}_unpartitioned;
+        END $$;
+    """
+
+MIGRATIONS = [
+    (1, "baseline_schema", """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            email TEXT NOT NULL UNIQUE,
+            username TEXT NOT NULL,
+            full_name TEXT,
+            hashed_password TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE TABLE IF NOT EXISTS conversations (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            title TEXT NOT NULL DEFAULT 'New Chat',
+            start_time TIMESTAMPTZ NOT NULL DEFAULT now(),
+            completion_score INTEGER,
+            answers INTEGER[],
+            video_url TEXT
+        );
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id SERIAL PRIMARY KEY,
+            conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE TABLE IF NOT EXISTS calendar_events (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            title TEXT NOT NULL,
+            start_time TIMESTAMP NOT NULL,
+            end_time TIMESTAMP NOT NULL,
+            color TEXT DEFAULT '#6f42c1',
+            is_generated BOOLEAN NOT NULL DEFAULT FALSE,
+            completed BOOLEAN NOT NULL DEFAULT FALSE,
+            user_mood SMALLINT
+        );
+        CREATE TABLE IF NOT EXISTS behavior_logs (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            log_date DATE NOT NULL,
+            hours_played REAL,
+            mood_score REAL,
+            solo_play_ratio REAL,
+            late_night_gaming BOOLEAN,
+            physical_breaks INTEGER,
+            social_interaction_score INTEGER,
+            risk_score INTEGER,
+            UNIQUE (user_id, log_date)
+        );
+        CREATE TABLE IF NOT EXISTS emotion_logs (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            date DATE NOT NULL,
+            emotion TEXT NOT NULL,
+            probability REAL,
+            vader_compound REAL,
+            UNIQUE (user_id, date)
+        );
+    """),
+    (2, "conversation_kind", """
+        ALTER TABLE conversations ADD COLUMN IF NOT EXISTS kind TEXT NOT NULL DEFAULT 'chat';
+        UPDATE conversations SET kind = 'phq9'
+        WHERE title LIKE 'PHQ-9 Assessment%' AND kind <> 'phq9';
+    """),
+    (3, "hot_path_indexes", """
+        -- get_user_conversations, get_latest_assessment_answers
+        CREATE INDEX IF NOT EXISTS idx_conversations_user_start
+            ON conversations (user_id, start_time DESC);
+        -- get_latest_phq9, get_score_trend, get_scores_over_time, assessment numbering
+        CREATE INDEX IF NOT EXISTS idx_conversations_phq9_user_start
+            ON conversations (user_id, start_time DESC)
+            WHERE kind = 'phq9' AND completion_score IS NOT NULL;
+        -- get_messages and the chat_history cascade from conversations
+        CREATE INDEX IF NOT EXISTS idx_chat_history_conversation_ts
+            ON chat_history (conversation_id, timestamp);
+        -- get_calendar_events, get_todays_events, get_events_for_last_week
+        CREATE INDEX IF NOT EXISTS idx_calendar_events_user_start
+            ON calendar_events (user_id, start_time);
+        -- save_calendar_events replacing a generated schedule
+        CREATE INDEX IF NOT EXISTS idx_calendar_events_user_generated
+            ON calendar_events (user_id) WHERE is_generated;
+        -- behavior_logs (user_id, log_date) and emotion_logs (user_id, date) are
+        -- already served by their UNIQUE constraints, scanned backwards for DESC.
+    """),
+    (4, "daily_user_metrics", """
+        -- One row per user per day, maintained by database.py's writers. The
+        -- backfill uses database.BEHAVIOR_RISK_SQL and counts one analysis per
+        -- emotion_logs row.
+        CREATE TABLE IF NOT EXISTS daily_user_metrics (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            phq9_score INTEGER,
+            assessments INTEGER NOT NULL DEFAULT 0,
+            risk_score INTEGER,
+            mood_score REAL,
+            hours_played REAL,
+            emotion_counts JSONB NOT NULL DEFAULT '{}',
+            vader_n INTEGER NOT NULL DEFAULT 0,
+            vader_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            vader_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        );
+        INSERT INTO daily_user_metrics (user_id, day, phq9_score, assessments)
+        SELECT user_id, start_time::date,
+               (array_agg(completion_score ORDER BY start_time DESC))[1], count(*)
+        FROM conversations
+        WHERE kind = 'phq9' AND completion_score IS NOT NULL
+        GROUP BY user_id, start_time::date
+        ON CONFLICT (user_id, day) DO UPDATE SET phq9_score = EXCLUDED.phq9_score, assessments = EXCLUDED.assessments;
+        INSERT INTO daily_user_metrics (user_id, day, risk_score, mood_score, hours_played)
+        SELECT user_id, log_date,
+               CASE WHEN hours_played > 6 THEN 3 WHEN hours_played > 4 THEN 1 ELSE 0 END
+               + CASE WHEN mood_score < -0.5 THEN 4 WHEN mood_score < 0 THEN 2 ELSE 0 END
+               + CASE WHEN solo_play_ratio > 0.8 THEN 2 ELSE 0 END
+               + CASE WHEN late_night_gaming THEN 1 ELSE 0 END
+               + CASE WHEN physical_breaks < 1 THEN 1 ELSE 0 END
+               + CASE WHEN social_interaction_score < 3 THEN 2 ELSE 0 END,
+               mood_score, hours_played
+        FROM behavior_logs
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            risk_score = EXCLUDED.risk_score, mood_score = EXCLUDED.mood_score, hours_played = EXCLUDED.hours_played;
+        INSERT INTO daily_user_metrics (user_id, day, emotion_counts, vader_n, vader_sum, vader_sumsq)
+        SELECT user_id, date, jsonb_build_object(emotion, 1), CASE WHEN vader_compound IS NULL THEN 0 ELSE 1 END,
+               COALESCE(vader_compound, 0), COALESCE(vader_compound * vader_compound, 0)
+        FROM emotion_logs
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            emotion_counts = EXCLUDED.emotion_counts, vader_n = EXCLUDED.vader_n,
+            vader_sum = EXCLUDED.vader_sum, vader_sumsq = EXCLUDED.vader_sumsq;
+    """),
+    (5, "phq9_answers", """
+        -- One row per question of each PHQ-9, kept in step with conversations.answers
+        -- by database.store_phq9_answers.
+        CREATE TABLE IF NOT EXISTS phq9_answers (
+            conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            answered_at TIMESTAMPTZ NOT NULL,
+            question SMALLINT NOT NULL CHECK (question BETWEEN 1 AND 9),
+            answer SMALLINT NOT NULL CHECK (answer BETWEEN 0 AND 3),
+            PRIMARY KEY (conversation_id, question)
+        );
+        -- get_symptom_matrix, get_question_trends, get_self_harm_frequency
+        CREATE INDEX IF NOT EXISTS idx_phq9_answers_user_question_time
+            ON phq9_answers (user_id, question, answered_at, answer);
+        INSERT INTO phq9_answers (conversation_id, user_id, answered_at, question, answer)
+        SELECT c.id, c.user_id, c.start_time, a.question, a.answer
+        FROM conversations c
+        CROSS JOIN LATERAL unnest(c.answers) WITH ORDINALITY AS a(answer, question)
+        WHERE c.kind = 'phq9' AND a.question <= 9 AND a.answer BETWEEN 0 AND 3
+        ON CONFLICT (conversation_id, question) DO NOTHING;
+    """),
+    # Unique constraints of a partitioned table must include its partition key,
+    # so the primary keys become (id, timestamp) and (id, date).
+    (6, "monthly_partitions",
+        _partition_by_month(
+            "chat_history", "timestamp",
+            """id INTEGER NOT NULL,
+               conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+               role TEXT NOT NULL,
+               content TEXT NOT NULL,
+               timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),
+               PRIMARY KEY (id, timestamp)""",
+            constraints=[],
+            indexes={"idx_chat_history_conversation_ts": "(conversation_id, timestamp)"},
+            bound_type="timestamptz",
+        )
+        + _partition_by_month(
+            "emotion_logs", "date",
+            """id INTEGER NOT NULL,
+               user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+               date DATE NOT NULL,
+               emotion TEXT NOT NULL,
+               probability REAL,
+               vader_compound REAL,
+               PRIMARY KEY (id, date),
+               UNIQUE (user_id, date)""",
+            constraints=["emotion_logs_user_id_date_key"],
+            indexes={},
+            bound_type="date",
+        )),
+    (7, "login_sessions", """
+        -- Server-side login sessions; see database.create_session. Only a hash
+        -- of each token is stored.
+        CREATE TABLE IF NOT EXISTS sessions (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            created_at TIMESTAMP NOT NULL,
+            last_seen TIMESTAMP NOT NULL
+        );
+        -- signing a user out everywhere, sweeping their expired sessions
+        CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id);
+    """),
+    (8, "emotion_tallies", """
+        -- Per-source emotion counts the daily rollup is rebuilt from; see
+        -- database.py's DAILY ROLLUP. The existing rollup becomes each day's
+        -- "live" tallies, with the day's VADER totals on its first emotion.
+        CREATE TABLE IF NOT EXISTS emotion_tallies (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            source TEXT NOT NULL,
+            emotion TEXT NOT NULL,
+            analyses INTEGER NOT NULL,
+            vader_n INTEGER NOT NULL DEFAULT 0,
+            vader_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            vader_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, source, emotion)
+        );
+        INSERT INTO emotion_tallies (user_id, day, source, emotion, analyses, vader_n, vader_sum, vader_sumsq)
+        SELECT m.user_id, m.day, 'live', e.emotion, e.analyses::int,
+               CASE WHEN e.ord = 1 THEN m.vader_n ELSE 0 END,
+               CASE WHEN e.ord = 1 THEN m.vader_sum ELSE 0 END,
+               CASE WHEN e.ord = 1 THEN m.vader_sumsq ELSE 0 END
+        FROM daily_user_metrics m
+        CROSS JOIN LATERAL jsonb_each_text(m.emotion_counts) WITH ORDINALITY AS e(emotion, analyses, ord)
+        ON CONFLICT (user_id, day, source, emotion) DO NOTHING;
+    """),
+]
+
+
+def ensure_version_table(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+    conn.commit()
+
+
+def applied_versions(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def upgrade(conn, target=None):
+    """Applies every pending migration up to `target` in order. Returns the versions applied."""
+    ensure_version_table(conn)
+    applied = []
+    for version, name, sql in sorted(MIGRATIONS):
+        if target is not None and version > target:
+            break
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cursor.fetchone():
+                conn.rollback()
+                continue
+            cursor.execute(sql)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        conn.commit()
+        applied.append(version)
+        print(f"Applied migration {version:03d}_{name}")
+    return applied
+
+
+def status(conn):
+    ensure_version_table(conn)
+    done = applied_versions(conn)
+    for version, name, _ in sorted(MIGRATIONS):
+        print(f"[{'x' if version in done else ' '}] {version:03d}_{name}")
+
+
+# --- INDEX USAGE CHECK ---
+# database.py readers (functions tagged @reads) deliberately left out of
+# hot_queries, with the reason.
+HOT_QUERY_EXEMPT = {
+    "export_user_data": "streams every table of one account, once per export (db_export)",
+    "get_calendar_events": "runs get_calendar_events_page's query",
+}
+
+
+def hot_queries(user_id):
+    """
+    The statements database.py runs on hot paths, taken from its SQL constants,
+    as (function, sql, sample parameters). Every @reads function must be listed
+    here or in HOT_QUERY_EXEMPT; see uncovered_readers().
+    """
+    import database
+
+    now = datetime.now()
+    today = now.date()
+    idle, max_age = database.SESSION_DEFAULTS["idle_timeout"], database.SESSION_DEFAULTS["max_age"]
+    session_cutoffs = (now - timedelta(seconds=idle), now - timedelta(seconds=max_age))
+    answers = {"user_id": user_id, "start": now - timedelta(days=90), "end": now}
+    rollup = {"user_id": user_id, "start": today, "end": today + timedelta(days=1),
+              "start_ts": now, "end_ts": now + timedelta(days=1)}
+    calendar_page = database.CALENDAR_PAGE_SQL.format(
+        conditions="user_id = %s AND start_time >= %s AND start_time < %s AND (start_time, id) > (%s, %s)")
+    return [
+        ("get_user_by_email", database.USER_BY_EMAIL_SQL, ("nobody@example.com",)),
+        ("resume_session", database.RESUME_SESSION_SQL, (now, "", *session_cutoffs)),
+        ("create_session", database.SWEEP_SESSIONS_SQL, (user_id, *session_cutoffs)),
+        ("get_user_conversations", database.USER_CONVERSATIONS_SQL, (user_id,)),
+        ("get_latest_assessment_answers", database.LATEST_ANSWERS_SQL, (user_id,)),
+        ("get_latest_phq9", database.LATEST_PHQ9_SQL, (user_id,)),
+        ("get_score_trend", database.SCORE_TREND_SQL, (user_id,)),
+        ("get_scores_over_time", database.SCORES_OVER_TIME_SQL, (user_id,)),
+        ("get_messages", database.MESSAGES_SQL, {"id": 0}),
+        ("get_behavior_logs", database.BEHAVIOR_LOGS_SQL, (user_id,)),
+        ("get_latest_emotion", database.LATEST_EMOTION_SQL, (user_id,)),
+        ("get_emotion_history", database.EMOTION_HISTORY_SQL, (user_id, today - timedelta(days=90), today)),
+        ("_fetch_user_snapshot", database.USER_SNAPSHOT_SQL, database._snapshot_params(user_id, today)),
+        ("get_symptom_matrix", database.SYMPTOM_MATRIX_SQL, answers),
+        ("get_question_trends", database.QUESTION_TRENDS_SQL, answers),
+        ("get_self_harm_frequency", database.SELF_HARM_SQL, answers),
+        ("get_daily_metrics", database.DAILY_METRICS_SQL, (user_id, today - timedelta(days=7), today)),
+        *(("refresh_daily_metrics", sql, rollup) for pair in database._ROLLUP_SQL["postgres"].values() for sql in pair),
+        ("get_calendar_events_page", calendar_page, (user_id, now, now + timedelta(days=7), now, 0, 501)),
+        ("get_todays_events", database.TODAYS_EVENTS_SQL, (user_id, now, now + timedelta(days=1))),
+        ("get_events_for_last_week", database.LAST_WEEK_EVENTS_SQL, (user_id, now - timedelta(days=7))),
+        ("save_calendar_events", database.CLEAR_GENERATED_EVENTS_SQL, (user_id,)),
+        *(("bulk_delete_user_data", sql, (user_id,)) for targets in database.BULK_DELETE_TARGETS.values() for _, sql in targets),
+    ]
+
+
+def uncovered_readers(queries):
+    """Names of database.py's @reads functions that neither `queries` nor HOT_QUERY_EXEMPT cover."""
+    import database
+
+    covered = {name for name, _, _ in queries} | set(HOT_QUERY_EXEMPT)
+    return sorted(
+        name for name, func in vars(database).items()
+        if getattr(func, "route", None) == "read" and getattr(func, "__module__", None) == "database" and name not in covered
+    )
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def explain_hot_queries(conn, user_id=1):
+    """
+    EXPLAINs every hot query with sequential scans disabled. If the planner still
+    chooses a Seq Scan, no index can serve that query. Returns a list of
+    (name, uses_index, node_summary) tuples; nothing is executed. A reader
+    without a hot query is reported as not using an index, so it fails the check.
+    """
+    queries = hot_queries(user_id)
+    results = [(name, False, "no hot query: add it to migrations.hot_queries") for name in uncovered_readers(queries)]
+    with conn.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        for name, sql, params in queries:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0][0]["Plan"]
+            nodes = list(_plan_nodes(plan))
+            uses_index = not any(n["Node Type"] == "Seq Scan" for n in nodes)
+            summary = ", ".join(
+                f"{n['Node Type']}({n.get('Index Name') or n.get('Relation Name', '')})"
+                for n in nodes if "Relation Name" in n or "Index Name" in n
+            )
+            results.append((name, uses_index, summary))
+    conn.rollback()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the application's database schema.")
+    parser.add_argument("command", choices=["status", "upgrade", "explain"])
+    parser.add_argument("--dsn", help="libpq connection string (defaults to $DATABASE_URL or .streamlit/secrets.toml)")
+    parser.add_argument("--secrets", help="Path to a secrets.toml containing a [database] table")
+    parser.add_argument("--target", type=int, help="Upgrade only up to this version")
+    parser.add_argument("--user-id", type=int, default=1, help="Sample user id for `explain`")
+    args = parser.parse_args(argv)
+
+    conn = connect_from_secrets(args.dsn, args.secrets)
+    try:
+        if args.command == "status":
+            status(conn)
+        elif args.command == "upgrade":
+            if not upgrade(conn, args.target):
+                print("Schema is up to date.")
+        else:
+            results = explain_hot_queries(conn, args.user_id)
+            for name, uses_index, summary in results:
+                print(f"{'OK  ' if uses_index else 'SEQ '} {name:<32} {summary}")
+            if not all(ok for _, ok, _ in results):
+                return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
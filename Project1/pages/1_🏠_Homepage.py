@@ -4,6 +4,7 @@ from database import get_todays_events
 from datetime import date
 from styles import get_dark_mode_css
 from sidebar import display_homepage_sidebar
+from auth import restore_session
 
 # --- Page Configuration and Styling (Safe to run first) ---
 st.set_page_config(layout="wide", initial_sidebar_state="expanded")
@@ -11,7 +12,7 @@ st.markdown(get_dark_mode_css(), unsafe_allow_html=True)
 st.markdown("""<style>[data-testid="stSidebarNav"] {display: none;}</style>""", unsafe_allow_html=True)
 
 # --- CRITICAL: Authentication Check (MUST be done before using user data) ---
-if not st.session_state.get("logged_in"):
+if not restore_session():
     st.error("Please log in to access this page.")
     st.switch_page("app.py")
     st.stop()  # Immediately stop the script if not logged in
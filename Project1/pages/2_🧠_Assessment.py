@@ -2,16 +2,15 @@
 
 import streamlit as st
 from database import (
-    add_message, get_messages, get_user_conversations, create_conversation, 
-    update_conversation_score, delete_conversation, update_conversation_video_url,
-    update_conversation_answers,clear_all_assessments 
+    get_messages, delete_conversation, save_completed_assessment, clear_all_assessments
 )
 from shared import get_severity_and_feedback, display_progress_dashboard
 from sidebar import display_sidebar
+from auth import restore_session
 
 # --- Page Setup & Login Check ---
 st.set_page_config(layout="wide", page_title="PHQ-9 Assessment")
-if not st.session_state.get("logged_in"):
+if not restore_session():
     st.error("Please log in to access this page.")
     st.switch_page("app.py")
     st.stop()
@@ -67,6 +66,8 @@ def display_completion_page():
     """Displays the final results and the new, interactive, personalized plan."""
     result = st.session_state.assessment_result
     st.balloons()
+    if not result.get("saved", True):
+        st.warning("We couldn't save this assessment, so it won't appear in your history.")
 
     with st.container(border=True):
         st.header("📊 Assessment Complete")
@@ -184,30 +185,21 @@ def run_new_assessment():
             severity, feedback_dict = get_severity_and_feedback(total_score, problem_areas)
             video_url = feedback_dict.get("video_url")
 
-            # Database saving logic
-            all_conversations = get_user_conversations(user_id)
-            assessment_count = sum(1 for conv in all_conversations if conv['title'].startswith("PHQ-9 Assessment"))
-            new_title = f"PHQ-9 Assessment #{assessment_count + 1}"
-            conv_id = create_conversation(user_id, title=new_title)
-            
-            update_conversation_answers(conv_id, answers_array)
-            update_conversation_score(conv_id, total_score)
-            
-            if video_url:
-                update_conversation_video_url(conv_id, video_url)
-            
-            # Message saving logic (can be simplified or removed if not displaying chat history)
             final_feedback_text = f"**Assessment Complete**\n- Score: {total_score}/27\n- Severity: {severity}"
             st.session_state.assessment_messages.append({"role": "assistant", "content": final_feedback_text})
-            for msg in st.session_state.assessment_messages:
-                add_message(conv_id, msg['role'], msg['content'])
-            
+
+            # Conversation, answers, score, video and messages are saved in one transaction
+            conv_id, _ = save_completed_assessment(
+                user_id, answers_array, total_score, video_url, st.session_state.assessment_messages
+            )
+
             # Store results in session state
             st.session_state.assessment_result = {
                 "score": total_score, 
                 "severity": severity,  
                 "feedback_dict": feedback_dict,
-                "problem_areas": problem_areas
+                "problem_areas": problem_areas,
+                "saved": conv_id is not None
             }
             st.session_state.assessment_status = "completed"
             st.rerun()
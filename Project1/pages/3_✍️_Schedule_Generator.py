@@ -1,16 +1,19 @@
 import streamlit as st
-import google.generativeai as genai
+from lazy_loading import lazy_import
 import json
 import re
 from datetime import datetime, timedelta, time
 import pandas as pd
-from database import (get_calendar_events, save_calendar_events, get_score_trend, get_latest_assessment_answers)
+from database import (get_calendar_events, save_calendar_events, get_user_snapshot)
 from shared import get_severity_and_feedback
 from sidebar import display_sidebar
+from auth import restore_session
 import textwrap
 
+genai = lazy_import("google.generativeai")  # imported on first Gemini call
+
 # --- PAGE GUARD & CONFIG ---
-if not st.session_state.get("logged_in"):
+if not restore_session():
     st.error("Please log in to access this page.")
     st.switch_page("app.py")
     st.stop()
@@ -134,6 +137,11 @@ def generate_schedule(score, severity, trend_context, specific_problems_context,
     with st.spinner("AI is thinking..."):
         return model.generate_content(prompt).text
 
+def get_upcoming_fixed_events(user_id):
+    """The user's own (non-generated) events in the week the schedule will cover."""
+    week_start = datetime.combine(datetime.now().date(), time.min)
+    return get_calendar_events(user_id, week_start, week_start + timedelta(days=7), include_generated=False)
+
 def convert_ai_to_calendar_events(ai_events):
     """Converts the AI's day-based schedule to specific calendar dates."""
     calendar_events = []
@@ -168,7 +176,9 @@ st.title("✍️ AI Schedule Generator")
 st.markdown("This AI assistant creates a supportive weekly plan based on your latest assessment, preferences, and availability.")
 
 user_id = st.session_state.user_data['id']
-latest_score, previous_score = get_score_trend(user_id)
+snapshot = get_user_snapshot(user_id)
+latest_score = snapshot["phq9"]["total_score"] if snapshot["phq9"] else None
+previous_score = snapshot["previous_score"]
     
 if latest_score is None:
     st.warning("You need to complete an assessment first to generate a personalized schedule.")
@@ -184,7 +194,7 @@ if previous_score is not None:
     else: trend_context = f"STABLE at {latest_score}."
 
 phq9_questions_map = {0:"Little interest or pleasure", 1:"Feeling down/depressed", 2:"Sleep problems", 3:"Feeling tired", 4:"Appetite problems", 5:"Feeling bad about self", 6:"Concentration problems", 7:"Moving/speaking differently", 8:"Thoughts of self-harm"}
-latest_answers = get_latest_assessment_answers(user_id)
+latest_answers = snapshot["phq9"]["answers"]
 specific_problems_context = "No specific problem areas identified."
 top_problem_key = "default"
 if latest_answers:
@@ -209,7 +219,7 @@ if st.session_state.preview_schedule:
             col1.markdown(f"**{day_display}:** {activity_display} `({start_display} - {end_display})`")
 
             if col2.button("Swap 🔄", key=f"swap_{i}", use_container_width=True):
-                all_events = get_calendar_events(user_id)
+                all_events = get_upcoming_fixed_events(user_id)
                 new_event_text = generate_schedule(
                     latest_score, severity, trend_context, specific_problems_context, 
                     st.session_state.schedule_prefs, st.session_state.schedule_focus, 
@@ -293,7 +303,7 @@ else:
         if not st.session_state.schedule_prefs or not st.session_state.schedule_focus:
             st.error("Please complete Step 3 (provide preferences and focus areas).")
         else:
-            all_events = get_calendar_events(user_id)
+            all_events = get_upcoming_fixed_events(user_id)
             ai_response_text = generate_schedule(latest_score, severity, trend_context, specific_problems_context, st.session_state.schedule_prefs, st.session_state.schedule_focus, all_events, st.session_state.schedule_time_constraints, st.session_state.schedule_intensity)
             ai_events = parse_ai_response_to_events(ai_response_text)
             if ai_events:
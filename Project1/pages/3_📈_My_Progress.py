@@ -2,15 +2,21 @@
 
 import streamlit as st
 import pandas as pd
-import google.generativeai as genai
-from shared import display_progress_dashboard, get_scores_over_time
+from lazy_loading import lazy_import
+import plotly.graph_objects as go
+import datetime
+from shared import display_progress_dashboard, get_scores_over_time, PHQ9_SHORT_NAMES
 from database import get_scores_over_time # Re-importing here for clarity
+from database import get_symptom_matrix, get_symptom_changes, get_self_harm_frequency
+from auth import restore_session
 import textwrap
 
+genai = lazy_import("google.generativeai")  # imported on first Gemini call
+
 # --- Page Config & Login Check ---
 st.set_page_config(layout="wide", page_title="My Progress")
 
-if not st.session_state.get("logged_in"):
+if not restore_session():
     st.error("Please log in to view your progress.")
     st.switch_page("app.py")
     st.stop()
@@ -56,6 +62,58 @@ def get_ai_trend_analysis(df):
     except Exception as e:
         return f"An error occurred during AI analysis: {e}"
 
+# --- Helpers for the symptom view ---
+SYMPTOM_PERIODS = {"All Time": None, "Last 90 Days": 90, "Last 180 Days": 180, "Last Year": 365}
+
+def create_symptom_heatmap(matrix):
+    """Questions down the side, assessments across, coloured by answer (0-3)."""
+    dates = [ts.strftime("%d %b %Y") for ts in pd.to_datetime(matrix.index)]
+    fig = go.Figure(go.Heatmap(
+        z=matrix.T.values, x=dates, y=[PHQ9_SHORT_NAMES[q] for q in matrix.columns],
+        zmin=0, zmax=3, colorscale=[[0, "#2e7d32"], [0.34, "#fdd835"], [0.67, "#fb8c00"], [1, "#c62828"]],
+        colorbar=dict(title="Answer", tickvals=[0, 1, 2, 3]), xgap=2, ygap=2,
+        hovertemplate="%{y}<br>%{x}: %{z}<extra></extra>",
+    ))
+    fig.update_layout(title="Symptom Heatmap", xaxis=dict(type="category"), yaxis=dict(autorange="reversed"),
+                      height=420, margin=dict(l=20, r=20, t=40, b=20), plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)')
+    return fig
+
+def display_symptom_patterns(user_id):
+    period = st.selectbox("Select Period", list(SYMPTOM_PERIODS), key="symptom_period")
+    days = SYMPTOM_PERIODS[period]
+    start = datetime.date.today() - datetime.timedelta(days=days) if days else None
+
+    matrix = get_symptom_matrix(user_id, start)
+    if matrix.empty:
+        st.info("Your symptom patterns will appear here once you complete an assessment in this period.")
+        return
+    st.plotly_chart(create_symptom_heatmap(matrix), use_container_width=True)
+
+    improved, worsened = get_symptom_changes(user_id, start)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("📉 Most Improved")
+        for question, change in improved:
+            st.markdown(f"- **{PHQ9_SHORT_NAMES[question]}**: {change:+d}")
+        if not improved:
+            st.caption("No question has improved between your first and latest assessment in this period yet.")
+    with col2:
+        st.subheader("📈 Most Worsened")
+        for question, change in worsened:
+            st.markdown(f"- **{PHQ9_SHORT_NAMES[question]}**: {change:+d}")
+        if not worsened:
+            st.caption("No question has worsened between your first and latest assessment in this period.")
+
+    self_harm = get_self_harm_frequency(user_id, start)
+    if self_harm and self_harm["positive"]:
+        st.warning(
+            f"In {self_harm['positive']} of your {self_harm['assessments']} assessments in this period you reported "
+            "thoughts that you would be better off dead or of hurting yourself. You don't have to carry this alone: "
+            "you can call or text **03 7627 2929** (Malaysian Mental Health Association) for a confidential conversation, "
+            "or contact a doctor or therapist.",
+            icon="❤️",
+        )
+
 
 # --- Main Page Content ---
 st.title("📈 Wellness Dashboard")
@@ -65,7 +123,7 @@ st.divider()
 user_id = st.session_state.user_data['id']
 score_data = get_scores_over_time(user_id)
 
-tab1, tab2 = st.tabs(["📊 Main Dashboard", "🤖 AI Analysis & Reflection"])
+tab1, tab2, tab3 = st.tabs(["📊 Main Dashboard", "🤖 AI Analysis & Reflection", "🧩 Symptom Patterns"])
 
 with tab1:
     # The main dashboard component is now self-contained and powerful
@@ -96,4 +154,9 @@ with tab2:
         - **Look at the valleys:** What contributed to your better days? More exercise, social connection, a specific accomplishment?
         
         **What's one small, kind action you can take for yourself today based on what you see?**
-        """)
\ No newline at end of file
+        """)
+
+with tab3:
+    st.header("Symptom Patterns")
+    st.markdown("See how each PHQ-9 question has changed across your assessments (0 = not at all, 3 = nearly every day).")
+    display_symptom_patterns(user_id)
@@ -5,22 +5,36 @@ from database import (
     save_calendar_events, 
     delete_calendar_event, 
     update_calendar_event, 
-    clear_all_events, 
+    bulk_delete_user_data,
     update_calendar_event_completion,
     get_events_for_last_week # Import the function for the review
 )
-from datetime import datetime, time, timedelta
+from datetime import datetime, date, time, timedelta
 import random
-import google.generativeai as genai # Import for the AI review
+from lazy_loading import lazy_import
 from sidebar import display_sidebar
+from auth import restore_session
+
+genai = lazy_import("google.generativeai")  # imported on first AI review
 
 # --- PAGE GUARD & CONFIG ---
 st.set_page_config(page_title="Full Calendar", layout="wide")
-if not st.session_state.get("logged_in"):
+if not restore_session():
     st.error("Please log in to access this page.")
     st.switch_page("app.py")
     st.stop()
 
+# --- HELPERS for the visible calendar window ---
+def default_calendar_window():
+    """The week FullCalendar shows on first load (timeGridWeek starts on Sunday)."""
+    today = date.today()
+    week_start = datetime.combine(today - timedelta(days=(today.weekday() + 1) % 7), time.min)
+    return {"start": week_start, "end": week_start + timedelta(days=7), "view": "timeGridWeek"}
+
+def parse_calendar_date(value):
+    """Parses a FullCalendar ISO date into a naive datetime to match calendar_events.start_time."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
 # --- HELPER FUNCTION for the AI Review ---
 def configure_gemini():
     try:
@@ -83,6 +97,7 @@ if st.session_state.get("calendar_force_refresh"):
 if 'editing_event_id' not in st.session_state: st.session_state.editing_event_id = None
 if 'confirming_clear_all' not in st.session_state: st.session_state.confirming_clear_all = False
 if 'logging_mood_for' not in st.session_state: st.session_state.logging_mood_for = None
+if 'calendar_window' not in st.session_state: st.session_state.calendar_window = default_calendar_window()
 
 st.title("My Calendar & Notes")
 st.markdown("View your AI-generated schedule and manage your personal events. Mark events as 'Complete' to track your progress!")
@@ -99,12 +114,26 @@ if 'weekly_review_content' in st.session_state:
 
 # --- CALENDAR DISPLAY ---
 st.header("Calendar View")
-events = get_calendar_events(st.session_state.user_data['id'])
+# Only the range FullCalendar is showing is fetched; navigating reports the new range via datesSet.
+window = st.session_state.calendar_window
+events = get_calendar_events(st.session_state.user_data['id'], window["start"], window["end"])
 calendar_options = {
     "headerToolbar": {"left": "today prev,next", "center": "title", "right": "dayGridMonth,timeGridWeek,listWeek"},
-    "initialView": "timeGridWeek", "height": "600px","timeZone": "UTC"
+    "initialView": window["view"], "initialDate": window["start"].date().isoformat(),
+    "height": "600px","timeZone": "UTC"
 }
-calendar(events=events, options=calendar_options, key=f"main_calendar_{len(events)}_{force_refresh_key_suffix}")
+calendar_state = calendar(events=events, options=calendar_options, callbacks=["datesSet"], key=f"main_calendar_{len(events)}_{force_refresh_key_suffix}")
+if calendar_state and calendar_state.get("callback") == "datesSet":
+    dates_set = calendar_state.get("datesSet", {})
+    if dates_set.get("start") and dates_set.get("end"):
+        new_window = {
+            "start": parse_calendar_date(dates_set["start"]),
+            "end": parse_calendar_date(dates_set["end"]),
+            "view": dates_set.get("view", {}).get("type", window["view"]),
+        }
+        if new_window != window:
+            st.session_state.calendar_window = new_window
+            st.rerun()
 
 st.divider()
 
@@ -142,8 +171,9 @@ with st.expander("➕ Add a New Event or Note"):
 
 # --- NEW: Interactive Event List with Completion and Mood Logging ---
 st.subheader("Your Current Events")
+st.caption(f"Showing events from {window['start']:%b %d} to {(window['end'] - timedelta(days=1)):%b %d, %Y}.")
 if not events:
-    st.info("You have no events scheduled. Generate a schedule or add an event to get started!")
+    st.info("You have no events scheduled in this view. Generate a schedule or add an event to get started!")
 else:
     sorted_events = sorted(events, key=lambda x: x['start'])
     for event in sorted_events:
@@ -243,8 +273,9 @@ with st.container(border=True):
         with col1:
             if st.button("Yes, Delete Everything", use_container_width=True, type="primary"):
                 with st.spinner("Deleting all events..."):
-                    if clear_all_events(st.session_state.user_data['id']):
-                        st.toast("All calendar events have been cleared.")
+                    deleted = bulk_delete_user_data(st.session_state.user_data['id'], ["calendar_events"])
+                    if deleted is not None:
+                        st.toast(f"All calendar events have been cleared ({deleted['calendar_events']} removed).")
                         st.session_state.confirming_clear_all = False
                         st.rerun()
                     else:
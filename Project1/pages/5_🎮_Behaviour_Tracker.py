@@ -4,34 +4,25 @@ import datetime
 import plotly.express as px
 import plotly.graph_objects as go
 from sidebar import display_sidebar
+from auth import restore_session
 #from sidebar import show_sidebar
-from database import (
-    save_behavior_log,
-    get_behavior_logs,
-    get_latest_phq9,
-)
+from database import save_behavior_log
+from database_async import run_concurrently, get_behavior_logs, get_daily_metrics, get_user_snapshot
 
 # Page guard
-if not st.session_state.get("logged_in"):
+if not restore_session():
     st.error("Please log in to access this page.")
     st.switch_page("app.py")
     st.stop()
 
-def compute_weighted_risk(row, phq9_score=0):
-    score = 0
-    if row["hours_played"] > 6: score += 3
-    elif row["hours_played"] > 4: score += 1
-    if row["mood_score"] < -0.5: score += 4
-    elif row["mood_score"] < 0: score += 2
-    if row["solo_play_ratio"] > 0.8: score += 2
-    if row["late_night_gaming"]: score += 1
-    if row["physical_breaks"] < 1: score += 1
-    if row["social_interaction_score"] < 3: score += 2
-    if phq9_score > 19: score += 5
-    elif phq9_score > 14: score += 4
-    elif phq9_score > 9: score += 3
-    elif phq9_score > 4: score += 1
-    return min(score, 20)
+# The behavioural part of the risk score is precomputed per day in the
+# daily_user_metrics rollup (database.BEHAVIOR_RISK_SQL); this adds the PHQ-9 part.
+def phq9_risk_points(phq9_score=0):
+    if phq9_score > 19: return 5
+    elif phq9_score > 14: return 4
+    elif phq9_score > 9: return 3
+    elif phq9_score > 4: return 1
+    return 0
 
 def generate_holistic_insights(df, phq9):
     if df.empty or len(df) < 3:
@@ -125,9 +116,6 @@ def behaviour_page():
 
         submitted = st.form_submit_button("💾 Save & Generate Insights")
 
-    phq9 = get_latest_phq9(user_id)
-    phq9_score = phq9['total_score'] if phq9 else 0
-
     if submitted:
         save_behavior_log(
             user_id=user_id,
@@ -141,14 +129,22 @@ def behaviour_page():
         )
         st.success("✅ Behavior log saved!")
 
-    df = get_behavior_logs(user_id)
+    # Independent reads, issued concurrently.
+    snapshot, df, metrics = run_concurrently(
+        (get_user_snapshot, user_id),
+        (get_behavior_logs, user_id),
+        (get_daily_metrics, user_id),
+    )
+    phq9 = snapshot["phq9"]
+    phq9_score = phq9['total_score'] if phq9 else 0
 
     if df.empty:
         st.info("Log your first behavior to begin tracking your wellness journey.")
         return
 
     df_sorted = df.sort_values("date").reset_index(drop=True)
-    df_sorted['risk_score'] = df_sorted.apply(lambda row: compute_weighted_risk(row, phq9_score), axis=1)
+    daily_risk = metrics.set_index("day")["risk_score"]
+    df_sorted['risk_score'] = (df_sorted['date'].map(daily_risk).fillna(0) + phq9_risk_points(phq9_score)).clip(upper=20).astype(int)
 
     insights = generate_holistic_insights(df_sorted, phq9)
     suggestions = generate_actionable_suggestions(insights)
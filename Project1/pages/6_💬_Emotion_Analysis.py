@@ -1,52 +1,29 @@
 import streamlit as st
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import datetime
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
 from sidebar import display_sidebar
+from auth import restore_session
 
 # Make sure to import your custom modules
 #from sidebar import show_sidebar
-from database import create_conversation, save_emotion_log, get_emotion_history
+from database import create_conversation, save_emotion_log, save_emotion_days, get_daily_metrics
+from emotion_models import load_models, get_inference_cache, analyze_texts
+from chat_logs import analyze_chat_log
 
 # Page guard
-if not st.session_state.get("logged_in"):
+if not restore_session():
     st.error("Please log in to access this page.")
     st.switch_page("app.py")
     st.stop()
 
 # --- CORE LOGIC (UNCHANGED) ---
 
-@st.cache_resource
-def download_vader():
-    try:
-        nltk.data.find('sentiment/vader_lexicon.zip')
-    except LookupError:
-        nltk.download('vader_lexicon')
-
-@st.cache_resource
-def load_models():
-    transformer_model_name = "bhadresh-savani/distilbert-base-uncased-emotion"
-    tokenizer = AutoTokenizer.from_pretrained(transformer_model_name)
-    transformer_model = AutoModelForSequenceClassification.from_pretrained(transformer_model_name)
-    vader_analyzer = SentimentIntensityAnalyzer()
-    return tokenizer, transformer_model, vader_analyzer
-
-def predict_transformer_emotion(text, tokenizer, model):
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    logits = outputs.logits
-    probs = torch.nn.functional.softmax(logits, dim=1)[0]
-    labels = model.config.id2label
-    return {labels[i]: float(probs[i]) for i in range(len(probs))}
-
-def predict_vader_sentiment(text, analyzer):
-    return analyzer.polarity_scores(text)
+def show_cache_caption():
+    stats = get_inference_cache().stats()
+    st.caption(f"⚡ Analysis cache: {stats['hit_ratio']:.0%} of messages answered from cache · "
+               f"~{stats['saved_seconds']:.1f} s of model time saved")
 
 def highlight_emotion_keywords(text, emotion):
     emotion_keyword_map = {
@@ -86,23 +63,19 @@ def get_emotion_feedback(emotion, volatility_level=None):
     return feedback
 
 # --- NEW: COMPLEX FUNCTION FOR EMOTIONAL VOLATILITY ---
-def calculate_emotional_volatility(history_df):
+def calculate_emotional_volatility(recent_metrics):
     """
-    Calculates the emotional volatility based on the standard deviation of recent
-    VADER compound scores.
+    Calculates the emotional volatility based on the standard deviation of the
+    VADER compound scores of every analysis in `recent_metrics` (daily rollup
+    rows), pooled from each day's count, sum and sum of squares.
     """
-    if len(history_df) < 3:
+    n = recent_metrics['vader_n'].sum()
+    if n < 3:
         return 0, 'Low' # Not enough data for a meaningful calculation
 
-    # Filter for the last 7 days of data
-    seven_days_ago = pd.to_datetime('today') - pd.Timedelta(days=7)
-    recent_history = history_df[history_df['date'] >= seven_days_ago]
-    
-    if len(recent_history) < 3:
-        return 0, 'Low'
-
-    # Calculate standard deviation of the VADER compound score
-    volatility_std = recent_history['vader_compound'].std()
+    total = recent_metrics['vader_sum'].sum()
+    variance = max((recent_metrics['vader_sumsq'].sum() - total * total / n) / (n - 1), 0)
+    volatility_std = variance ** 0.5
 
     # Normalize the score to a 0-100 scale (assuming max std dev is around 0.7 for VADER)
     normalized_volatility = min((volatility_std / 0.7) * 100, 100)
@@ -151,11 +124,87 @@ def create_vader_gauge_chart(compound_score):
     fig.update_layout(height=280, margin={'t': 50, 'b': 30, 'l': 30, 'r': 30}, paper_bgcolor="rgba(0,0,0,0)", font={'color': "#E0E0E0"})
     return fig
 
+# --- CHAT LOG UPLOAD ---
+SINGLE_MODE = "✍️ A single message"
+UPLOAD_MODE = "📂 A chat log file"
+TOP_SPEAKERS = 20
+
+def emotion_counts_long(rows, index):
+    """Melts per-emotion count columns of speaker/hour rows into (index, Emotion, Messages) rows for stacked bars."""
+    df = pd.DataFrame(rows)
+    emotions = [c for c in df.columns if c not in (index, 'messages', 'vader_mean')]
+    return df.melt(id_vars=[index], value_vars=emotions, var_name='Emotion', value_name='Messages').fillna(0)
+
+def show_chat_log_upload(user_id):
+    uploaded = st.file_uploader("📂 Upload a Discord or Steam chat export (.txt)", type=["txt", "log"])
+    if uploaded is None:
+        return
+
+    if st.button("🔍 Analyze Chat Log"):
+        progress = st.progress(0.0, text="Reading chat log...")
+        summary = analyze_chat_log(
+            uploaded, analyze_texts,
+            progress=lambda fraction, messages: progress.progress(fraction, text=f"Analyzed {messages:,} messages..."),
+        )
+        progress.empty()
+        # Only the aggregates are kept, so the save button below works after the rerun.
+        st.session_state.chat_log_summary = ((uploaded.name, uploaded.size), summary)
+
+    key, summary = st.session_state.get("chat_log_summary", (None, None))
+    if key != (uploaded.name, uploaded.size):
+        return
+    if not summary.messages:
+        st.warning("⚠️ No chat messages were recognised in this file. Lines should look like `[2023-12-03 21:15] Name: message`.")
+        return
+
+    st.header("Chat Log Results")
+    speaker_rows = summary.speaker_rows()
+    col1, col2 = st.columns(2)
+    col1.metric("Messages analyzed", f"{summary.messages:,}")
+    col2.metric("Speakers", f"{len(speaker_rows):,}")
+    show_cache_caption()
+    color_map = {e: s['color'] for e, s in EMOTION_STYLES.items()}
+
+    st.subheader("🗣️ Emotions per Speaker")
+    fig_speakers = px.bar(
+        emotion_counts_long(speaker_rows[:TOP_SPEAKERS], 'speaker'), x='Messages', y='speaker', color='Emotion',
+        orientation='h', color_discrete_map=color_map, labels={'speaker': 'Speaker'},
+    )
+    fig_speakers.update_layout(yaxis={'categoryorder': 'total ascending'})
+    st.plotly_chart(fig_speakers, use_container_width=True)
+    if len(speaker_rows) > TOP_SPEAKERS:
+        st.caption(f"Showing the {TOP_SPEAKERS} most active of {len(speaker_rows):,} speakers.")
+
+    st.subheader("🕒 Emotions per Hour")
+    hourly_rows = summary.hourly_rows()
+    st.plotly_chart(px.bar(
+        emotion_counts_long(hourly_rows, 'hour'), x='hour', y='Messages', color='Emotion',
+        color_discrete_map=color_map, labels={'hour': 'Hour'},
+    ), use_container_width=True)
+    st.plotly_chart(px.line(
+        pd.DataFrame(hourly_rows), x='hour', y='vader_mean', markers=True,
+        labels={'hour': 'Hour', 'vader_mean': 'Mean VADER compound'}, title="Sentiment over Time",
+    ), use_container_width=True)
+
+    st.subheader("💾 Save to Your Emotional Journey")
+    speaker = st.selectbox("Which speaker are you?", [row['speaker'] for row in speaker_rows])
+    # Saving a log again replaces its earlier save, so there is nothing to gain from a second click.
+    saved_key, saved_days = st.session_state.get("chat_log_saved", (None, None))
+    already_saved = saved_key == (summary.digest, speaker)
+    if st.button("Save my messages", disabled=already_saved):
+        saved = save_emotion_days(user_id, summary.emotion_days(speaker), source=f"chat:{summary.digest}")
+        if saved is None:
+            st.error("Could not save the analysis. Please try again later.")
+        else:
+            st.session_state.chat_log_saved = ((summary.digest, speaker), saved)
+            st.success(f"✅ Logged emotions for {saved} day(s) of {speaker}'s messages.")
+    elif already_saved:
+        st.success(f"✅ Logged emotions for {saved_days} day(s) of {speaker}'s messages.")
+
 # --- Main Emotion Detection Page ---
 def emotion_page():
-    download_vader()
     display_sidebar(page_name="emotion")
-    tokenizer, transformer_model, vader_analyzer = load_models()
+    load_models()
     
     # if "user_id" in st.session_state and "emotion_logged" not in st.session_state:
     #     create_conversation(st.session_state.user_id, title="Advanced Emotion Analysis")
@@ -165,28 +214,29 @@ def emotion_page():
     st.markdown("Dive deep into the emotions of your gaming chats to foster better mental health.")
     
     user_id = st.session_state.user_data['id']
-    user_input = st.text_area("💬 Enter a gaming chat message or describe how you're feeling:", height=150)
+    mode = st.radio("What would you like to analyze?", [SINGLE_MODE, UPLOAD_MODE], horizontal=True)
+    if mode == UPLOAD_MODE:
+        show_chat_log_upload(user_id)
+    else:
+        user_input = st.text_area("💬 Enter a gaming chat message or describe how you're feeling:", height=150)
 
-    if st.button("🔍 Analyze and Understand My Emotion"):
+    if mode == SINGLE_MODE and st.button("🔍 Analyze and Understand My Emotion"):
         if not user_input.strip():
             st.warning("⚠️ Please enter a message to analyze.")
             return
 
         # --- Primary Analysis ---
-        transformer_scores = predict_transformer_emotion(user_input, tokenizer, transformer_model)
-        vader_scores = predict_vader_sentiment(user_input, vader_analyzer)
+        analysis = analyze_texts([user_input])[0]
+        transformer_scores, vader_scores = analysis["emotions"], analysis["vader"]
         df = pd.DataFrame(list(transformer_scores.items()), columns=["Emotion", "Probability"])
         df_sorted = df.sort_values(by="Probability", ascending=False).reset_index(drop=True)
         top_emotion_label = df_sorted.iloc[0]['Emotion']
         top_emotion_score = float(df_sorted.iloc[0]['Probability'])
 
         # --- NEW: Volatility Analysis ---
-        emotion_history = get_emotion_history(st.session_state.get("user_id"))
-        volatility_score, volatility_level = (0, 'Low')
-        if emotion_history:
-            history_df = pd.DataFrame(emotion_history)
-            history_df['date'] = pd.to_datetime(history_df['date'])
-            volatility_score, volatility_level = calculate_emotional_volatility(history_df)
+        # Last 7 days, including today
+        recent_metrics = get_daily_metrics(user_id, start=datetime.date.today() - datetime.timedelta(days=6))
+        volatility_score, volatility_level = calculate_emotional_volatility(recent_metrics)
         
         # --- Results Display ---
         st.header("Emotional Analysis Results")
@@ -230,6 +280,7 @@ def emotion_page():
         bar_fig = px.bar(df_sorted, x="Probability", y="Emotion", orientation='h', color="Emotion",
                          color_discrete_map={e: s['color'] for e, s in EMOTION_STYLES.items()})
         st.plotly_chart(bar_fig, use_container_width=True)
+        show_cache_caption()
 
         if user_id:
             save_emotion_log(
@@ -243,15 +294,19 @@ def emotion_page():
         st.markdown("---")
         st.header("📈 Your Emotional Journey Over Time")
         try:
-            emotion_history = get_emotion_history(user_id)
-            if emotion_history:
-                history_df = pd.DataFrame(emotion_history)
-                history_df['date'] = pd.to_datetime(history_df['date'])
-                
+            history_df = get_daily_metrics(user_id)
+            history_df = history_df[history_df['vader_n'] > 0]
+            if not history_df.empty:
+                history_df = history_df.assign(
+                    date=pd.to_datetime(history_df['day']),
+                    emotion=history_df['emotion_counts'].map(lambda counts: max(counts, key=counts.get) if counts else None),
+                )
+
                 color_map = {e: s['color'] for e, s in EMOTION_STYLES.items()}
                 fig_hist = px.scatter(
-                    history_df, x='date', y='vader_compound', color='emotion',
-                    size='probability', hover_name='emotion', color_discrete_map=color_map,
+                    history_df, x='date', y='vader_mean', color='emotion',
+                    size='vader_n', hover_name='emotion', color_discrete_map=color_map,
+                    labels={'vader_mean': 'Mean VADER compound', 'vader_n': 'Analyses'},
                     title="Historical Emotion Trends"
                 )
                 st.plotly_chart(fig_hist, use_container_width=True)
@@ -1,15 +1,15 @@
 import streamlit as st
+import pandas as pd
 #from sidebar import show_sidebar
 from database import (
-    get_latest_phq9,
-    get_latest_emotion,
-    get_behavior_logs,
+    get_user_snapshot,
     create_conversation
 )
 from sidebar import display_sidebar
+from auth import restore_session
 
 # Page guard
-if not st.session_state.get("logged_in"):
+if not restore_session():
     st.error("Please log in to access this page.")
     st.switch_page("app.py")
     st.stop()
@@ -17,7 +17,7 @@ if not st.session_state.get("logged_in"):
 ##CHANGED##
 st.set_page_config(page_title="AI Suggestions", layout="wide")
 
-if not st.session_state.get("logged_in"):
+if not restore_session():
     st.error("Please log in to access this page.")
     st.switch_page("app.py")
     st.stop()
@@ -267,9 +267,11 @@ def suggestion_page():
     #     st.session_state.suggestion_logged = True
         
      # 3. Use 'user_id' for all subsequent database calls as well.
-    phq9 = get_latest_phq9(user_id)
-    emotion = get_latest_emotion(user_id)
-    behavior_df = get_behavior_logs(user_id)
+    # One round trip for the latest PHQ-9, emotion and behavior log.
+    snapshot = get_user_snapshot(user_id)
+    phq9 = snapshot["phq9"]
+    emotion = snapshot["emotion"]
+    behavior_df = pd.DataFrame([snapshot["behavior"]]) if snapshot["behavior"] else pd.DataFrame()
     ###END OF FIX####
 
 
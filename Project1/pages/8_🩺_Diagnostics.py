@@ -0,0 +1,80 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+from database import get_query_stats, get_pool_stats, get_cache_stats, get_write_queue_stats, get_session_cache_stats
+from auth import restore_session, get_password_hasher
+from emotion_models import start_warmup, get_inference_cache
+
+st.set_page_config(layout="wide", page_title="Diagnostics")
+
+# Page guard: only accounts listed in [diagnostics] admins may see this page.
+if not restore_session():
+    st.error("Please log in to access this page.")
+    st.switch_page("app.py")
+    st.stop()
+
+admins = st.secrets.get("diagnostics", {}).get("admins", [])
+if st.session_state.user_data.get("email") not in admins:
+    st.error("This page is not available.")
+    st.stop()
+
+st.title("🩺 Database Diagnostics")
+stats = get_query_stats()
+
+reruns = stats.rerun_summary()
+pool = get_pool_stats()
+cache = get_cache_stats()
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Queries per rerun (mean)", f"{reruns['mean_queries']:.1f}", help=f"Over the last {reruns['reruns']} reruns")
+c2.metric("Queries per rerun (max)", reruns["max_queries"])
+c3.metric("DB time per rerun", f"{reruns['mean_db_ms']:.0f} ms")
+c4.metric("Cache hit ratio", f"{cache['hit_ratio']:.0%}")
+st.caption(f"Pool: {pool['in_use']} in use, {pool['idle']} idle of {pool['maxconn']} · "
+           f"{pool['waits']} waits, {pool['timeouts']} timeouts · slow-query threshold {stats.slow_threshold * 1000:.0f} ms")
+sessions = get_session_cache_stats()
+st.caption(f"Sessions: {sessions['entries']} cached · {sessions['hits']} restored from cache, "
+           f"{sessions['revalidations']} revalidated, {sessions['misses']} looked up · {sessions['expired']} expired idle")
+hashing = get_password_hasher().stats()
+st.caption(f"Password hashing: {hashing['params']['scheme']} on {hashing['workers']} {hashing['kind']} workers · "
+           f"{hashing['verifications']} logins, {hashing['mean_ms']:.0f} ms mean · "
+           f"{hashing['rehashes']} legacy hashes upgraded, {hashing['busy']} turned away busy")
+warmup = start_warmup().stats()
+steps = ", ".join(f"{name} {seconds:.1f} s" for name, seconds in warmup["steps"].items())
+st.caption(f"Model warm-up: {warmup['state']}" + (f" in {warmup['seconds']:.1f} s ({steps})" if steps else ""))
+if warmup["state"] == "failed":
+    st.warning(f"Model warm-up failed at {warmup['error']}; models load on first use instead.")
+elif warmup["state"] == "done":   # otherwise reading the cache would load the models here
+    inference = get_inference_cache().stats()
+    st.caption(f"Emotion cache: {inference['entries']} in memory, {inference['disk_entries']} on disk · "
+               f"{inference['hit_ratio']:.0%} hits ({inference['memory_hits']} memory, {inference['disk_hits']} disk) · "
+               f"~{inference['saved_seconds']:.1f} s of inference saved")
+write_queue = get_write_queue_stats()
+if write_queue is not None:
+    st.caption(f"Write-behind: {write_queue['depth']} queued, lag {write_queue['lag_s']:.1f} s · "
+               f"{write_queue['applied']} applied in {write_queue['batches']} batches, {write_queue['coalesced']} coalesced · "
+               f"{write_queue['retries']} retries, {write_queue['dead_letters']} dead letters")
+    if write_queue["consecutive_failures"]:
+        st.warning(f"Write-behind is retrying in {write_queue['retry_in_s']:.0f} s: {write_queue['last_error']}")
+
+limit = st.slider("Rows", 5, 100, 20)
+columns = ["function", "calls", "total_ms", "mean_ms", "max_ms", "rows", "rows_fetched", "query"]
+number_format = {"total_ms": "{:.1f}", "mean_ms": "{:.2f}", "max_ms": "{:.1f}"}
+
+tab_time, tab_calls, tab_slow = st.tabs(["Top by total time", "Top by calls", "Slow queries"])
+with tab_time:
+    st.dataframe(pd.DataFrame(stats.top("total_ms", limit), columns=columns).style.format(number_format),
+                 use_container_width=True, hide_index=True)
+with tab_calls:
+    st.dataframe(pd.DataFrame(stats.top("calls", limit), columns=columns).style.format(number_format),
+                 use_container_width=True, hide_index=True)
+with tab_slow:
+    slow = pd.DataFrame(stats.slow_queries(), columns=["at", "function", "ms", "rows", "query"])
+    if slow.empty:
+        st.info("No queries over the threshold yet.")
+    else:
+        slow["at"] = slow["at"].map(lambda ts: datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S"))
+        st.dataframe(slow.head(limit), use_container_width=True, hide_index=True)
+
+if st.button("Reset statistics"):
+    stats.reset()
+    st.rerun()
@@ -0,0 +1,237 @@
+"""
+Monthly partition maintenance for chat_history and emotion_logs.
+
+Usage (from the Project1 directory):
+    python partitions.py status
+    python partitions.py maintain [--months-ahead 3] [--archive-after 12] [--archive-dir archive]
+
+`maintain` creates the partitions for the current month and `--months-ahead`
+months after it, then detaches every partition that ended more than
+`--archive-after` months ago, writes its rows to <archive-dir>/<partition>.csv.gz
+and drops it (`--keep-detached` leaves the detached table in place instead).
+Run it from cron at least monthly; rows that arrive for a month without a
+partition land in the DEFAULT partition and are moved out when it is created.
+
+Needs Postgres 12+ with migration 006 applied. Only Postgres is partitioned;
+the SQLite backend keeps plain tables.
+"""
+import argparse
+import gzip
+import os
+import re
+import sys
+from datetime import date
+
+from db_pool import connect_from_secrets
+
+# Serialises concurrent `maintain` runs.
+PARTITION_LOCK_KEY = 727_002
+
+# Partitioned table -> (partition key, SQL type of the partition bounds).
+PARTITIONED_TABLES = {
+    "chat_history": ("timestamp", "timestamptz"),
+    "emotion_logs": ("date", "date"),
+}
+
+_MONTHLY = re.compile(r"_y(\d{4})m(\d{2})$")
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def list_partitions(conn, table):
+    """Returns [(partition name, first day of its month or None for DEFAULT, row estimate)]."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname, c.reltuples::bigint
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            ORDER BY c.relname
+        """, (table,))
+        rows = cursor.fetchall()
+    partitions = []
+    for name, estimate in rows:
+        match = _MONTHLY.search(name)
+        month = date(int(match.group(1)), int(match.group(2)), 1) if match else None
+        partitions.append((name, month, max(estimate, 0)))
+    return partitions
+
+
+def create_partition(conn, table, month):
+    """
+    Creates the partition of `table` for `month`. Rows already sitting in the
+    DEFAULT partition for that month are moved into it first, since Postgres
+    refuses to add a partition whose rows are in DEFAULT. Returns rows moved.
+    """
+    key, bound_type = PARTITIONED_TABLES[table]
+    name = partition_name(table, month)
+    bounds = {"lo": month, "hi": add_months(month, 1)}
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_KEY,))
+        cursor.execute(
+            f"SELECT 1 FROM {table}_default WHERE {key} >= %(lo)s::{bound_type} AND {key} < %(hi)s::{bound_type} LIMIT 1",
+            bounds,
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM (%(lo)s::{bound_type}) TO (%(hi)s::{bound_type})",
+                bounds,
+            )
+            moved = 0
+        else:
+            # Holds off inserts into DEFAULT until the new partition is attached.
+            cursor.execute(f"LOCK TABLE {table}_default IN EXCLUSIVE MODE")
+            cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cursor.execute(f"""
+                WITH moved AS (
+                    DELETE FROM {table}_default
+                    WHERE {key} >= %(lo)s::{bound_type} AND {key} < %(hi)s::{bound_type}
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            """, bounds)
+            moved = cursor.rowcount
+            cursor.execute(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM (%(lo)s::{bound_type}) TO (%(hi)s::{bound_type})",
+                bounds,
+            )
+    conn.commit()
+    return moved
+
+
+def ensure_partitions(conn, months_ahead=3, today=None):
+    """Creates any missing partitions from this month to `months_ahead` months ahead. Returns the names created."""
+    this_month = (today or date.today()).replace(day=1)
+    created = []
+    for table in PARTITIONED_TABLES:
+        partitions = list_partitions(conn, table)
+        if not partitions:
+            raise RuntimeError(f"{table} is not partitioned; run `python migrations.py upgrade` first")
+        existing = {month for _, month, _ in partitions}
+        for n in range(months_ahead + 1):
+            month = add_months(this_month, n)
+            if month in existing:
+                continue
+            moved = create_partition(conn, table, month)
+            created.append(partition_name(table, month))
+            print(f"Created {partition_name(table, month)}" + (f" ({moved} rows moved from {table}_default)" if moved else ""))
+    return created
+
+
+def archive_partition(conn, table, name, archive_dir, keep_detached=False):
+    """
+    Detaches partition `name` from `table`, copies its rows to
+    <archive_dir>/<name>.csv.gz and drops it. Returns the rows archived.
+    The file is written under a temporary name and only renamed into place
+    once the row count matches, so a failed run leaves the table to retry.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_KEY,))
+        cursor.execute(
+            "SELECT 1 FROM pg_inherits WHERE inhrelid = %s::regclass AND inhparent = %s::regclass", (name, table)
+        )
+        if cursor.fetchone():
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+    conn.commit()
+    if archive_dir is None:
+        return 0
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    partial = path + ".partial"
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM {name}")
+        expected = cursor.fetchone()[0]
+        with gzip.open(partial, "wb") as f:
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            written = cursor.rowcount
+        conn.rollback()
+    if written != expected:
+        os.remove(partial)
+        raise RuntimeError(f"Archived {written} of {expected} rows from {name}; left it detached")
+    with open(partial, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+    if not keep_detached:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {name}")
+        conn.commit()
+    return written
+
+
+def detached_partitions(conn, table):
+    """Monthly tables of `table` left detached by an earlier run, e.g. after a failed archive."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname FROM pg_class c
+            WHERE c.relkind = 'r' AND c.relname LIKE %s AND NOT c.relispartition
+            ORDER BY c.relname
+        """, (f"{table}\\_y%",))
+        return [row[0] for row in cursor.fetchall() if _MONTHLY.search(row[0])]
+
+
+def archive_old_partitions(conn, archive_after=12, archive_dir="archive", keep_detached=False, today=None):
+    """Archives every monthly partition that ended more than `archive_after` months ago. Returns {name: rows}."""
+    cutoff = add_months((today or date.today()).replace(day=1), -archive_after)
+    archived = {}
+    for table in PARTITIONED_TABLES:
+        old = [name for name, month, _ in list_partitions(conn, table) if month is not None and add_months(month, 1) <= cutoff]
+        if not keep_detached:
+            old += [name for name in detached_partitions(conn, table) if name not in old]
+        for name in old:
+            archived[name] = archive_partition(conn, table, name, archive_dir, keep_detached)
+            print(f"Archived {name} ({archived[name]} rows)" if archive_dir else f"Detached {name}")
+    return archived
+
+
+def status(conn):
+    for table in PARTITIONED_TABLES:
+        partitions = list_partitions(conn, table)
+        if not partitions:
+            print(f"{table}: not partitioned (run `python migrations.py upgrade`)")
+            continue
+        print(f"{table}:")
+        for name, month, estimate in partitions:
+            note = "  <- rows outside every monthly partition" if month is None and estimate else ""
+            print(f"  {name:<28} ~{estimate} rows{note}")
+        for name in detached_partitions(conn, table):
+            print(f"  {name:<28} detached")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create and archive monthly partitions.")
+    parser.add_argument("command", choices=["status", "maintain"])
+    parser.add_argument("--dsn", help="libpq connection string (defaults to $DATABASE_URL or .streamlit/secrets.toml)")
+    parser.add_argument("--secrets", help="Path to a secrets.toml containing a [database] table")
+    parser.add_argument("--months-ahead", type=int, default=3, help="Future months to keep partitions for")
+    parser.add_argument("--archive-after", type=int, default=12, help="Archive partitions that ended this many months ago")
+    parser.add_argument("--archive-dir", default="archive", help="Where archived partitions are written")
+    parser.add_argument("--detach-only", action="store_true", help="Detach old partitions without archiving or dropping them")
+    parser.add_argument("--keep-detached", action="store_true", help="Archive old partitions but do not drop them")
+    args = parser.parse_args(argv)
+
+    conn = connect_from_secrets(args.dsn, args.secrets)
+    try:
+        if args.command == "status":
+            status(conn)
+        else:
+            ensure_partitions(conn, args.months_ahead)
+            archive_old_partitions(
+                conn, args.archive_after, None if args.detach_only else args.archive_dir,
+                keep_detached=args.keep_detached or args.detach_only,
+            )
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Password hashing for app.py.
+
+New hashes use scrypt (hashlib, no extra dependency) or, if argon2-cffi is
+installed and `password_scheme = "argon2"` is set in [auth], Argon2id. Hashes
+describe their own parameters:
+
+    scrypt$n=32768,r=8,p=1$<salt>$<key>      (base64 salt and key)
+    $argon2id$v=19$m=65536,t=3,p=1$...        (argon2-cffi's encoding)
+
+The unsalted SHA-256 hex digests written by earlier versions still verify;
+verify_password() asks for those, and for hashes weaker than the current
+settings, to be replaced.
+
+Hashing is deliberately slow, so the app runs it in a HashingPool: a bounded
+pool of worker processes (or threads) that keeps logins from stalling other
+sessions' reruns. This module only imports the standard library (and argon2
+when present) so worker processes start quickly.
+"""
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import argon2
+except ImportError:  # argon2-cffi is optional; scrypt only needs hashlib
+    argon2 = None
+
+DEFAULT_PARAMS = {
+    "scheme": "scrypt",
+    "scrypt_n": 2 ** 15, "scrypt_r": 8, "scrypt_p": 1,
+    "argon2_time_cost": 3, "argon2_memory_cost": 65536, "argon2_parallelism": 1,
+}
+
+_SALT_BYTES = 16
+_KEY_BYTES = 32
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    # OpenSSL needs about 128 * r * (n + p + 2) bytes; its default cap is 32 MiB.
+    maxmem = 128 * r * (n + p + 2) + (1 << 20)
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=_KEY_BYTES)
+
+
+def _argon2_hasher(params):
+    if argon2 is None:
+        raise RuntimeError("password_scheme is argon2 but argon2-cffi is not installed")
+    return argon2.PasswordHasher(
+        time_cost=params["argon2_time_cost"], memory_cost=params["argon2_memory_cost"],
+        parallelism=params["argon2_parallelism"],
+    )
+
+
+def hash_password(password, params=DEFAULT_PARAMS):
+    if params["scheme"] == "argon2":
+        return _argon2_hasher(params).hash(password)
+    n, r, p = params["scrypt_n"], params["scrypt_r"], params["scrypt_p"]
+    salt = os.urandom(_SALT_BYTES)
+    return f"scrypt$n={n},r={r},p={p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def verify_password(stored, password, params=DEFAULT_PARAMS):
+    """Returns (matches, needs_rehash). needs_rehash is only meaningful when the password matches."""
+    if stored.startswith("scrypt$"):
+        _, settings, salt, key = stored.split("$")
+        cost = dict(item.split("=") for item in settings.split(","))
+        n, r, p = int(cost["n"]), int(cost["r"]), int(cost["p"])
+        matches = hmac.compare_digest(_scrypt(password, _unb64(salt), n, r, p), _unb64(key))
+        current = params["scheme"] == "scrypt" and (n, r, p) == (params["scrypt_n"], params["scrypt_r"], params["scrypt_p"])
+        return matches, not current
+    if stored.startswith("$argon2"):
+        if argon2 is None:
+            raise RuntimeError("Found an Argon2 hash but argon2-cffi is not installed")
+        try:
+            argon2.PasswordHasher().verify(stored, password)
+        except argon2.exceptions.VerifyMismatchError:
+            return False, False
+        return True, params["scheme"] != "argon2" or _argon2_hasher(params).check_needs_rehash(stored)
+    # Legacy: unsalted SHA-256 hex digest.
+    legacy = hashlib.sha256(password.encode()).hexdigest()
+    return hmac.compare_digest(stored.encode(), legacy.encode()), True
+
+
+def verify_and_rehash(stored, password, params=DEFAULT_PARAMS):
+    """
+    Returns (matches, new_hash). new_hash replaces `stored` when the password
+    matched but `stored` is legacy or below the current cost, else None. Both
+    happen in one worker call so an upgrade costs no extra round trip.
+    """
+    matches, needs_rehash = verify_password(stored, password, params)
+    return matches, hash_password(password, params) if matches and needs_rehash else None
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool has more pending work than it accepts."""
+
+
+class HashingPool:
+    """
+    Runs hash_password / verify_and_rehash on `workers` worker processes (or
+    threads, with kind="thread"). At most `max_pending` calls may be queued or
+    running; a caller that cannot get a slot within `timeout` seconds gets
+    HashingBusy instead of piling more work onto an overloaded server.
+    """
+
+    def __init__(self, params=DEFAULT_PARAMS, workers=2, kind="process", max_pending=None, timeout=10):
+        self.params = dict(params)
+        self.workers = workers
+        self.kind = kind
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending or workers * 4)
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+        self._stats = {"hashes": 0, "verifications": 0, "rehashes": 0, "busy": 0, "seconds": 0.0}
+        # Unknown emails are checked against this, so they take as long as real accounts.
+        self.dummy_hash = hash_password("dummy password", self.params)
+
+    def _new_executor(self):
+        if self.kind == "thread":
+            return ThreadPoolExecutor(self.workers, thread_name_prefix="password-hash")
+        # spawn: forking a server process with live threads and sockets is unsafe.
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["busy"] += 1
+            raise HashingBusy(f"More than {self.workers} password hashes are already pending")
+        started = time.perf_counter()
+        try:
+            try:
+                return self._executor.submit(fn, *args, self.params).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); replace the pool and retry once.
+                with self._lock:
+                    self._executor = self._new_executor()
+                return self._executor.submit(fn, *args, self.params).result()
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._stats["seconds"] += time.perf_counter() - started
+
+    def hash(self, password):
+        with self._lock:
+            self._stats["hashes"] += 1
+        return self._run(hash_password, password)
+
+    def verify(self, stored, password):
+        """Returns (matches, new_hash); see verify_and_rehash."""
+        matches, new_hash = self._run(verify_and_rehash, stored, password)
+        with self._lock:
+            self._stats["verifications"] += 1
+            self._stats["rehashes"] += new_hash is not None
+        return matches, new_hash
+
+    def stats(self):
+        with self._lock:
+            calls = self._stats["hashes"] + self._stats["verifications"]
+            return {**self._stats, "workers": self.workers, "kind": self.kind, "params": dict(self.params),
+                    "mean_ms": self._stats["seconds"] * 1000 / calls if calls else 0.0}
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
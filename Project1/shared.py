@@ -3,9 +3,16 @@ import pandas as pd
 import plotly.graph_objects as go
 import datetime
 from dateutil.relativedelta import relativedelta
-from database import get_scores_over_time 
+from database import get_scores_over_time, get_symptom_matrix
 import textwrap
 
+# Short labels for PHQ-9 questions 1-9.
+PHQ9_SHORT_NAMES = {
+    1: "Q1: Interest", 2: "Q2: Mood", 3: "Q3: Sleep",
+    4: "Q4: Energy", 5: "Q5: Appetite", 6: "Q6: Self-Esteem",
+    7: "Q7: Concentration", 8: "Q8: Agitation", 9: "Q9: Self-Harm"
+}
+
 def get_severity_and_feedback(total_score, problem_areas=[]):
     """
     Returns a dictionary with detailed feedback, including a relevant video link
@@ -193,28 +200,15 @@ def display_progress_dashboard(user_id):
     st.header("Detailed Assessment Breakdown")
     st.markdown("See your specific answers (0-3) for each question to understand what's driving your score.")
     
-    # Take the last 5 rows for the breakdown, or fewer if not available
+    # Take the last 5 assessments for the breakdown, or fewer if not available
     recent_data = filtered_data.tail(5)
-    
-    if 'Answers' in recent_data.columns and not recent_data['Answers'].isnull().all():
-        # Define short names for PHQ-9 questions
-        q_short_names = {
-            0: "Q1: Interest", 1: "Q2: Mood", 2: "Q3: Sleep",
-            3: "Q4: Energy", 4: "Q5: Appetite", 5: "Q6: Self-Esteem",
-            6: "Q7: Concentration", 7: "Q8: Agitation", 8: "Q9: Self-Harm"
-        }
-        
-        # Expand the 'Answers' list into separate columns
-        answers_df = pd.DataFrame(recent_data['Answers'].tolist(), index=recent_data.index)
-        
-        # Ensure we don't have more columns than we have names for
-        num_cols_to_rename = min(len(q_short_names), answers_df.shape[1])
-        answers_df = answers_df.iloc[:, :num_cols_to_rename] # Select only the valid columns
-        answers_df.columns = [q_short_names[i] for i in range(num_cols_to_rename)]
+    answers_df = get_symptom_matrix(user_id, recent_data['Date'].min(), recent_data['Date'].max() + datetime.timedelta(days=1)).tail(5)
 
-        # Combine with Date and Score for the final display
-        breakdown_df = pd.concat([recent_data[['Date', 'Score']].reset_index(drop=True), answers_df.reset_index(drop=True)], axis=1)
-        
-        st.dataframe(breakdown_df.set_index("Date"), use_container_width=True)
+    if not answers_df.empty:
+        answers_df = answers_df.rename(columns=PHQ9_SHORT_NAMES)
+        answers_df.insert(0, "Score", answers_df.sum(axis=1).astype(int))
+        answers_df.index = pd.Index(pd.to_datetime(answers_df.index).date, name="Date")
+
+        st.dataframe(answers_df, use_container_width=True)
     else:
         st.info("No detailed answer data available for this period.")
\ No newline at end of file
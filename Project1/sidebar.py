@@ -1,5 +1,6 @@
 # sidebar.py (Corrected Version)
 
+import os
 import streamlit as st
 from collections import defaultdict
 from datetime import datetime, date, timedelta
@@ -8,8 +9,10 @@ from database import (
     get_todays_events,
     get_user_conversations,
     delete_conversation,
-    clear_all_assessments
+    bulk_delete_user_data,
+    export_user_data
 )
+from auth import logout
 import requests
 
 # (All helper functions like fetch_gaming_news and _display_assessment_history remain the same)
@@ -55,8 +58,9 @@ def _display_assessment_history(user_id):
             c1, c2 = st.columns(2)
             if c1.button("Yes, Delete All", type="primary", use_container_width=True):
                 with st.spinner("Deleting history..."):
-                    if clear_all_assessments(user_id):
-                        st.toast("Assessment history cleared.")
+                    deleted = bulk_delete_user_data(user_id, ["assessments"])
+                    if deleted is not None:
+                        st.toast(f"Assessment history cleared ({deleted.get('conversations', 0)} assessments).")
                         st.session_state.confirming_clear_assessments = False
                         st.session_state.viewing_assessment = None
                         st.rerun()
@@ -71,8 +75,32 @@ def _display_assessment_history(user_id):
             else:
                 st.caption("No assessment history to clear.")
 
+def _display_data_export(user_id):
+    with st.expander("Download my data"):
+        fmt = st.radio("Format", ["csv", "parquet"], horizontal=True, key="export_format",
+                       format_func=lambda f: f.upper())
+        # The button is only offered in the rerun that built the export. Streamlit copies
+        # the ZIP into its per-session media store, so the temporary file (PHQ-9 answers,
+        # chat transcripts) is deleted at once instead of waiting for a logout that may
+        # never come, and later reruns don't read it again.
+        if st.button("Prepare export", use_container_width=True, key="prepare_export"):
+            with st.spinner("Collecting your data..."):
+                path = export_user_data(user_id, fmt)
+            if not path:
+                st.error("Could not create the export. Please try again.")
+                return
+            try:
+                with open(path, "rb") as f:
+                    st.download_button("Download ZIP", f, file_name=f"my-data-{date.today()}.zip",
+                                       mime="application/zip", use_container_width=True, key="download_export")
+            finally:
+                os.remove(path)
+            st.caption("Download it now: the button goes away with your next click.")
+
 # --- MAIN SIDEBAR: FOR ALL PAGES EXCEPT LOGIN ---
 def display_sidebar(page_name=""):
+    # The diagnostics page is reached by URL only.
+    st.markdown('<style>[data-testid="stSidebarNav"] li:has(a[href$="/Diagnostics"]) {display: none;}</style>', unsafe_allow_html=True)
     with st.sidebar:
         display_name = st.session_state.user_data.get('username')
         st.title(f"Welcome, {display_name}!")
@@ -84,10 +112,10 @@ def display_sidebar(page_name=""):
             st.info(f"You are viewing the {page_name.title()} tool.")
 
         st.markdown('<div style="margin-top: 2rem;"></div>', unsafe_allow_html=True)
+        _display_data_export(st.session_state.user_data['id'])
         st.divider()
         if st.button("Logout", use_container_width=True, key="main_sidebar_logout"):
-            for key in list(st.session_state.keys()): del st.session_state[key]
-            st.switch_page("app.py")
+            logout()
 
 
 # --- HOMEPAGE-ONLY SIDEBAR ---
@@ -124,5 +152,4 @@ def display_homepage_sidebar():
         # --- THIS IS THE FIX ---
         # Ensure this key is different from the other sidebar's logout button.
         if st.button("Logout", use_container_width=True, key="homepage_logout"):
-            for key in list(st.session_state.keys()): del st.session_state[key]
-            st.switch_page("app.py")
\ No newline at end of file
+            logout()
\ No newline at end of file